@@ -0,0 +1,186 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with optional TTL.
+    max_size <= 0 disables storage; ttl_seconds <= 0 means entries never expire.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 0):
+        self.max_size = int(max_size)
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at and expires_at <= now:
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.time() + ttl if ttl > 0 else 0.0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteKVStore:
+    """
+    Small persistent key/value store on local disk (bytes values) with TTL and
+    a row cap. Keeps a `meta` table so callers can tag the store (e.g. with a
+    model name) and wipe it when the tag changes.
+    Reads never write: access times (for LRU eviction) are kept in memory at
+    ACCESS_RESOLUTION_SECONDS granularity and flushed with the next write.
+    """
+
+    ACCESS_RESOLUTION_SECONDS = 60.0
+
+    def __init__(self, path: str, max_rows: int = 0, ttl_seconds: float = 0):
+        self.path = path
+        self.max_rows = int(max_rows)
+        self.ttl_seconds = float(ttl_seconds)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_accessed ON kv(accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv(expires_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        # key -> access time not yet written to disk
+        self._touched: Dict[str, float] = {}
+
+    def _flush_access_times(self) -> None:
+        # Caller holds the lock and commits.
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE kv SET accessed_at = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, accessed_at FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, accessed_at = row
+            if expires_at and expires_at <= now:
+                # Deleted by the next set() (or purge_expired).
+                return None
+            if now - accessed_at >= self.ACCESS_RESOLUTION_SECONDS:
+                self._touched[key] = now
+            return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl_seconds)
+
+    def set_many(self, items: Dict[str, bytes], ttl_seconds: Optional[float] = None) -> None:
+        """
+        Writes several entries in one transaction.
+        """
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = now + ttl if ttl > 0 else 0.0
+        with self._lock:
+            self._flush_access_times()
+            for key in items:
+                self._touched.pop(key, None)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv(key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, sqlite3.Binary(value), expires_at, now) for key, value in items.items()],
+            )
+            self._conn.execute("DELETE FROM kv WHERE expires_at > 0 AND expires_at <= ?", (now,))
+            if self.max_rows > 0:
+                # Evict least-recently-used rows beyond the cap.
+                self._conn.execute(
+                    "DELETE FROM kv WHERE key IN ("
+                    " SELECT key FROM kv ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            self._flush_access_times()
+            cur = self._conn.execute(
+                "DELETE FROM kv WHERE expires_at > 0 AND expires_at <= ?", (time.time(),)
+            )
+            self._conn.commit()
+            return cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM kv")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_access_times()
+            self._conn.commit()
+            self._conn.close()
@@ -6,10 +6,136 @@ class Settings(BaseModel):
     OPENAI_CHAT_MODEL: str = os.getenv("OPENAI_CHAT_MODEL", "gpt-4.1-mini")
     OPENAI_EMBED_MODEL: str = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-large")
 
+    # Embedding backend: "openai" (API) or "hashing" (local CPU, offline)
+    EMBED_BACKEND: str = os.getenv("EMBED_BACKEND", "openai").lower()
+    EMBED_LOCAL_DIM: int = int(os.getenv("EMBED_LOCAL_DIM", "512"))
+
     VECTOR_INDEX_PATH: str = os.getenv("VECTOR_INDEX_PATH", "data/index/faiss.index")
-    VECTOR_META_PATH: str = os.getenv("VECTOR_META_PATH", "data/index/meta.json")
+    # Chunk metadata: SQLite store written by ingestion (a legacy .json file is still readable)
+    VECTOR_META_PATH: str = os.getenv("VECTOR_META_PATH", "data/index/meta.sqlite")
+    VECTOR_MANIFEST_PATH: str = os.getenv("VECTOR_MANIFEST_PATH", "data/index/manifest.json")
+
+    # Search index: "flat" (exact), "ivf", "hnsw" or "ivfpq". Non-flat types are trained at
+    # ingestion from the flat vector store kept at VECTOR_STORE_PATH.
+    VECTOR_INDEX_TYPE: str = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+    VECTOR_STORE_PATH: str = os.getenv("VECTOR_STORE_PATH", "data/index/vectors.faiss")
+    VECTOR_IVF_NLIST: int = int(os.getenv("VECTOR_IVF_NLIST", "0"))  # 0 = ~4*sqrt(n)
+    VECTOR_PQ_M: int = int(os.getenv("VECTOR_PQ_M", "0"))  # 0 = largest divisor of dim <= 64
+    VECTOR_PQ_NBITS: int = int(os.getenv("VECTOR_PQ_NBITS", "8"))
+    VECTOR_HNSW_M: int = int(os.getenv("VECTOR_HNSW_M", "32"))
+    VECTOR_HNSW_EF_CONSTRUCTION: int = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "80"))
+    VECTOR_TRAIN_MAX_SAMPLES: int = int(os.getenv("VECTOR_TRAIN_MAX_SAMPLES", "100000"))
+    VECTOR_NPROBE: int = int(os.getenv("VECTOR_NPROBE", "8"))
+    VECTOR_EF_SEARCH: int = int(os.getenv("VECTOR_EF_SEARCH", "64"))
+
+    # Extra named indexes ("name=directory,..."), each laid out like data/index/;
+    # claims pick one with `policy_index`. Files are re-checked every INDEX_RELOAD_SECONDS (0 = off).
+    POLICY_INDEXES: str = os.getenv("POLICY_INDEXES", "")
+    DEFAULT_POLICY_INDEX: str = os.getenv("DEFAULT_POLICY_INDEX", "default")
+    INDEX_RELOAD_SECONDS: float = float(os.getenv("INDEX_RELOAD_SECONDS", "5"))
+
+    VECTOR_INDEX_MMAP: bool = os.getenv("VECTOR_INDEX_MMAP", "false").lower() in ("1", "true", "yes")
+    META_CACHE_SIZE: int = int(os.getenv("META_CACHE_SIZE", "1024"))
 
     RAG_TOP_K: int = int(os.getenv("RAG_TOP_K", "6"))
+    # "vector", "lexical" (no embedding calls) or "hybrid"
+    RAG_RETRIEVAL_MODE: str = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").lower()
+    RAG_HYBRID_ALPHA: float = float(os.getenv("RAG_HYBRID_ALPHA", "0.6"))
+    RAG_MAX_QUERIES: int = int(os.getenv("RAG_MAX_QUERIES", "8"))
+    # Retrieval profiles (app/rag/profiles.py): ranked chunks per category / meal type, built at
+    # ingest, serve claim lines without query embeddings. RAG_FREE_TEXT_ENRICHMENT additionally
+    # searches each line's free-text query (amount, vendor, description) live and merges the hits.
+    RAG_PROFILES_ENABLED: bool = os.getenv("RAG_PROFILES_ENABLED", "true").lower() in ("1", "true", "yes")
+    RAG_PROFILE_DEPTH: int = int(os.getenv("RAG_PROFILE_DEPTH", "12"))
+    RAG_FREE_TEXT_ENRICHMENT: bool = os.getenv("RAG_FREE_TEXT_ENRICHMENT", "false").lower() in ("1", "true", "yes")
+    # Prompt context: excerpts are packed best-first until the token budget is used
+    # (counted locally with tiktoken when installed); RAG_MAX_EXCERPTS caps the count (0 = no cap).
+    RAG_MAX_EXCERPTS: int = int(os.getenv("RAG_MAX_EXCERPTS", "8"))
+    PROMPT_EXCERPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_EXCERPT_TOKEN_BUDGET", "3000"))
+    # Re-ranking of merged hits (PolicyRetriever.rerank): hits below RAG_SCORE_FLOOR x best
+    # score are dropped, chunks citing rule IDs get a relevance boost, then MMR orders the
+    # rest for diversity and skips near-duplicates.
+    RAG_RERANK: bool = os.getenv("RAG_RERANK", "true").lower() in ("1", "true", "yes")
+    RAG_SCORE_FLOOR: float = float(os.getenv("RAG_SCORE_FLOOR", "0.5"))
+    RAG_RULE_ID_BOOST: float = float(os.getenv("RAG_RULE_ID_BOOST", "0.15"))
+    RAG_MMR_LAMBDA: float = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+    RAG_DUPLICATE_SIMILARITY: float = float(os.getenv("RAG_DUPLICATE_SIMILARITY", "0.92"))
+    RAG_EMBED_BATCH_SIZE: int = int(os.getenv("RAG_EMBED_BATCH_SIZE", "16"))
     MAX_POLICY_CHUNK_CHARS: int = int(os.getenv("MAX_POLICY_CHUNK_CHARS", "2400"))
 
+    # Ingestion embedding: token-bounded batches on a bounded worker pool
+    EMBED_BATCH_MAX_TOKENS: int = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "50000"))
+    EMBED_BATCH_MAX_ITEMS: int = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "256"))
+    EMBED_WORKERS: int = int(os.getenv("EMBED_WORKERS", "4"))
+    EMBED_MAX_RETRIES: int = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+    EMBED_RETRY_BASE_SECONDS: float = float(os.getenv("EMBED_RETRY_BASE_SECONDS", "1.0"))
+    EMBED_RETRY_MAX_SECONDS: float = float(os.getenv("EMBED_RETRY_MAX_SECONDS", "30"))
+    EMBED_INGEST_TIMEOUT_SECONDS: float = float(os.getenv("EMBED_INGEST_TIMEOUT_SECONDS", "120"))
+
+    # Shared OpenAI transport (app/core/transport.py): keep-alive pool, per-attempt
+    # timeouts and per-stage deadlines (incl. retries), hedging (0 = off), concurrency
+    # caps, client-side tokens-per-minute limits (0 = off) and circuit breakers
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "3"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+    LLM_DEADLINE_SECONDS: float = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_HEDGE_AFTER_MS: float = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    LLM_TPM_LIMIT: int = int(os.getenv("LLM_TPM_LIMIT", "0"))
+    EMBED_TIMEOUT_SECONDS: float = float(os.getenv("EMBED_TIMEOUT_SECONDS", "5"))
+    EMBED_DEADLINE_SECONDS: float = float(os.getenv("EMBED_DEADLINE_SECONDS", "15"))
+    EMBED_QUERY_MAX_RETRIES: int = int(os.getenv("EMBED_QUERY_MAX_RETRIES", "2"))
+    EMBED_HEDGE_AFTER_MS: float = float(os.getenv("EMBED_HEDGE_AFTER_MS", "0"))
+    EMBED_MAX_CONCURRENCY: int = int(os.getenv("EMBED_MAX_CONCURRENCY", "32"))
+    EMBED_TPM_LIMIT: int = int(os.getenv("EMBED_TPM_LIMIT", "0"))
+    RETRY_BASE_SECONDS: float = float(os.getenv("RETRY_BASE_SECONDS", "0.2"))
+    RETRY_MAX_SECONDS: float = float(os.getenv("RETRY_MAX_SECONDS", "2"))
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_SECONDS: float = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+    # Answer from the deterministic checks when the provider is unavailable (else 503)
+    LLM_FALLBACK_ENABLED: bool = os.getenv("LLM_FALLBACK_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # Identical concurrent evaluations / query embeddings share one in-flight call
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # Duplicate-submission index for R-GEN-004 (app/rules/duplicates.py). Lookups run when enabled;
+    # evaluated claims are only added with DUPLICATE_RECORD_ENABLED (else load history with
+    # scripts.load_duplicate_index), so test and re-score traffic does not become history.
+    DUPLICATE_CHECK_ENABLED: bool = os.getenv("DUPLICATE_CHECK_ENABLED", "true").lower() in ("1", "true", "yes")
+    DUPLICATE_RECORD_ENABLED: bool = os.getenv("DUPLICATE_RECORD_ENABLED", "false").lower() in ("1", "true", "yes")
+    DUPLICATE_INDEX_PATH: str = os.getenv("DUPLICATE_INDEX_PATH", "data/cache/duplicates.sqlite")
+
+    # Prometheus-format /metrics endpoint and per-request stage timings in debug.timings_ms
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    DEBUG_TIMINGS: bool = os.getenv("DEBUG_TIMINGS", "false").lower() in ("1", "true", "yes")
+
+    # Declarative rules compiled by app/rules/ruleset.py (re-checked for edits every N seconds)
+    RULES_PATH: str = os.getenv("RULES_PATH", "data/policies/rules.json")
+    RULES_RELOAD_SECONDS: float = float(os.getenv("RULES_RELOAD_SECONDS", "2"))
+
+    # Deterministic fast path (skips retrieval + LLM for clean, low-risk claims)
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "false").lower() in ("1", "true", "yes")
+    FAST_PATH_MAX_TOTAL: float = float(os.getenv("FAST_PATH_MAX_TOTAL", "300"))
+    FAST_PATH_MAX_LINES: int = int(os.getenv("FAST_PATH_MAX_LINES", "10"))
+    FAST_PATH_EXCLUDED_CATEGORIES: str = os.getenv("FAST_PATH_EXCLUDED_CATEGORIES", "CLIENT_ENTERTAINMENT")
+
+    # LLM decision cache: "memory", "sqlite" or "none"
+    DECISION_CACHE_BACKEND: str = os.getenv("DECISION_CACHE_BACKEND", "memory")
+    DECISION_CACHE_PATH: str = os.getenv("DECISION_CACHE_PATH", "data/cache/decisions.sqlite")
+    DECISION_CACHE_SIZE: int = int(os.getenv("DECISION_CACHE_SIZE", "10000"))
+    DECISION_CACHE_TTL_SECONDS: float = float(os.getenv("DECISION_CACHE_TTL_SECONDS", "86400"))
+
+    # Batch evaluation (/v1/claims/evaluate:batch)
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+    BATCH_MAX_CLAIMS: int = int(os.getenv("BATCH_MAX_CLAIMS", "10000"))
+
+    # Query embedding cache (in-process LRU + optional on-disk SQLite store)
+    EMBED_CACHE_SIZE: int = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+    EMBED_CACHE_TTL_SECONDS: float = float(os.getenv("EMBED_CACHE_TTL_SECONDS", "604800"))
+    EMBED_CACHE_PATH: str = os.getenv("EMBED_CACHE_PATH", "")
+    EMBED_CACHE_DISK_MAX_ROWS: int = int(os.getenv("EMBED_CACHE_DISK_MAX_ROWS", "100000"))
+
 settings = Settings()
@@ -0,0 +1,211 @@
+# In-process metrics (counters, histograms, scrape-time gauges) rendered in the
+# Prometheus text format, plus timing spans with an optional per-request breakdown.
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.5, 2.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            out.append(f"{self.name}{_labels(self.label_names, labels)} {_num(v)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts incl. +Inf, sum, count)
+        self._series: Dict[LabelValues, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip((*self.buckets, float("inf")), counts):
+                cumulative += c
+                le = 'le="' + _num(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return out
+
+
+class CallbackGauge:
+    """
+    Gauge whose values are read at scrape time, e.g. from cache stats().
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], fn: Callable[[], Dict[LabelValues, float]]):
+        self.name, self.help, self.label_names, self.fn = name, help, tuple(labels), fn
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"[WARN] Metrics callback {self.name} failed: {type(e).__name__}: {e}")
+            return out
+        for labels, v in sorted(values.items()):
+            out.append(f"{self.name}{_labels(self.label_names, labels)} {_num(v)}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def gauge_callback(self, name: str, help: str, labels: Sequence[str], fn) -> CallbackGauge:
+        # Re-registering replaces the callback (e.g. new objects after a restart in tests).
+        self._metrics[name] = CallbackGauge(name, help, labels, fn)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "reimbursement_stage_seconds", "Time spent per pipeline stage.", ["stage"]
+)
+EVALUATIONS = REGISTRY.counter(
+    "reimbursement_evaluations_total", "Completed claim evaluations by path.", ["path"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "reimbursement_llm_tokens_total", "Provider-reported chat tokens (prompt, completion, cached).", ["kind"]
+)
+LLM_CALLS = REGISTRY.counter(
+    "reimbursement_llm_calls_total", "Chat completion calls by outcome.", ["outcome"]
+)
+EMBEDDING_CALLS = REGISTRY.counter(
+    "reimbursement_embedding_calls_total", "Embedding requests by backend.", ["backend"]
+)
+EMBEDDING_INPUTS = REGISTRY.counter(
+    "reimbursement_embedding_inputs_total", "Texts sent for embedding by backend.", ["backend"]
+)
+RETRIEVAL_SCORES = REGISTRY.histogram(
+    "reimbursement_retrieval_score",
+    "Scores of retrieved excerpts (kind=top: best hit per claim, kind=selected: every excerpt kept).",
+    ["kind"],
+    SCORE_BUCKETS,
+)
+RETRIEVAL_QUERIES = REGISTRY.counter(
+    "reimbursement_retrieval_queries_total",
+    "Retrieval lookups by source (profile: precomputed at ingest, live: searched per request).",
+    ["source"],
+)
+TRANSPORT_RETRIES = REGISTRY.counter(
+    "reimbursement_transport_retries_total", "Provider calls retried after a retryable error.", ["stage"]
+)
+TRANSPORT_HEDGES = REGISTRY.counter(
+    "reimbursement_transport_hedges_total", "Hedged provider calls by which request answered first.", ["stage", "winner"]
+)
+TRANSPORT_REJECTED = REGISTRY.counter(
+    "reimbursement_transport_rejected_total", "Provider calls failed fast by an open circuit breaker.", ["stage"]
+)
+COALESCED = REGISTRY.counter(
+    "reimbursement_coalesced_total", "Calls that joined an identical in-flight call instead of running.", ["kind"]
+)
+RATE_LIMIT_WAIT = REGISTRY.counter(
+    "reimbursement_rate_limit_wait_seconds_total", "Time spent waiting on client-side TPM limits.", ["stage"]
+)
+
+# Per-request stage totals in milliseconds (set by start_timings, filled by span).
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("timings", default=None)
+
+
+def start_timings() -> Dict[str, float]:
+    """
+    Starts a per-request breakdown in the current context; worker threads started
+    with asyncio.to_thread and tasks created afterwards inherit it.
+    """
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed * 1000
+
+
+def record_llm_usage(usage: Dict[str, Optional[int]]) -> None:
+    for kind, key in (("prompt", "prompt_tokens"), ("completion", "completion_tokens"), ("cached", "cached_tokens")):
+        if usage.get(key):
+            LLM_TOKENS.inc(usage[key], kind)
+
+
+def render() -> str:
+    return REGISTRY.render()
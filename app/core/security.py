@@ -5,13 +5,17 @@ load_dotenv()
 
 
 
+import hashlib
+import hmac
 import os
 import time
-from typing import Any, Dict, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
 
+from app.core.cache import LRUCache
+
 try:
     import jwt  # PyJWT
 except ImportError as e:
@@ -30,10 +34,42 @@ JWT_ISSUER = os.getenv("JWT_ISSUER", "reimbursement_api")
 JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "reimbursement_clients")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-# Comma-separated API keys in env (recommended for dev).
+# Verified bearer tokens are cached (keyed by token digest) until their `exp`.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+
+def hash_api_key(api_key: str) -> str:
+    """
+    Stored form of an API key: "sha256:<hex digest>" (see scripts/hash_api_key.py).
+    """
+    return "sha256:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def key_id(digest: str) -> str:
+    # Token subject for a key: identifies it without revealing it (JWTs are only signed).
+    return "key_" + digest.split(":", 1)[-1][:16]
+
+
+def _digests(plain_env: str, hashed_env: str) -> List[str]:
+    # Hashed keys ("sha256:<hex>" or bare hex) plus plaintext keys hashed at startup,
+    # so plaintext keys are never kept in memory.
+    out = []
+    for h in os.getenv(hashed_env, "").split(","):
+        h = h.strip().lower()
+        if h:
+            out.append(h if h.startswith("sha256:") else "sha256:" + h)
+    for k in os.getenv(plain_env, "").split(","):
+        if k.strip():
+            out.append(hash_api_key(k.strip()))
+    return list(dict.fromkeys(out))
+
+
+# API key store: API_KEY_HASHES (recommended) and/or plaintext VALID_API_KEYS (dev).
 # In production, prefer a DB/secret manager.
-VALID_API_KEYS_RAW = os.getenv("VALID_API_KEYS", "")
-VALID_API_KEYS: Set[str] = {k.strip() for k in VALID_API_KEYS_RAW.split(",") if k.strip()}
+API_KEY_DIGESTS: List[str] = _digests("VALID_API_KEYS", "API_KEY_HASHES")
+
+# Keys whose tokens may call /v1/admin/* (empty = admin endpoints disabled).
+ADMIN_KEY_IDS: Set[str] = {key_id(d) for d in _digests("ADMIN_API_KEYS", "ADMIN_API_KEY_HASHES")}
 
 
 def _require_jwt_secret():
@@ -50,25 +86,32 @@ api_key_header = APIKeyHeader(name=API_KEY_HEADER_NAME, auto_error=False)
 
 def validate_api_key(api_key: Optional[str]) -> str:
     """
-    Validates incoming API key against allow-list.
-    Returns the api_key if valid; raises HTTP 401 otherwise.
+    Validates incoming API key against the hashed key store.
+    Returns the key id (token subject) if valid; raises HTTP 401 otherwise.
+    The digest is compared against every stored digest in constant time, so
+    timing reveals neither whether nor which key matched.
     """
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Missing API key header '{API_KEY_HEADER_NAME}'.",
         )
-    if api_key not in VALID_API_KEYS:
+    candidate = hash_api_key(api_key).encode("ascii")
+    matched = None
+    for digest in API_KEY_DIGESTS:
+        if hmac.compare_digest(candidate, digest.encode("ascii")):
+            matched = digest
+    if matched is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key.",
         )
-    return api_key
+    return key_id(matched)
 
 
 def api_key_auth(api_key: Optional[str] = Depends(api_key_header)) -> str:
     """
-    FastAPI dependency: validates API key and returns it.
+    FastAPI dependency: validates API key and returns its key id.
     Use this only on the token endpoint.
     """
     return validate_api_key(api_key)
@@ -83,7 +126,7 @@ def create_access_token(
 ) -> str:
     """
     Creates a signed JWT access token.
-    subject: typically a client id or identifier (we use the API key hash/label in this simple version).
+    subject: typically a client id or identifier (we use the API key id in this simple version).
     """
     _require_jwt_secret()
 
@@ -111,12 +154,93 @@ def create_access_token(
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# ---------- Verified-token cache & revocation ----------
+
+_verified_tokens = LRUCache(max_size=TOKEN_CACHE_SIZE)
+# token digest -> exp, and subject -> "tokens issued at or before this time are revoked"
+_revoked_tokens: Dict[str, float] = {}
+_revoked_subjects: Dict[str, float] = {}
+
+# Extra revocation checks (e.g. a shared deny-list), called as hook(token_digest, payload)
+# on every request, cached or not; return True to reject the token.
+revocation_hooks: List[Callable[[str, Dict[str, Any]], bool]] = []
+
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def revoke_token(token: str) -> None:
+    """
+    Rejects one token until it would have expired anyway.
+    """
+    digest = _token_digest(token)
+    try:
+        exp = float(jwt.decode(token, options={"verify_signature": False}).get("exp", 0))
+    except jwt.InvalidTokenError:
+        exp = time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    now = time.time()
+    for d in [d for d, e in _revoked_tokens.items() if e <= now]:
+        del _revoked_tokens[d]
+    _revoked_tokens[digest] = exp
+
+
+def revoke_subject(subject: str, issued_before: Optional[float] = None) -> None:
+    """
+    Rejects every token of `subject` (a key id) issued at or before `issued_before`
+    (default: now), e.g. after rotating that API key.
+    """
+    _revoked_subjects[subject] = time.time() if issued_before is None else issued_before
+
+
+def clear_token_cache() -> None:
+    _verified_tokens.clear()
+
+
+def token_cache_stats() -> Dict[str, int]:
+    return _verified_tokens.stats()
+
+
+def _is_revoked(digest: str, payload: Dict[str, Any]) -> bool:
+    if _revoked_tokens.get(digest, 0) > time.time():
+        return True
+    cutoff = _revoked_subjects.get(payload.get("sub"))
+    if cutoff is not None and payload.get("iat", 0) <= cutoff:
+        return True
+    return any(hook(digest, payload) for hook in revocation_hooks)
+
+
+def _revoked() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token revoked.",
+    )
+
 
 def decode_and_verify_token(token: str) -> Dict[str, Any]:
     """
     Decodes JWT and validates signature + standard claims.
+    Verified payloads are cached by token digest until the token's `exp`, so a token
+    reused across many requests is verified once. Revocation is checked every time.
     Raises HTTP 401 on failure.
     """
+    digest = _token_digest(token)
+    payload = _verified_tokens.get(digest)
+    if payload is not None:
+        if _is_revoked(digest, payload):
+            raise _revoked()
+        return dict(payload)
+
+    payload = _verify_token(token)
+    if _is_revoked(digest, payload):
+        raise _revoked()
+    ttl = float(payload["exp"]) - time.time()
+    if ttl > 0:
+        _verified_tokens.set(digest, dict(payload), ttl_seconds=ttl)
+    return payload
+
+
+def _verify_token(token: str) -> Dict[str, Any]:
     _require_jwt_secret()
     try:
         payload = jwt.decode(
@@ -159,3 +283,15 @@ def jwt_auth(
             detail="Missing bearer token.",
         )
     return decode_and_verify_token(creds.credentials)
+
+
+def admin_auth(payload: Dict[str, Any] = Depends(jwt_auth)) -> Dict[str, Any]:
+    """
+    FastAPI dependency for admin endpoints: a valid JWT issued to one of the admin keys.
+    """
+    if payload.get("sub") not in ADMIN_KEY_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required.",
+        )
+    return payload
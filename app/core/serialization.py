@@ -0,0 +1,10 @@
+import json
+from typing import Any
+
+
+def canonical_json(obj: Any) -> str:
+    """
+    Stable JSON encoding (sorted keys, no whitespace) used for content hashing and
+    byte-identical prompt text.
+    """
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
@@ -0,0 +1,100 @@
+# In-process single-flight: concurrent calls for the same key share one in-flight
+# computation instead of each doing the work. Nothing is kept once it completes
+# (that is what the caches are for).
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Set, Tuple, TypeVar
+
+from app.core import metrics
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    The first caller for a key starts the work as its own task; callers arriving
+    while it runs await the same result. The task is shielded, so a caller that
+    goes away (client disconnect) does not cancel it for the others.
+    """
+
+    def __init__(self, name: str, enabled: bool = None):
+        self.name = name
+        self.enabled = settings.SINGLE_FLIGHT_ENABLED if enabled is None else enabled
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # The loop only keeps weak references to tasks; this keeps each flight alive until done.
+        self._tasks: Set[asyncio.Task] = set()
+        self.started = 0
+        self.coalesced = 0
+
+    def _start(self, keys: List[Hashable], fn: Callable[[List[Hashable]], Awaitable[List[T]]]) -> None:
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in keys]
+        for key, fut in zip(keys, futures):
+            self._inflight[key] = fut
+        self.started += len(keys)
+
+        def done(task: asyncio.Task) -> None:
+            self._tasks.discard(task)
+            for key, fut in zip(keys, futures):
+                if self._inflight.get(key) is fut:
+                    del self._inflight[key]
+            if task.cancelled():
+                for fut in futures:
+                    fut.cancel()
+                return
+            error = task.exception()
+            if error is None and len(task.result()) != len(keys):
+                error = RuntimeError(f"{self.name}: expected {len(keys)} results, got {len(task.result())}")
+            for i, fut in enumerate(futures):
+                if error is not None:
+                    fut.set_exception(error)
+                    fut.exception()  # mark retrieved; waiters still see it
+                else:
+                    fut.set_result(task.result()[i])
+
+        task = asyncio.ensure_future(fn(keys))
+        self._tasks.add(task)
+        task.add_done_callback(done)
+
+    def _join(self, n: int) -> None:
+        self.coalesced += n
+        metrics.COALESCED.inc(n, self.name)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Returns (result, shared); shared is True when this call joined one already in flight.
+        """
+        if not self.enabled:
+            return await fn(), False
+        fut = self._inflight.get(key)
+        shared = fut is not None
+        if shared:
+            self._join(1)
+        else:
+            async def one(_keys: List[Hashable]) -> List[T]:
+                return [await fn()]
+
+            self._start([key], one)
+            fut = self._inflight[key]
+        return await asyncio.shield(fut), shared
+
+    async def do_many(self, keys: List[Hashable], fn: Callable[[List[Hashable]], Awaitable[List[T]]]) -> List[T]:
+        """
+        Results for `keys` (in order). Keys already in flight are awaited; the rest
+        are computed by a single `fn(new_keys)` call, which returns one result per key.
+        """
+        if not self.enabled:
+            return await fn(list(keys))
+        unique = list(dict.fromkeys(keys))
+        new = [k for k in unique if k not in self._inflight]
+        if len(new) < len(unique):
+            self._join(len(unique) - len(new))
+        if new:
+            self._start(new, fn)
+        futures = {k: self._inflight[k] for k in unique}
+        results = await asyncio.gather(*[asyncio.shield(f) for f in futures.values()])
+        by_key = dict(zip(futures, results))
+        return [by_key[k] for k in keys]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
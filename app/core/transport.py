@@ -0,0 +1,500 @@
+# Shared OpenAI transport: one pooled HTTP client per process for chat and
+# embeddings (request path and ingestion), with per-stage deadlines, retries with
+# jittered backoff, optional hedged requests, a circuit breaker per stage and
+# client-side tokens-per-minute limits.
+import asyncio
+import contextlib
+import random
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from app.core import metrics
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Errors worth retrying: throttling, timeouts, dropped connections, 5xx.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    TimeoutError,
+)
+
+
+def _reported_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised without calling the provider while a stage's circuit breaker is open.
+    """
+
+    def __init__(self, stage: str, retry_in: float):
+        super().__init__(f"{stage} circuit breaker is open (next probe in {retry_in:.1f}s)")
+        self.stage = stage
+        self.retry_in = retry_in
+
+
+# What callers treat as "provider unavailable" (fallback instead of a 500).
+UNAVAILABLE_ERRORS = RETRYABLE_ERRORS + (CircuitOpenError,)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `failure_threshold` retryable failures in a
+    row the stage fails fast for `reset_seconds`; then one probe call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    threshold <= 0 disables it.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = int(failure_threshold)
+        self.reset_seconds = float(reset_seconds)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now - self._opened_at < self.reset_seconds:
+                return False
+            # Half-open: one probe at a time; a probe that never reports back
+            # (e.g. cancelled) is replaced after reset_seconds.
+            if self.state == self.HALF_OPEN and now - self._probe_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_at = now
+            return True
+
+    def retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"[WARN] {self.name} circuit breaker opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class TokenRateLimiter:
+    """
+    Token bucket refilled at `tokens_per_minute`. Callers reserve their estimated
+    tokens up front (waiting if the bucket is in debt) and settle the difference
+    once the provider reports actual usage. tokens_per_minute <= 0 disables it.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Takes `tokens` from the bucket and returns how long to wait before sending.
+        """
+        if self.capacity <= 0 or tokens <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= min(float(tokens), self.capacity)
+            return max(0.0, -self._tokens) / self.rate
+
+    def try_acquire(self, tokens: int) -> bool:
+        if self.capacity <= 0 or tokens <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def adjust(self, delta: int) -> None:
+        if self.capacity <= 0 or not delta:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+
+class Stage:
+    """
+    Resilience policy for one kind of provider call ("llm", "embedding").
+    `fn(timeout)` performs a single attempt; it receives the seconds left for that
+    attempt and should pass them to the SDK as `timeout=`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        deadline: float,
+        max_retries: int,
+        hedge_after_ms: float,
+        max_concurrency: int,
+        tokens_per_minute: int,
+    ):
+        self.name = name
+        self.timeout = float(timeout)
+        self.deadline = float(deadline)
+        self.max_retries = int(max_retries)
+        self.hedge_after = float(hedge_after_ms) / 1000.0
+        self.max_concurrency = int(max_concurrency)
+        self.breaker = CircuitBreaker(name, settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RESET_SECONDS)
+        self.limiter = TokenRateLimiter(tokens_per_minute)
+        # asyncio semaphores are bound to one event loop.
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        if self.max_concurrency <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return sem
+
+    def _check_breaker(self) -> None:
+        if not self.breaker.allow():
+            metrics.TRANSPORT_REJECTED.inc(1, self.name)
+            raise CircuitOpenError(self.name, self.breaker.retry_in())
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(settings.RETRY_MAX_SECONDS, settings.RETRY_BASE_SECONDS * (2 ** attempt)))
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after", 0)))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    def settle(self, reserved: int, actual: Optional[int]) -> None:
+        """
+        Corrects the rate limiter once the provider has reported actual token usage.
+        """
+        if actual:
+            self.limiter.adjust(int(actual) - int(reserved))
+
+    def _refund(self, tokens: int) -> None:
+        self.limiter.adjust(-int(tokens))
+
+    async def _throttle(self, tokens: int) -> None:
+        wait = self.limiter.reserve(tokens)
+        if wait > 0:
+            metrics.RATE_LIMIT_WAIT.inc(wait, self.name)
+            await asyncio.sleep(wait)
+
+    async def _attempt(self, fn: Callable[[float], Awaitable[T]], timeout: float, hedge: bool, tokens: int) -> T:
+        """
+        One attempt, hedged if the primary is slow. The primary's `tokens` are already
+        reserved; a hedge reserves its own. The returned response is settled by the
+        caller; every other request of the attempt is settled here: to its reported
+        usage if it finished, otherwise refunded.
+        """
+        if not hedge or self.hedge_after <= 0 or self.hedge_after >= timeout:
+            try:
+                return await asyncio.wait_for(fn(timeout), timeout)
+            except BaseException:
+                self._refund(tokens)
+                raise
+
+        loop = asyncio.get_running_loop()
+        ends_at = loop.time() + timeout
+        primary = asyncio.ensure_future(fn(timeout))
+        tasks = [primary]
+        winner = None
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done and self.limiter.try_acquire(tokens):
+                # Slow primary: race a second identical request and keep the first answer.
+                tasks.append(asyncio.ensure_future(fn(ends_at - loop.time())))
+                pending = set(tasks)
+            while True:
+                if not done:
+                    done, pending = await asyncio.wait(
+                        pending, timeout=max(0.0, ends_at - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        raise TimeoutError(f"{self.name} attempt timed out after {timeout:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            metrics.TRANSPORT_HEDGES.inc(1, self.name, "primary" if task is primary else "hedge")
+                        winner = task
+                        return task.result()
+                if not pending:
+                    raise done.pop().exception()
+                done = set()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                if task is winner:
+                    continue
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    self.settle(tokens, _reported_tokens(task.result()))
+                else:
+                    self._refund(tokens)
+
+    async def _run(
+        self,
+        fn: Callable[[float], Awaitable[T]],
+        tokens: int,
+        hedge: bool,
+        max_retries: Optional[int],
+        keep_slot: bool,
+    ) -> T:
+        self._check_breaker()
+        retries = self.max_retries if max_retries is None else max_retries
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        sem = self._semaphore()
+        attempt = 0
+        while True:
+            # Each attempt reserves its own tokens and holds a concurrency slot only
+            # while it is in flight, not during the backoff that follows it.
+            await self._throttle(tokens)
+            if sem is not None:
+                try:
+                    await sem.acquire()
+                except BaseException:
+                    self._refund(tokens)
+                    raise
+            release = True
+            try:
+                remaining = deadline - loop.time()
+                try:
+                    if remaining <= 0:
+                        self._refund(tokens)
+                        raise TimeoutError(f"{self.name} deadline of {self.deadline:.1f}s exceeded")
+                    result = await self._attempt(fn, min(self.timeout, remaining), hedge, tokens)
+                except RETRYABLE_ERRORS as e:
+                    self.breaker.record_failure()
+                    delay = self._retry_delay(attempt, e)
+                    if attempt >= retries or self.breaker.state == CircuitBreaker.OPEN or loop.time() + delay >= deadline:
+                        raise
+                except Exception:
+                    # The provider answered (e.g. 400): it is up, whatever the request's problem.
+                    self.breaker.record_success()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    release = not keep_slot
+                    return result
+            finally:
+                if sem is not None and release:
+                    sem.release()
+            metrics.TRANSPORT_RETRIES.inc(1, self.name)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def call(
+        self,
+        fn: Callable[[float], Awaitable[T]],
+        tokens: int = 0,
+        hedge: bool = True,
+        max_retries: Optional[int] = None,
+    ) -> T:
+        """
+        Runs `fn` under this stage's deadline, concurrency cap, rate limit, retries,
+        hedging and circuit breaker. Raises CircuitOpenError without calling the
+        provider while the breaker is open. Every attempt (and hedge) is charged
+        `tokens`; settle() the returned response with its reported usage.
+        """
+        return await self._run(fn, tokens, hedge, max_retries, keep_slot=False)
+
+    @contextlib.asynccontextmanager
+    async def open_stream(
+        self,
+        fn: Callable[[float], Awaitable[T]],
+        tokens: int = 0,
+        max_retries: Optional[int] = None,
+    ) -> AsyncIterator[T]:
+        """
+        call() for streaming responses (never hedged): yields the opened stream and
+        keeps its concurrency slot until the block exits, i.e. until the stream is
+        consumed or abandoned; an abandoned stream is closed.
+        """
+        stream = await self._run(fn, tokens, False, max_retries, keep_slot=True)
+        try:
+            yield stream
+        finally:
+            try:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+            finally:
+                sem = self._semaphore()
+                if sem is not None:
+                    sem.release()
+
+    def call_sync(
+        self,
+        fn: Callable[[float], T],
+        tokens: int = 0,
+        max_retries: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> T:
+        """
+        Blocking variant of call() for worker threads (ingestion, sync search).
+        No hedging and no concurrency cap: callers bound their own thread pools.
+        """
+        self._check_breaker()
+        retries = self.max_retries if max_retries is None else max_retries
+        timeout = self.timeout if timeout is None else float(timeout)
+        wait = self.limiter.reserve(tokens)
+        if wait > 0:
+            metrics.RATE_LIMIT_WAIT.inc(wait, self.name)
+            time.sleep(wait)
+
+        attempt = 0
+        while True:
+            try:
+                result = fn(timeout)
+            except RETRYABLE_ERRORS as e:
+                self.breaker.record_failure()
+                if attempt >= retries or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                metrics.TRANSPORT_RETRIES.inc(1, self.name)
+                time.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+                continue
+            except Exception:
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+
+LLM = Stage(
+    "llm",
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+    deadline=settings.LLM_DEADLINE_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    hedge_after_ms=settings.LLM_HEDGE_AFTER_MS,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    tokens_per_minute=settings.LLM_TPM_LIMIT,
+)
+EMBEDDINGS = Stage(
+    "embedding",
+    timeout=settings.EMBED_TIMEOUT_SECONDS,
+    deadline=settings.EMBED_DEADLINE_SECONDS,
+    max_retries=settings.EMBED_QUERY_MAX_RETRIES,
+    hedge_after_ms=settings.EMBED_HEDGE_AFTER_MS,
+    max_concurrency=settings.EMBED_MAX_CONCURRENCY,
+    tokens_per_minute=settings.EMBED_TPM_LIMIT,
+)
+STAGES = (LLM, EMBEDDINGS)
+
+_BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+metrics.REGISTRY.gauge_callback(
+    "reimbursement_circuit_state",
+    "Circuit breaker state per provider stage (0 closed, 1 half-open, 2 open).",
+    ["stage"],
+    lambda: {(s.name,): _BREAKER_STATES[s.breaker.state] for s in STAGES},
+)
+
+_clients_lock = threading.Lock()
+_async_client: Optional[AsyncOpenAI] = None
+_sync_client: Optional[OpenAI] = None
+
+
+def _http_options() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        # Per-attempt deadlines are passed on each call; this is the fallback.
+        "timeout": httpx.Timeout(settings.LLM_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+    }
+
+
+def async_client() -> AsyncOpenAI:
+    """
+    Process-wide AsyncOpenAI client on a tuned keep-alive pool. SDK retries are
+    off: Stage.call owns retries so they respect stage deadlines.
+    """
+    global _async_client
+    with _clients_lock:
+        if _async_client is None:
+            opts = _http_options()
+            _async_client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                max_retries=0,
+                timeout=opts["timeout"],
+                http_client=openai.DefaultAsyncHttpxClient(**opts),
+            )
+        return _async_client
+
+
+def sync_client() -> OpenAI:
+    """
+    Process-wide blocking client (ingestion workers, sync search), same pool settings.
+    """
+    global _sync_client
+    with _clients_lock:
+        if _sync_client is None:
+            opts = _http_options()
+            _sync_client = OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                max_retries=0,
+                timeout=opts["timeout"],
+                http_client=openai.DefaultHttpxClient(**opts),
+            )
+        return _sync_client
+
+
+async def aclose() -> None:
+    """
+    Closes pooled connections; the next async_client()/sync_client() call reopens them.
+    """
+    global _async_client, _sync_client
+    with _clients_lock:
+        a, s = _async_client, _sync_client
+        _async_client = _sync_client = None
+    if a is not None:
+        await a.close()
+    if s is not None:
+        s.close()
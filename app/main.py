@@ -1,45 +1,109 @@
 # app/main.py
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
-from typing import List
+from typing import Any, AsyncIterator, List, Optional
+import asyncio
 import json
-from openai import OpenAI
+from openai import AsyncOpenAI
 
+from app.core import metrics, transport
 from app.core.config import settings
-from app.core.security import api_key_auth, create_access_token, jwt_auth
+from app.core.security import admin_auth, api_key_auth, create_access_token, jwt_auth, token_cache_stats
 from app.schemas.claim import Claim
 from app.schemas.response import EvaluateResponse
-from app.rules.rule_engine import evaluate_claim
-from app.rag.retriever import PolicyRetriever
-from app.rag.prompts import SYSTEM_POLICY_ANALYST, build_user_prompt
+from app.rag.registry import IndexRegistry
+from app.rag.tokens import load_tokenizer
+from app.rules.ruleset import get_ruleset
+from app.services.evaluation import evaluate_coalesced, resolve_retriever
+from app.services.batch import BatchItem, evaluate_batch
+from app.services.streaming import evaluate_events, sse_event
+from app.services.decision_cache import DecisionCache, build_decision_cache
 
 load_dotenv()
 
 app = FastAPI(title="Reimbursement Approval Assistant (RAG)", version="1.0.0")
 
-retriever: PolicyRetriever | None = None
-client: OpenAI | None = None
+registry: IndexRegistry | None = None
+client: AsyncOpenAI | None = None
+decision_cache: DecisionCache | None = None
 
 
 @app.on_event("startup")
-def startup():
+async def startup():
     """
-    Initializes OpenAI client and RAG retriever at startup.
+    Initializes the shared OpenAI transport and the policy index registry at startup.
     """
-    global retriever, client
+    global registry, client, decision_cache
 
     if not settings.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set. Set it in environment or .env")
 
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    # One pooled client for chat and embeddings (see app/core/transport.py).
+    client = transport.async_client()
 
-    try:
-        retriever = PolicyRetriever()
-    except Exception as e:
-        # Allow server to start, but evaluation will fail with clear message.
-        retriever = None
-        print(f"[WARN] Retriever not ready (did you run ingestion?): {e}")
+    # Compile the declarative rules up front so a broken rules file fails startup.
+    rules = get_ruleset()
+    print(f"[OK] Loaded {len(rules.line_rules)} rules from {rules.source} (version {rules.version})")
+
+    # Prompt token counting; loading may fetch the BPE file, so it happens here, not in a request.
+    print(f"[OK] Prompt tokenizer: {await asyncio.to_thread(load_tokenizer)}")
+
+    # Indexes that fail to load leave the server up; their claims fail with a clear message.
+    registry = IndexRegistry()
+    registry.load_all()
+
+    decision_cache = build_decision_cache()
+    if decision_cache is not None:
+        # Drops cached decisions if a policy index was re-ingested since last run
+        # or is hot-reloaded while serving.
+        decision_cache.bind_index(registry.fingerprint())
+        registry.on_swap.append(lambda reg: decision_cache.bind_index(reg.fingerprint()))
+
+    # Picks up re-ingested indexes in the background and swaps them in.
+    registry.start_watching()
+
+    register_metrics()
+
+
+def _cache_gauge(stats: dict, name: str) -> dict:
+    return {(name, k): v for k, v in stats.items()}
+
+
+def register_metrics():
+    """
+    Scrape-time gauges over state that already keeps its own counters.
+    """
+    def cache_stats():
+        out = _cache_gauge(token_cache_stats(), "token")
+        if registry is not None:
+            out.update(_cache_gauge(registry.embed_cache.stats(), "embedding"))
+        if decision_cache is not None:
+            out.update(_cache_gauge(decision_cache.stats(), "decision"))
+        return out
+
+    def index_chunks():
+        if registry is None:
+            return {}
+        return {(name, v["version"] or ""): v["chunks"] for name, v in registry.versions().items()}
+
+    metrics.REGISTRY.gauge_callback(
+        "reimbursement_cache", "Cache statistics (size, hits, misses, ...).", ["cache", "stat"], cache_stats
+    )
+    metrics.REGISTRY.gauge_callback(
+        "reimbursement_index_chunks", "Chunks in each loaded policy index.", ["index", "version"], index_chunks
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Closes pooled HTTP connections held by the shared OpenAI transport.
+    """
+    if registry is not None:
+        await registry.aclose()
+    await transport.aclose()
 
 
 @app.get("/health")
@@ -47,8 +111,19 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    Prometheus text format: stage latency histograms, LLM token and embedding call
+    counters, retrieval score histograms and cache/index gauges.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/v1/auth/token")
-def issue_token(api_key: str = Depends(api_key_auth)):
+def issue_token(key_id: str = Depends(api_key_auth)):
     """
     Exchange API Key (X-API-Key) for a short-lived JWT access token.
 
@@ -58,9 +133,8 @@ def issue_token(api_key: str = Depends(api_key_auth)):
     Response:
       { "access_token": "...", "token_type": "bearer", "expires_in": 1800 }
     """
-    # For a simple setup, we use the API key itself as the subject.
-    # In production, prefer a client_id and avoid putting raw keys into 'sub'.
-    token = create_access_token(subject=api_key)
+    # The subject is the key id (a prefix of the key's digest), never the raw key.
+    token = create_access_token(subject=key_id)
     return {
         "access_token": token,
         "token_type": "bearer",
@@ -69,7 +143,7 @@ def issue_token(api_key: str = Depends(api_key_auth)):
 
 
 @app.post("/v1/claims/evaluate", response_model=EvaluateResponse)
-def evaluate_endpoint(
+async def evaluate_endpoint(
     claim: Claim,
     _auth=Depends(jwt_auth),  # <-- Protect endpoint with JWT
 ):
@@ -80,106 +154,153 @@ def evaluate_endpoint(
     3) OpenAI LLM reasoning to produce manager-friendly summary + citations
        (Uses chat.completions for compatibility, since `client.responses` is not available
         in the user's OpenAI SDK build.)
+    Runs fully async on AsyncOpenAI so a worker can hold many evaluations in flight.
+    `policy_index` selects a named index; debug.index_version records the version used.
+    Identical claims submitted while one is in flight share its evaluation.
     """
-    if retriever is None:
-        raise HTTPException(
-            status_code=500,
-            detail="Policy index not found or retriever not initialized. Run: python -m scripts.ingest_policies",
-        )
+    if registry is None:
+        raise HTTPException(status_code=500, detail="Policy index registry not initialized")
     if client is None:
         raise HTTPException(status_code=500, detail="OpenAI client not initialized")
 
-    claim_dict = claim.model_dump()
+    # Resolved once: a hot swap during this request does not affect it.
+    retriever = resolve_retriever(registry, claim.policy_index)
+    with registry.hold(retriever):
+        return await evaluate_coalesced(claim.model_dump(), retriever, client, decision_cache=decision_cache)
 
-    # 1) Deterministic checks
-    deterministic = evaluate_claim(claim_dict)
 
-    # 2) Build RAG queries
-    queries: List[str] = [
-        "General reimbursement eligibility, receipts, documentation, approvals"
-    ]
-    for ln in claim_dict["lines"]:
-        queries.append(
-            f"Rules for category={ln['category']}, amount={ln['amount']} {ln['currency']}, "
-            f"vendor={ln['vendor']}, desc={ln['description']}"
-        )
+@app.post("/v1/claims/evaluate:stream")
+async def evaluate_stream_endpoint(
+    claim: Claim,
+    _auth=Depends(jwt_auth),
+):
+    """
+    Streaming variant of /v1/claims/evaluate (text/event-stream). Events, in order:
+      event: deterministic  -> rule engine result (sent before retrieval starts)
+      event: retrieval      -> policy index/version and the excerpts used
+      event: delta          -> {"text": ...} raw LLM output as it is generated
+      event: line           -> one per-line result as soon as it is complete
+      event: result         -> the validated EvaluateResponse
+      event: error          -> {"status_code", "detail"}; ends the stream
+    Fast-path claims and decision-cache hits go straight from `deterministic` to `result`.
+    """
+    if registry is None:
+        raise HTTPException(status_code=500, detail="Policy index registry not initialized")
+    if client is None:
+        raise HTTPException(status_code=500, detail="OpenAI client not initialized")
+
+    retriever = resolve_retriever(registry, claim.policy_index)
+
+    async def body() -> AsyncIterator[bytes]:
+        with registry.hold(retriever):
+            async for event, data in evaluate_events(claim.model_dump(), retriever, client, decision_cache):
+                yield sse_event(event, data)
 
-    # 3) Retrieve top policy excerpts and de-duplicate
-    merged = []
-    seen = set()
-    for q in queries[:8]:
-        for hit in retriever.search(q, top_k=settings.RAG_TOP_K):
-            key = (hit["source_path"], hit["section_title"], hit["text"][:120])
-            if key not in seen:
-                seen.add(key)
-                merged.append(hit)
-
-    # Limit context size
-    policy_excerpts = merged[:10]
-
-    # 4) Build prompt
-    user_prompt = build_user_prompt(claim_dict, deterministic, policy_excerpts)
-
-    # 5) OpenAI call (Chat Completions) - compatible with your SDK build
-    completion = client.chat.completions.create(
-        model=settings.OPENAI_CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": SYSTEM_POLICY_ANALYST},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0,
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    out_text = completion.choices[0].message.content
-    if not out_text:
-        raise HTTPException(status_code=500, detail="OpenAI returned empty content")
 
-    # 6) Parse and validate JSON
+def _parse_batch_body(body: bytes, ndjson: bool) -> List[Any]:
+    """
+    Parses a batch body into raw claim objects.
+    NDJSON lines that are not valid JSON become error strings, reported per claim.
+    """
+    if ndjson:
+        items: List[Any] = []
+        for n, raw in enumerate(ln for ln in body.splitlines() if ln.strip()):
+            try:
+                items.append(json.loads(raw))
+            except ValueError as e:
+                items.append(f"Invalid JSON on line {n + 1}: {e}")
+        return items
+
     try:
-        parsed = json.loads(out_text)
-    except Exception as e:
+        parsed = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Request body is not valid JSON: {e}")
+    if isinstance(parsed, dict):
+        parsed = parsed.get("claims")
+    if not isinstance(parsed, list):
         raise HTTPException(
-            status_code=500,
-            detail=f"LLM did not return valid JSON. Error: {e}. Raw output: {out_text[:1000]}",
+            status_code=422,
+            detail="Expected a JSON array of claims, an object with a 'claims' array, or an NDJSON body.",
         )
+    return parsed
 
-    # 7) Enrich citations using retrieved excerpts (best-effort)
-    rule_to_meta = {}
-    for ex in policy_excerpts:
-        for rid in ex.get("rule_ids") or []:
-            rule_to_meta.setdefault(
-                rid,
-                {
-                    "section_title": ex.get("section_title"),
-                    "source_path": ex.get("source_path"),
-                },
-            )
-
-    for c in parsed.get("citations", []) or []:
-        rid = c.get("rule_id")
-        meta = rule_to_meta.get(rid)
-        if meta:
-            c.setdefault("section_title", meta.get("section_title"))
-            c.setdefault("source_path", meta.get("source_path"))
-
-    # 8) Compose ERP-safe response via Pydantic model
-    try:
-        api_response = EvaluateResponse(
-            decision=parsed["decision"],
-            summary=parsed["summary"],
-            approval_route=deterministic["approval_route"],
-            claim_total=deterministic["claim_total"],
-            lines=parsed["lines"],
-            missing_info=parsed.get("missing_info", []),
-            citations=parsed.get("citations", []),
-            debug={
-                "deterministic": deterministic,
-                "rag_excerpts_used": len(policy_excerpts),
-            },
-        )
-        return api_response
-    except Exception as e:
+
+async def _enumerate_items(items: List[Any]) -> AsyncIterator[BatchItem]:
+    for index, raw in enumerate(items):
+        yield index, raw
+
+
+@app.post("/v1/claims/evaluate:batch")
+async def evaluate_batch_endpoint(
+    request: Request,
+    concurrency: Optional[int] = None,
+    _auth=Depends(jwt_auth),  # <-- One JWT check for the whole batch
+):
+    """
+    Evaluates many claims in one request.
+
+    Request body (either):
+      - Content-Type: application/json     -> [ <Claim>, <Claim>, ... ]
+      - Content-Type: application/x-ndjson -> one <Claim> JSON object per line
+
+    Response (application/x-ndjson), one line per claim as soon as it finishes:
+      { "index": 0, "claim_id": "...", "status": "ok", "result": <EvaluateResponse> }
+      { "index": 1, "claim_id": "...", "status": "error", "error": { "status_code": 422, "detail": ... } }
+
+    `concurrency` caps in-flight evaluations (default and upper bound: BATCH_MAX_CONCURRENCY).
+    Retrieval results are shared across claims in the same batch.
+    """
+    if registry is None:
+        raise HTTPException(status_code=500, detail="Policy index registry not initialized")
+    if client is None:
+        raise HTTPException(status_code=500, detail="OpenAI client not initialized")
+
+    # The body is read before streaming starts: the streaming response also listens
+    # on the ASGI receive channel for disconnects, so it cannot be shared with
+    # request.stream().
+    content_type = request.headers.get("content-type", "")
+    ndjson = "ndjson" in content_type or "jsonlines" in content_type
+    items = _parse_batch_body(await request.body(), ndjson)
+    if len(items) > settings.BATCH_MAX_CLAIMS:
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to validate response against EvaluateResponse schema: {e}",
+            status_code=413,
+            detail=f"Batch has {len(items)} claims; the limit is {settings.BATCH_MAX_CLAIMS}.",
         )
+
+    async def body() -> AsyncIterator[bytes]:
+        async for record in evaluate_batch(
+            _enumerate_items(items), registry, client, concurrency=concurrency, decision_cache=decision_cache
+        ):
+            yield (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.get("/v1/admin/indexes")
+def list_indexes(_admin=Depends(admin_auth)):
+    """
+    Loaded policy indexes with their versions and load errors.
+    """
+    if registry is None:
+        raise HTTPException(status_code=500, detail="Policy index registry not initialized")
+    return {"default": settings.DEFAULT_POLICY_INDEX, "indexes": registry.versions()}
+
+
+@app.post("/v1/admin/indexes/reload")
+async def reload_indexes(name: Optional[str] = None, force: bool = False, _admin=Depends(admin_auth)):
+    """
+    Loads new index versions (one `name` or all) in the background and swaps them in;
+    in-flight requests finish on the previous version. Without `force`, indexes whose
+    files did not change are left alone.
+    """
+    if registry is None:
+        raise HTTPException(status_code=500, detail="Policy index registry not initialized")
+    if name is not None and name not in registry.sources:
+        raise HTTPException(status_code=404, detail=f"Unknown policy index '{name}'")
+    return {"indexes": await registry.reload(name, force=force)}
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.cache import LRUCache, SQLiteKVStore
+from app.core.config import settings
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used both as the cache key and as the text sent for embedding,
+    so that whitespace-only variants share one vector.
+    """
+    return _WS_RE.sub(" ", text or "").strip()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed by (embed model, normalized text).
+    Tier 1 is an in-process LRU; tier 2 is an optional SQLite file that survives
+    restarts. The disk tier is wiped automatically when the embed model changes.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_size: int = None,
+        ttl_seconds: float = None,
+        disk_path: Optional[str] = None,
+        disk_max_rows: int = None,
+    ):
+        self.model = model
+        self.memory = LRUCache(
+            max_size=settings.EMBED_CACHE_SIZE if max_size is None else max_size,
+            ttl_seconds=settings.EMBED_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds,
+        )
+        path = settings.EMBED_CACHE_PATH if disk_path is None else disk_path
+        self.disk: Optional[SQLiteKVStore] = None
+        if path:
+            self.disk = SQLiteKVStore(
+                path,
+                max_rows=settings.EMBED_CACHE_DISK_MAX_ROWS if disk_max_rows is None else disk_max_rows,
+                ttl_seconds=self.memory.ttl_seconds,
+            )
+            if self.disk.get_meta("embed_model") != model:
+                self.disk.clear()
+                self.disk.set_meta("embed_model", model)
+        self.disk_hits = 0
+
+    def _key(self, text: str) -> Tuple[str, str]:
+        return (self.model, text)
+
+    def _disk_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        v = self.memory.get(self._key(text))
+        if v is not None:
+            return v
+        if self.disk is None:
+            return None
+        raw = self.disk.get(self._disk_key(text))
+        if raw is None:
+            return None
+        v = np.frombuffer(raw, dtype="float32").copy()
+        self.memory.set(self._key(text), v)
+        self.disk_hits += 1
+        return v
+
+    def set(self, text: str, vector: np.ndarray) -> None:
+        v = np.ascontiguousarray(vector, dtype="float32").reshape(-1)
+        self.memory.set(self._key(text), v)
+        if self.disk is not None:
+            self.disk.set(self._disk_key(text), v.tobytes())
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        out = {}
+        for t in texts:
+            v = self.get(t)
+            if v is not None:
+                out[t] = v
+        return out
+
+    def _disk_get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        out = {}
+        for t in texts:
+            raw = self.disk.get(self._disk_key(t))
+            if raw is not None:
+                out[t] = np.frombuffer(raw, dtype="float32").copy()
+        return out
+
+    async def aget_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        get_many for async callers: the memory tier is read inline, disk-tier
+        lookups for its misses run in one worker-thread call.
+        """
+        out, missing = {}, []
+        for t in texts:
+            v = self.memory.get(self._key(t))
+            if v is not None:
+                out[t] = v
+            else:
+                missing.append(t)
+        if missing and self.disk is not None:
+            found = await asyncio.to_thread(self._disk_get_many, missing)
+            for t, v in found.items():
+                self.memory.set(self._key(t), v)
+            self.disk_hits += len(found)
+            out.update(found)
+        return out
+
+    async def aset_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        """
+        Stores several vectors; the disk tier is written in one worker-thread transaction.
+        """
+        rows = {t: np.ascontiguousarray(v, dtype="float32").reshape(-1) for t, v in vectors.items()}
+        for t, v in rows.items():
+            self.memory.set(self._key(t), v)
+        if self.disk is not None and rows:
+            await asyncio.to_thread(
+                self.disk.set_many, {self._disk_key(t): v.tobytes() for t, v in rows.items()}
+            )
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, int]:
+        s = self.memory.stats()
+        # A memory miss that was served from disk is still a cache hit overall.
+        return {
+            "memory_size": s["size"],
+            "hits": s["hits"] + self.disk_hits,
+            "misses": s["misses"] - self.disk_hits,
+            "memory_hits": s["hits"],
+            "disk_hits": self.disk_hits,
+            "evictions": s["evictions"],
+            "disk_size": len(self.disk) if self.disk is not None else 0,
+        }
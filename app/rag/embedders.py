@@ -0,0 +1,123 @@
+# Embedding backends shared by ingestion and the retriever.
+import zlib
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+from app.core import transport
+from app.core.config import settings
+from app.rag.lexical import tokenize
+
+
+class OpenAIEmbedder:
+    """
+    Remote embeddings through the OpenAI API, on the shared transport (sync
+    client for ingestion and search, async client for the request path).
+    `max_retries` / `timeout` override the embedding stage defaults.
+    """
+
+    name = "openai"
+    is_local = False
+
+    def __init__(self, model: str = None, max_retries: Optional[int] = None, timeout: Optional[float] = None):
+        self.model_id = model or settings.OPENAI_EMBED_MODEL
+        self.dim: Optional[int] = None  # known only after the first response
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.client = transport.sync_client()
+        self.aclient = transport.async_client()
+
+    @staticmethod
+    def _to_vectors(resp) -> np.ndarray:
+        data = sorted(resp.data, key=lambda d: d.index)
+        v = np.array([d.embedding for d in data], dtype="float32")
+        # Normalize for cosine similarity via inner product
+        faiss.normalize_L2(v)
+        return v
+
+    @staticmethod
+    def _approx_tokens(texts: List[str]) -> int:
+        # Rate-limiter estimate only (~4 chars/token); not worth a tokenizer pass.
+        return sum(len(t) // 4 + 1 for t in texts)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        resp = transport.EMBEDDINGS.call_sync(
+            lambda timeout: self.client.embeddings.create(model=self.model_id, input=texts, timeout=timeout),
+            tokens=self._approx_tokens(texts),
+            max_retries=self.max_retries,
+            timeout=self.timeout,
+        )
+        return self._to_vectors(resp)
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        resp = await transport.EMBEDDINGS.call(
+            lambda timeout: self.aclient.embeddings.create(model=self.model_id, input=texts, timeout=timeout),
+            tokens=self._approx_tokens(texts),
+            max_retries=self.max_retries,
+        )
+        return self._to_vectors(resp)
+
+    async def aclose(self) -> None:
+        await transport.aclose()
+
+
+class HashingEmbedder:
+    """
+    Local CPU embedder: signed feature hashing of word unigrams, word bigrams and
+    character trigrams into a fixed-size, L2-normalized vector. Needs no model
+    files and no network; a typical query embeds in well under a millisecond.
+    """
+
+    name = "hashing"
+    is_local = True
+
+    def __init__(self, dim: int = None):
+        self.dim = int(dim or settings.EMBED_LOCAL_DIM)
+        self.model_id = f"hashing-v1-{self.dim}"
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        tokens = tokenize(text)
+        feats = list(tokens)
+        feats.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        for t in tokens:
+            padded = f"<{t}>"
+            feats.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return feats
+
+    def _embed_one(self, text: str, out: np.ndarray) -> None:
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for f in self._features(text)), dtype=np.int64
+        )
+        if not hashes.size:
+            return
+        signs = np.where(hashes & (1 << 31), -1.0, 1.0).astype("float32")
+        np.add.at(out, hashes % self.dim, signs)
+        # Sublinear term frequency keeps repeated words from dominating.
+        np.copyto(out, np.sign(out) * np.log1p(np.abs(out)))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        v = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in zip(v, texts):
+            self._embed_one(text, row)
+        faiss.normalize_L2(v)
+        return v
+
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        return self.embed(texts)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def build_embedder(backend: str = None, max_retries: Optional[int] = None, timeout: Optional[float] = None):
+    """
+    Creates the embedding backend configured by EMBED_BACKEND ("openai" or "hashing").
+    """
+    kind = (backend or settings.EMBED_BACKEND).lower()
+    if kind == "openai":
+        return OpenAIEmbedder(max_retries=max_retries, timeout=timeout)
+    if kind == "hashing":
+        return HashingEmbedder()
+    raise RuntimeError(f"Unknown EMBED_BACKEND '{backend or settings.EMBED_BACKEND}'")
@@ -0,0 +1,118 @@
+# Search index types built from the canonical flat vector store (flat, IVF-Flat, HNSW, IVF-PQ).
+import math
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+def default_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but never fewer than 39 training points per centroid.
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def default_pq_m(dim: int) -> int:
+    # Largest sub-quantizer count <= 64 that divides the dimension.
+    for m in range(min(64, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def index_params(index_type: str, n: int, dim: int) -> Dict[str, Any]:
+    """
+    Resolved build parameters for `index_type` on n vectors of `dim` dimensions.
+    """
+    if index_type == "ivf":
+        return {"nlist": settings.VECTOR_IVF_NLIST or default_nlist(n)}
+    if index_type == "ivfpq":
+        return {
+            "nlist": settings.VECTOR_IVF_NLIST or default_nlist(n),
+            "m": settings.VECTOR_PQ_M or default_pq_m(dim),
+            "nbits": settings.VECTOR_PQ_NBITS,
+        }
+    if index_type == "hnsw":
+        return {"M": settings.VECTOR_HNSW_M, "ef_construction": settings.VECTOR_HNSW_EF_CONSTRUCTION}
+    return {}
+
+
+def _too_small(index_type: str, n: int, params: Dict[str, Any]) -> Optional[str]:
+    if index_type in ("ivf", "ivfpq") and (params["nlist"] < 2 or n < params["nlist"]):
+        return f"{n} vectors are too few for {params['nlist']} IVF lists"
+    if index_type == "ivfpq" and n < 2 ** params["nbits"]:
+        return f"{n} vectors are too few to train {params['nbits']}-bit PQ codebooks"
+    return None
+
+
+def build_search_index(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    index_type: str = None,
+) -> Tuple[faiss.Index, str, Dict[str, Any]]:
+    """
+    Builds (and trains, where needed) the index that serves queries.
+    Returns (index, effective type, params); corpora too small to train the
+    requested type fall back to an exact flat index.
+    """
+    index_type = (index_type or settings.VECTOR_INDEX_TYPE).lower()
+    if index_type not in INDEX_TYPES:
+        raise RuntimeError(f"Unknown VECTOR_INDEX_TYPE '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+
+    n, dim = vectors.shape
+    params = index_params(index_type, n, dim)
+    reason = _too_small(index_type, n, params)
+    if reason:
+        print(f"[WARN] {reason}; building a flat index instead of {index_type}")
+        index_type, params = "flat", {}
+
+    metric = faiss.METRIC_INNER_PRODUCT
+    if index_type == "flat":
+        inner = faiss.IndexFlatIP(dim)
+    elif index_type == "ivf":
+        inner = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, params["nlist"], metric)
+    elif index_type == "ivfpq":
+        inner = faiss.IndexIVFPQ(faiss.IndexFlatIP(dim), dim, params["nlist"], params["m"], params["nbits"], metric)
+    else:
+        inner = faiss.IndexHNSWFlat(dim, params["M"], metric)
+        inner.hnsw.efConstruction = params["ef_construction"]
+
+    if not inner.is_trained:
+        sample = vectors
+        if n > settings.VECTOR_TRAIN_MAX_SAMPLES:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, settings.VECTOR_TRAIN_MAX_SAMPLES, replace=False)]
+        inner.train(np.ascontiguousarray(sample, dtype="float32"))
+
+    index = faiss.IndexIDMap(inner)
+    if n:
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), ids.astype("int64"))
+    return index, index_type, params
+
+
+def store_contents(store: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (vectors, ids) held by an ID-mapped flat store.
+    """
+    ids = faiss.vector_to_array(store.id_map).astype("int64")
+    vectors = store.index.reconstruct_n(0, store.ntotal) if store.ntotal else np.zeros((0, store.d), dtype="float32")
+    return vectors, ids
+
+
+def is_flat_store(index: faiss.Index) -> bool:
+    return isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+
+
+def apply_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None) -> None:
+    """
+    Sets query-time knobs (IVF nprobe, HNSW efSearch) on whatever index type was loaded.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe or settings.VECTOR_NPROBE, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search or settings.VECTOR_EF_SEARCH
+
@@ -1,67 +1,355 @@
-import os, json
-from typing import List, Dict
+import os, json, hashlib, random, sqlite3, time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional, Tuple
 import numpy as np
 import faiss
-from openai import OpenAI
 
+from app.core import transport
 from app.core.config import settings
+from app.rag.embed_cache import EmbeddingCache
+from app.rag.embedders import build_embedder
+from app.rag.index_types import build_search_index, is_flat_store, store_contents
+from app.rag.profiles import build_profiles
+from app.rag.retriever import PolicyRetriever
 from app.rag.splitter import split_markdown_by_headings
+from app.rag.meta_store import write_chunk_store, write_profiles
+
+MANIFEST_VERSION = 1
+
+# Transient provider errors, plus an open breaker: ingestion waits it out rather than aborting.
+RETRYABLE_ERRORS = transport.UNAVAILABLE_ERRORS
 
 def read_all_markdown(policy_dir: str) -> List[Dict]:
     docs = []
     for root, _, files in os.walk(policy_dir):
-        for fn in files:
+        for fn in sorted(files):
             if fn.lower().endswith(".md"):
                 path = os.path.join(root, fn)
                 with open(path, "r", encoding="utf-8") as f:
                     docs.append({"path": path, "text": f.read()})
     return docs
 
-def embed_texts(client: OpenAI, texts: List[str]) -> np.ndarray:
-    # Embeddings API supports list input. :contentReference[oaicite:3]{index=3}
-    resp = client.embeddings.create(
-        model=settings.OPENAI_EMBED_MODEL,
-        input=texts
-    )
-    vecs = np.array([d.embedding for d in resp.data], dtype="float32")
-    # Normalize for cosine similarity via inner product
-    faiss.normalize_L2(vecs)
-    return vecs
+def embed_texts(embedder, texts: List[str]) -> np.ndarray:
+    # Backends return L2-normalized vectors (cosine similarity via inner product).
+    return embedder.embed(texts)
 
-def build_faiss_index(vectors: np.ndarray) -> faiss.Index:
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine if vectors are normalized
-    index.add(vectors)
-    return index
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text with cl100k-style tokenizers
+    return len(text) // 4 + 1
 
-def ingest_policies(policy_dir: str = "data/policies") -> None:
-    if not settings.OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is not set")
+def iter_token_batches(
+    items: Iterable[Dict[str, Any]],
+    max_tokens: int = None,
+    max_items: int = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Groups chunks into batches bounded by estimated token count and item count,
+    so no single embeddings request exceeds the API's input limits.
+    """
+    max_tokens = max_tokens or settings.EMBED_BATCH_MAX_TOKENS
+    max_items = max_items or settings.EMBED_BATCH_MAX_ITEMS
+    batch: List[Dict[str, Any]] = []
+    tokens = 0
+    for item in items:
+        n = estimate_tokens(item["text"])
+        if batch and (tokens + n > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(item)
+        tokens += n
+    if batch:
+        yield batch
 
-    os.makedirs(os.path.dirname(settings.VECTOR_INDEX_PATH), exist_ok=True)
+def embed_with_retry(embedder, texts: List[str], max_retries: int = None) -> np.ndarray:
+    """
+    embed_texts with exponential backoff and full jitter on retryable errors.
+    """
+    max_retries = settings.EMBED_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return embed_texts(embedder, texts)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = settings.EMBED_RETRY_BASE_SECONDS * (2 ** attempt)
+            # An open breaker says when it will let the next probe through.
+            time.sleep(max(random.uniform(0, min(delay, settings.EMBED_RETRY_MAX_SECONDS)), getattr(e, "retry_in", 0)))
+            attempt += 1
+
+def embed_streaming(
+    embedder,
+    batches: Iterable[List[Dict[str, Any]]],
+    on_vectors: Callable[[List[Dict[str, Any]], np.ndarray], None],
+    workers: int = None,
+) -> int:
+    """
+    Embeds batches on a bounded pool of worker threads and hands each batch's
+    vectors to `on_vectors` (on the calling thread) as soon as it arrives.
+    At most 2 * workers batches are in flight, so memory stays flat regardless
+    of corpus size. Returns the number of texts embedded.
+    """
+    workers = max(1, workers or settings.EMBED_WORKERS)
+    done_count = 0
+    in_flight: Dict[Future, List[Dict[str, Any]]] = {}
+
+    def drain(block_until: int) -> None:
+        nonlocal done_count
+        while len(in_flight) > block_until:
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                batch = in_flight.pop(fut)
+                on_vectors(batch, fut.result())
+                done_count += len(batch)
 
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+        try:
+            for batch in batches:
+                in_flight[pool.submit(embed_with_retry, embedder, [c["text"] for c in batch])] = batch
+                drain(2 * workers - 1)
+            drain(0)
+        except BaseException:
+            for fut in in_flight:
+                fut.cancel()
+            raise
+    return done_count
 
-    raw_docs = read_all_markdown(policy_dir)
+def build_faiss_index(vectors: np.ndarray, ids: Optional[np.ndarray] = None) -> faiss.Index:
+    dim = vectors.shape[1]
+    # ID-mapped so chunks can be removed/replaced by ID on incremental runs
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))  # cosine if vectors are normalized
+    if ids is None:
+        ids = np.arange(vectors.shape[0], dtype="int64")
+    if vectors.shape[0]:
+        index.add_with_ids(vectors, ids.astype("int64"))
+    return index
 
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def collect_chunks(policy_dir: str) -> List[Dict[str, Any]]:
+    """
+    Splits every policy file into chunks. Each chunk gets a stable `slot`
+    (source path, section title, occurrence within that section) used to tell
+    an updated chunk from an added one between runs.
+    """
     chunks = []
-    for d in raw_docs:
+    for d in read_all_markdown(policy_dir):
+        seen: Dict[Tuple[str, str], int] = {}
         for ch in split_markdown_by_headings(d["text"], max_chars=settings.MAX_POLICY_CHUNK_CHARS):
+            n = seen.get((d["path"], ch["section_title"]), 0)
+            seen[(d["path"], ch["section_title"])] = n + 1
             chunks.append({
                 "source_path": d["path"],
                 "section_title": ch["section_title"],
                 "rule_ids": ch["rule_ids"],
-                "text": ch["text"]
+                "text": ch["text"],
+                "slot": f"{d['path']}::{ch['section_title']}::{n}",
+                "hash": chunk_hash(ch["text"]),
             })
+    return chunks
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def _store_path() -> str:
+    # The exact ID-mapped flat index is the canonical vector store. With a flat
+    # index type it is also what gets served; otherwise it is kept next to it.
+    if settings.VECTOR_INDEX_TYPE == "flat":
+        return settings.VECTOR_INDEX_PATH
+    return settings.VECTOR_STORE_PATH
+
+def _load_previous(manifest: Optional[Dict[str, Any]], model_id: str) -> Optional[faiss.Index]:
+    """
+    Returns the existing vector store if it can be updated in place for this run, else None
+    (first run, embedding backend/model changed, legacy non-ID-mapped index, ...).
+    """
+    if manifest is None or manifest.get("embed_model") != model_id:
+        return None
+    for path in dict.fromkeys([_store_path(), settings.VECTOR_STORE_PATH, settings.VECTOR_INDEX_PATH]):
+        if not os.path.exists(path):
+            continue
+        index = faiss.read_index(path)
+        if is_flat_store(index) and index.ntotal == len(manifest.get("chunks", {})):
+            return index
+    return None
+
+def _atomic_write(path: str, write) -> None:
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
 
-    texts = [c["text"] for c in chunks]
-    vectors = embed_texts(client, texts)
-    index = build_faiss_index(vectors)
+def _write_json(path: str, obj: Any) -> None:
+    def write(tmp: str) -> None:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+    _atomic_write(path, write)
+
+def add_profiles(embedder, meta_path: str, index_path: str = None) -> int:
+    """
+    Ranks chunks for every retrieval profile (app/rag/profiles.py) against the index
+    at `index_path` and the chunk store at `meta_path`, and writes them into that
+    store. Costs one embeddings request (none in lexical mode). Returns the profile count.
+    """
+    retriever = PolicyRetriever(
+        index_path=index_path or settings.VECTOR_INDEX_PATH,
+        meta_path=meta_path,
+        embedder=embedder,
+        embed_cache=EmbeddingCache(embedder.model_id, disk_path=""),
+    )
+    try:
+        profiles = build_profiles(retriever, lambda texts: embed_with_retry(embedder, texts), settings.RAG_PROFILE_DEPTH)
+    finally:
+        retriever.meta.close()
+    conn = sqlite3.connect(meta_path)
+    try:
+        write_profiles(conn, profiles, settings.RAG_RETRIEVAL_MODE)
+    finally:
+        conn.close()
+    return len(profiles)
 
-    faiss.write_index(index, settings.VECTOR_INDEX_PATH)
-    with open(settings.VECTOR_META_PATH, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
+
+def ingest_policies(policy_dir: str = "data/policies", full_rebuild: bool = False) -> Dict[str, int]:
+    """
+    Incrementally (re)builds the policy index.
+    Only new or changed chunks are embedded; unchanged chunks keep their vectors and
+    IDs, and chunks that disappeared are removed from the ID-mapped FAISS index.
+    Embedding runs in token-bounded batches on a bounded worker pool and vectors are
+    added to the index as they arrive.
+    Vectors live in an ID-mapped flat store; for non-flat VECTOR_INDEX_TYPEs the
+    search index (IVF / HNSW / IVF-PQ) is trained and rebuilt from it.
+    Index, metadata store and manifest are each written to a temp file and swapped in.
+    The metadata store also gets the precomputed per-category retrieval profiles.
+    Returns counts of added, updated, removed, reused and embedded chunks.
+    """
+    if settings.EMBED_BACKEND.lower() == "openai" and not settings.OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+
+    os.makedirs(os.path.dirname(settings.VECTOR_INDEX_PATH), exist_ok=True)
+
+    # Retries are handled by embed_with_retry (longer backoff than the request path).
+    embedder = build_embedder(max_retries=0, timeout=settings.EMBED_INGEST_TIMEOUT_SECONDS)
+
+    chunks = collect_chunks(policy_dir)
+
+    manifest = None if full_rebuild else load_manifest(settings.VECTOR_MANIFEST_PATH)
+    index = _load_previous(manifest, embedder.model_id)
+    old_chunks: Dict[str, Dict[str, Any]] = manifest["chunks"] if index is not None else {}
+    next_id = int(manifest["next_id"]) if index is not None else 0
+
+    old_by_slot = {c["slot"]: (int(cid), c["hash"]) for cid, c in old_chunks.items()}
+    old_by_hash = {c["hash"]: int(cid) for cid, c in old_chunks.items()}
+
+    counts = {"added": 0, "updated": 0, "removed": 0, "reused": 0, "embedded": 0}
+    kept_ids = set()
+    retired_ids = []
+    pending: List[Dict[str, Any]] = []  # chunks that need a (new) vector
+
+    for c in chunks:
+        prev = old_by_slot.get(c["slot"])
+        if prev is not None and prev[1] == c["hash"] and prev[0] not in kept_ids:
+            c["chunk_id"] = prev[0]
+            kept_ids.add(prev[0])
+            counts["reused"] += 1
+            continue
+        if prev is not None and prev[0] not in kept_ids:
+            retired_ids.append(prev[0])
+            counts["updated"] += 1
+        else:
+            counts["added"] += 1
+        c["chunk_id"] = next_id
+        next_id += 1
+        pending.append(c)
+
+    retired = set(retired_ids)
+    removed_ids = [int(cid) for cid in old_chunks if int(cid) not in kept_ids and int(cid) not in retired]
+    counts["removed"] = len(removed_ids)
+
+    # Chunks whose exact text is already embedded (moved/renamed sections) copy the
+    # old vector; this must happen before stale IDs are removed.
+    to_embed = []
+    copied = []
+    for c in pending:
+        src = old_by_hash.get(c["hash"])
+        if index is not None and src is not None:
+            copied.append((c["chunk_id"], index.reconstruct(src)))
+        else:
+            to_embed.append(c)
+
+    stale = retired_ids + removed_ids
+    if index is not None:
+        if copied:
+            index.add_with_ids(
+                np.stack([v for _, v in copied]).astype("float32"),
+                np.array([cid for cid, _ in copied], dtype="int64"),
+            )
+        if stale:
+            index.remove_ids(np.array(stale, dtype="int64"))
+
+    def add_vectors(batch: List[Dict[str, Any]], vecs: np.ndarray) -> None:
+        nonlocal index
+        if index is None:
+            index = build_faiss_index(np.zeros((0, vecs.shape[1]), dtype="float32"))
+        index.add_with_ids(vecs, np.array([c["chunk_id"] for c in batch], dtype="int64"))
+
+    counts["embedded"] = embed_streaming(embedder, iter_token_batches(to_embed), add_vectors)
+
+    if index is None:
+        raise RuntimeError(f"No policy chunks found in {policy_dir}")
+
+    new_manifest = {
+        "version": MANIFEST_VERSION,
+        "embed_backend": embedder.name,
+        "embed_model": embedder.model_id,
+        "next_id": next_id,
+        "chunks": {str(c["chunk_id"]): {"slot": c["slot"], "hash": c["hash"]} for c in chunks},
+    }
+
+    index_info = {"type": "flat", "params": {}}
+    if settings.VECTOR_INDEX_TYPE == "flat":
+        _atomic_write(settings.VECTOR_INDEX_PATH, lambda tmp: faiss.write_index(index, tmp))
+    else:
+        _atomic_write(settings.VECTOR_STORE_PATH, lambda tmp: faiss.write_index(index, tmp))
+        prev_info = (manifest or {}).get("index") or {}
+        changed = counts["added"] or counts["updated"] or counts["removed"]
+        if changed or prev_info.get("requested") != settings.VECTOR_INDEX_TYPE \
+                or not os.path.exists(settings.VECTOR_INDEX_PATH):
+            vectors, ids = store_contents(index)
+            search_index, index_type, params = build_search_index(vectors, ids, settings.VECTOR_INDEX_TYPE)
+            index_info = {"type": index_type, "params": params}
+            _atomic_write(settings.VECTOR_INDEX_PATH, lambda tmp: faiss.write_index(search_index, tmp))
+        else:
+            # Nothing changed: keep the trained search index as is.
+            index_info = dict(prev_info)
+    index_info["requested"] = settings.VECTOR_INDEX_TYPE
+    new_manifest["index"] = index_info
+
+    n_profiles = 0
+
+    def finalize(tmp_path: str) -> None:
+        nonlocal n_profiles
+        n_profiles = add_profiles(embedder, tmp_path)
+
+    write_chunk_store(
+        settings.VECTOR_META_PATH,
+        chunks,
+        info={"embed_backend": embedder.name, "embed_model": embedder.model_id, "chunk_count": len(chunks)},
+        finalize=finalize,
+    )
+    _write_json(settings.VECTOR_MANIFEST_PATH, new_manifest)
 
     print(f"[OK] Ingested {len(chunks)} chunks from {policy_dir}")
-    print(f"[OK] Wrote index to {settings.VECTOR_INDEX_PATH}")
-    print(f"[OK] Wrote metadata to {settings.VECTOR_META_PATH}")
+    print(
+        f"[OK] added={counts['added']} updated={counts['updated']} removed={counts['removed']} "
+        f"reused={counts['reused']} (embedded {counts['embedded']})"
+    )
+    print(f"[OK] Embeddings: {embedder.name} ({embedder.model_id})")
+    print(f"[OK] Wrote {index_info['type']} index to {settings.VECTOR_INDEX_PATH} {index_info['params'] or ''}".rstrip())
+    print(f"[OK] Wrote metadata to {settings.VECTOR_META_PATH} ({n_profiles} retrieval profiles)")
+    return counts
@@ -0,0 +1,102 @@
+# Lexical side of retrieval: tokenization, category/rule-ID mapping and BM25 helpers.
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.rag.splitter import RULE_ID_RE
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+CATEGORY_IN_QUERY_RE = re.compile(r"\bcategory\s*=\s*([A-Z_]+)")
+MEAL_TYPE_IN_QUERY_RE = re.compile(r"\bmeal_type\s*=\s*([A-Z_]+)")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "the", "to", "with", "without", "per", "any", "all", "must",
+    "rules", "rule", "amount", "vendor", "desc", "category", "eur", "none",
+}
+
+# Rule-ID prefixes that belong to each claim line category.
+CATEGORY_RULE_PREFIXES: Dict[str, List[str]] = {
+    "MEALS": ["R-MEA-"],
+    "LODGING": ["R-LOD-", "R-DOC-002"],
+    "AIRFARE": ["R-DOC-003"],
+    "RAIL": ["R-DOC-003", "R-TRN-001"],
+    "TAXI": ["R-TRN-002", "R-TRN-003"],
+    "PUBLIC_TRANSIT": ["R-TRN-001"],
+    "MILEAGE": ["R-MIL-"],
+    "CLIENT_ENTERTAINMENT": ["R-DOC-004", "R-APP-004", "R-MEA-003"],
+    "OFFICE": [],
+    "TRAINING": ["R-TRN-1"],
+    "OTHER": [],
+}
+
+# Keywords that signal a category in policy text.
+CATEGORY_TERMS: Dict[str, List[str]] = {
+    "MEALS": ["meal", "breakfast", "lunch", "dinner", "alcohol"],
+    "LODGING": ["lodging", "hotel", "room", "nightly", "minibar"],
+    "AIRFARE": ["airfare", "flight", "itinerary"],
+    "RAIL": ["rail", "train", "itinerary"],
+    "TAXI": ["taxi", "ride-hailing"],
+    "PUBLIC_TRANSIT": ["public", "transport", "transit"],
+    "MILEAGE": ["mileage", "km", "distance", "commuting"],
+    "CLIENT_ENTERTAINMENT": ["client", "entertainment", "attendee"],
+    "OFFICE": ["office", "equipment"],
+    "TRAINING": ["training", "conference", "agenda"],
+    "OTHER": [],
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _stem(tok: str) -> str:
+    # Light plural folding so "meals"/"meal" and "receipts"/"receipt" match.
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+        return tok[:-1]
+    return tok
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def category_weights(text: str, rule_ids: Iterable[str]) -> Dict[str, float]:
+    """
+    How strongly a chunk relates to each category: 2 per matching rule ID plus
+    log-scaled keyword hits.
+    """
+    tf = Counter(tokenize(text))
+    rule_ids = list(rule_ids)
+    out: Dict[str, float] = {}
+    for cat, prefixes in CATEGORY_RULE_PREFIXES.items():
+        w = 2.0 * sum(1 for rid in rule_ids if any(rid.startswith(p) for p in prefixes))
+        w += sum(math.log1p(tf[_stem(t)]) for t in CATEGORY_TERMS.get(cat, []))
+        if w > 0:
+            out[cat] = w
+    return out
+
+
+def parse_query(query: str) -> Tuple[Optional[str], List[str], List[str]]:
+    """
+    Splits a retrieval query into (category, rule_ids, free-text terms).
+    Understands the "category=XXX" form built by the evaluation pipeline.
+    """
+    m = CATEGORY_IN_QUERY_RE.search(query or "")
+    category = m.group(1) if m and m.group(1) in CATEGORY_RULE_PREFIXES else None
+    rule_ids = sorted(set(RULE_ID_RE.findall(query or "")))
+    text = RULE_ID_RE.sub(" ", query or "")
+    terms = tokenize(text)
+    mt = MEAL_TYPE_IN_QUERY_RE.search(query or "")
+    if mt:
+        terms.append(_stem(mt.group(1).lower()))
+    return category, rule_ids, terms
+
+
+def bm25_idf(n_docs: int, df: int) -> float:
+    return math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_term_score(tf: int, doc_len: int, avg_len: float, idf: float) -> float:
+    denom = tf + BM25_K1 * (1.0 - BM25_B + BM25_B * doc_len / (avg_len or 1.0))
+    return idf * tf * (BM25_K1 + 1.0) / denom
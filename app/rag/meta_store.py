@@ -0,0 +1,331 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.cache import LRUCache
+from app.rag.lexical import bm25_idf, bm25_term_score, category_weights, tokenize
+from app.rag.splitter import extract_rule_statements
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id INTEGER PRIMARY KEY,
+    source_path TEXT NOT NULL,
+    section_title TEXT NOT NULL,
+    rule_ids TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    rule_id TEXT PRIMARY KEY,
+    chunk_id INTEGER NOT NULL,
+    snippet TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rule_refs (
+    rule_id TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    PRIMARY KEY (rule_id, chunk_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS categories (
+    category TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (category, chunk_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS doc_lengths (
+    chunk_id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    profile TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (profile, rank)
+) WITHOUT ROWID;
+"""
+
+
+def write_chunks(conn: sqlite3.Connection, chunks: Iterable[Dict[str, Any]], info: Dict[str, str] = None) -> int:
+    """
+    Writes chunk rows, the rule_id -> statement table and the lexical inverted
+    index (rule-ID refs, category weights, BM25 postings) into `conn` in one
+    transaction. Chunks without a chunk_id are numbered by position (legacy
+    meta.json layout).
+    """
+    conn.executescript(SCHEMA)
+    n = 0
+    total_len = 0
+    with conn:
+        for i, c in enumerate(chunks):
+            cid = int(c.get("chunk_id", i))
+            conn.execute(
+                "INSERT INTO chunks(chunk_id, source_path, section_title, rule_ids, text) VALUES (?, ?, ?, ?, ?)",
+                (cid, c["source_path"], c["section_title"], json.dumps(c.get("rule_ids") or []), c["text"]),
+            )
+            for rid, stmt in extract_rule_statements(c["text"]).items():
+                # First chunk that states a rule wins.
+                conn.execute(
+                    "INSERT OR IGNORE INTO rules(rule_id, chunk_id, snippet) VALUES (?, ?, ?)",
+                    (rid, cid, stmt),
+                )
+            rule_ids = c.get("rule_ids") or []
+            conn.executemany(
+                "INSERT OR IGNORE INTO rule_refs(rule_id, chunk_id) VALUES (?, ?)",
+                [(rid, cid) for rid in rule_ids],
+            )
+            conn.executemany(
+                "INSERT INTO categories(category, chunk_id, weight) VALUES (?, ?, ?)",
+                [(cat, cid, w) for cat, w in category_weights(c["text"], rule_ids).items()],
+            )
+            tokens = tokenize(c["text"])
+            conn.executemany(
+                "INSERT INTO postings(term, chunk_id, tf) VALUES (?, ?, ?)",
+                [(t, cid, tf) for t, tf in Counter(tokens).items()],
+            )
+            conn.execute("INSERT INTO doc_lengths(chunk_id, length) VALUES (?, ?)", (cid, len(tokens)))
+            total_len += len(tokens)
+            n += 1
+        info = dict(info or {})
+        info["doc_count"] = n
+        info["avg_doc_length"] = (total_len / n) if n else 0.0
+        for k, v in info.items():
+            conn.execute("INSERT OR REPLACE INTO info(key, value) VALUES (?, ?)", (k, str(v)))
+    return n
+
+
+def write_profiles(conn: sqlite3.Connection, profiles: Dict[str, List[Tuple[int, float]]], mode: str) -> None:
+    """
+    Replaces the precomputed retrieval profiles (profile -> ranked (chunk_id, score))
+    and records the retrieval mode they were scored with.
+    """
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.execute("DELETE FROM profiles")
+        conn.executemany(
+            "INSERT INTO profiles(profile, rank, chunk_id, score) VALUES (?, ?, ?, ?)",
+            [(key, rank, cid, score) for key, hits in profiles.items() for rank, (cid, score) in enumerate(hits)],
+        )
+        conn.execute("INSERT OR REPLACE INTO info(key, value) VALUES ('profiles_mode', ?)", (mode,))
+
+
+def write_chunk_store(
+    path: str,
+    chunks: Iterable[Dict[str, Any]],
+    info: Dict[str, str] = None,
+    finalize: Optional[Callable[[str], None]] = None,
+) -> int:
+    """
+    Builds a fresh store next to `path` and atomically swaps it in, so readers
+    that already opened the old file keep a consistent view. `finalize(tmp_path)`
+    runs on the complete store before the swap (e.g. to add retrieval profiles).
+    """
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        n = write_chunks(conn, chunks, info)
+    finally:
+        conn.close()
+    if finalize is not None:
+        finalize(tmp)
+    os.replace(tmp, path)
+    return n
+
+
+class ChunkStore:
+    """
+    Read side of the chunk metadata store. Rows are fetched from SQLite by chunk ID
+    on demand (with a small LRU in front), so startup cost and resident memory do
+    not grow with the number of chunks.
+    Legacy `meta.json` files are loaded into an in-memory SQLite database.
+    """
+
+    def __init__(self, path: str, cache_size: int = 1024):
+        self.path = path
+        self._lock = threading.Lock()
+        if path.lower().endswith(".json"):
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            with open(path, "r", encoding="utf-8") as f:
+                write_chunks(self._conn, json.load(f))
+        else:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            uri = f"file:{os.path.abspath(path)}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._cache = LRUCache(max_size=cache_size)
+        self._count: Optional[int] = None
+        self._doc_stats: Optional[Tuple[int, float]] = None
+
+    def _row_to_chunk(self, row) -> Dict[str, Any]:
+        cid, source_path, section_title, rule_ids, text = row
+        return {
+            "chunk_id": cid,
+            "source_path": source_path,
+            "section_title": section_title,
+            "rule_ids": json.loads(rule_ids),
+            "text": text,
+        }
+
+    def get_many(self, chunk_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        out: Dict[int, Dict[str, Any]] = {}
+        missing: List[int] = []
+        for cid in dict.fromkeys(int(i) for i in chunk_ids):
+            m = self._cache.get(cid)
+            if m is None:
+                missing.append(cid)
+            else:
+                out[cid] = m
+        if missing:
+            marks = ",".join("?" * len(missing))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, source_path, section_title, rule_ids, text FROM chunks WHERE chunk_id IN ({marks})",
+                    missing,
+                ).fetchall()
+            for row in rows:
+                m = self._row_to_chunk(row)
+                self._cache.set(m["chunk_id"], m)
+                out[m["chunk_id"]] = m
+        return out
+
+    def get(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        return self.get_many([chunk_id]).get(int(chunk_id))
+
+    def __getitem__(self, chunk_id: int) -> Dict[str, Any]:
+        m = self.get(chunk_id)
+        if m is None:
+            raise KeyError(chunk_id)
+        return m
+
+    def __contains__(self, chunk_id: int) -> bool:
+        return self.get(chunk_id) is not None
+
+    def __len__(self) -> int:
+        if self._count is None:
+            with self._lock:
+                self._count = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return self._count
+
+    def lookup_rules(self, rule_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        rule_id -> {snippet, section_title, source_path} for rules stated in the corpus.
+        """
+        rule_ids = list(dict.fromkeys(rule_ids))
+        if not rule_ids:
+            return {}
+        marks = ",".join("?" * len(rule_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.rule_id, r.snippet, c.section_title, c.source_path "
+                f"FROM rules r JOIN chunks c ON c.chunk_id = r.chunk_id WHERE r.rule_id IN ({marks})",
+                rule_ids,
+            ).fetchall()
+        return {
+            rid: {"snippet": snippet, "section_title": title, "source_path": src}
+            for rid, snippet, title, src in rows
+        }
+
+    def iter_chunks(self) -> Iterable[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, source_path, section_title, rule_ids, text FROM chunks ORDER BY chunk_id"
+            ).fetchall()
+        for row in rows:
+            yield self._row_to_chunk(row)
+
+    def _stats(self) -> Tuple[int, float]:
+        if self._doc_stats is None:
+            info = self.info()
+            self._doc_stats = (int(float(info.get("doc_count", 0))), float(info.get("avg_doc_length", 0.0)))
+        return self._doc_stats
+
+    def chunks_for_rules(self, rule_ids: Iterable[str]) -> Dict[int, float]:
+        """
+        chunk_id -> number of the given rule IDs the chunk mentions.
+        """
+        rule_ids = list(dict.fromkeys(rule_ids))
+        if not rule_ids:
+            return {}
+        marks = ",".join("?" * len(rule_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, COUNT(*) FROM rule_refs WHERE rule_id IN ({marks}) GROUP BY chunk_id",
+                rule_ids,
+            ).fetchall()
+        return {cid: float(n) for cid, n in rows}
+
+    def chunks_for_category(self, category: str, limit: int = 50) -> Dict[int, float]:
+        """
+        chunk_id -> category weight, strongest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, weight FROM categories WHERE category = ? ORDER BY weight DESC LIMIT ?",
+                (category, limit),
+            ).fetchall()
+        return {cid: float(w) for cid, w in rows}
+
+    def bm25(self, terms: Iterable[str], limit: int = 50) -> Dict[int, float]:
+        """
+        BM25 scores over the postings table for the given (already tokenized) terms.
+        """
+        tf_query = Counter(terms)
+        if not tf_query:
+            return {}
+        n_docs, avg_len = self._stats()
+        if not n_docs:
+            return {}
+        marks = ",".join("?" * len(tf_query))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.term, p.chunk_id, p.tf, d.length FROM postings p "
+                f"JOIN doc_lengths d ON d.chunk_id = p.chunk_id WHERE p.term IN ({marks})",
+                list(tf_query),
+            ).fetchall()
+        df = Counter(term for term, _, _, _ in rows)
+        scores: Dict[int, float] = {}
+        for term, cid, tf, length in rows:
+            s = bm25_term_score(tf, length, avg_len, bm25_idf(n_docs, df[term]))
+            scores[cid] = scores.get(cid, 0.0) + s * tf_query[term]
+        top = sorted(scores.items(), key=lambda kv: -kv[1])[:limit]
+        return dict(top)
+
+    def profiles(self) -> Dict[str, List[Tuple[int, float]]]:
+        """
+        profile -> ranked (chunk_id, score); empty for stores built before profiles existed.
+        """
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT profile, chunk_id, score FROM profiles ORDER BY profile, rank"
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return {}
+        out: Dict[str, List[Tuple[int, float]]] = {}
+        for key, cid, score in rows:
+            out.setdefault(key, []).append((cid, score))
+        return out
+
+    def info(self) -> Dict[str, str]:
+        with self._lock:
+            try:
+                return dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+            except sqlite3.OperationalError:
+                return {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
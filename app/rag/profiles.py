@@ -0,0 +1,52 @@
+# Retrieval profiles: ranked policy chunks per claim-line category (and meal type for
+# meals), computed once at ingest and stored in the chunk store. Evaluating a claim
+# whose lines all have a profile needs no query embeddings.
+from typing import Any, Callable, Dict, List, Optional, Tuple, get_args
+
+import numpy as np
+
+from app.schemas.claim import Category, MealType
+
+GENERAL_PROFILE = "GENERAL"
+GENERAL_QUERY = "General reimbursement eligibility, receipts, documentation, approvals"
+
+Profiles = Dict[str, List[Tuple[int, float]]]
+
+
+def profile_key(category: str, meal_type: Optional[str] = None) -> str:
+    return f"{category}:{meal_type}" if category == "MEALS" and meal_type else category
+
+
+def profile_query(category: str, meal_type: Optional[str] = None) -> str:
+    # Same "category=..." form as the live line queries, so the lexical side parses it.
+    query = f"Rules for category={category}"
+    return f"{query}, meal_type={meal_type}" if category == "MEALS" and meal_type else query
+
+
+def line_profile(line: Dict[str, Any]) -> str:
+    return profile_key(line["category"], line.get("meal_type"))
+
+
+def all_profiles() -> Dict[str, str]:
+    """
+    profile key -> query for the general policy query, every Category and every
+    MEALS meal type (taken from the Claim schema's Literal types).
+    """
+    out = {GENERAL_PROFILE: GENERAL_QUERY}
+    for category in get_args(Category):
+        out[profile_key(category)] = profile_query(category)
+    for meal_type in get_args(get_args(MealType)[0]):
+        out[profile_key("MEALS", meal_type)] = profile_query("MEALS", meal_type)
+    return out
+
+
+def build_profiles(retriever, embed: Callable[[List[str]], np.ndarray], depth: int) -> Profiles:
+    """
+    Ranks the top `depth` chunks for every profile with the retriever's scoring
+    (RAG_RETRIEVAL_MODE); `embed` is only called when that mode uses vectors.
+    """
+    profiles = all_profiles()
+    queries = list(profiles.values())
+    qv = embed(queries) if retriever.uses_embeddings else None
+    rows = retriever.rank_chunks(queries, qv, depth)
+    return {key: [(int(cid), float(score)) for cid, score in row.items()] for key, row in zip(profiles, rows)}
@@ -1,3 +1,10 @@
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+from app.core.serialization import canonical_json
+from app.rag.tokens import count_tokens, tokenizer_name
+
 SYSTEM_POLICY_ANALYST = """You are a reimbursement policy analyst.
 You MUST ONLY use the provided POLICY EXCERPTS to justify decisions.
 If a needed rule is not present in the excerpts, state that clearly.
@@ -12,22 +19,97 @@ You MUST return ONLY valid JSON with EXACTLY these top-level keys:
 No markdown. No extra commentary. No additional keys.
 """
 
-def build_user_prompt(claim: dict, deterministic_results: dict, policy_excerpts: list) -> str:
-    excerpts_txt = []
-    for i, ex in enumerate(policy_excerpts, start=1):
-        excerpts_txt.append(
-            f"[EXCERPT {i}]\n"
-            f"Section: {ex.get('section_title')}\n"
-            f"Rule IDs: {', '.join(ex.get('rule_ids') or [])}\n"
-            f"Text:\n{ex.get('text')}\n"
-        )
+EXCERPTS_HEADER = "POLICY EXCERPTS:\n"
+CLAIM_INSTRUCTION = "Evaluate the reimbursement claim below against the policy excerpts above.\n"
+
+# Bump when build_messages changes how a prompt is assembled; together with the template
+# text it versions cached LLM decisions (decision_cache_key).
+PROMPT_BUILDER_VERSION = "3"
+PROMPT_VERSION = hashlib.sha256(
+    "\x1f".join([PROMPT_BUILDER_VERSION, SYSTEM_POLICY_ANALYST, EXCERPTS_HEADER, CLAIM_INSTRUCTION]).encode("utf-8")
+).hexdigest()[:16]
+
+# Providers only cache prompt prefixes of at least this many tokens (OpenAI: 1024).
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def _drop_none(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _drop_none(v) for k, v in obj.items() if v is not None}
+    if isinstance(obj, list):
+        return [_drop_none(v) for v in obj]
+    return obj
+
 
+def format_excerpt(ex: Dict[str, Any]) -> str:
     return (
-        "Evaluate the reimbursement claim against the policy excerpts.\n\n"
-        "CLAIM (JSON):\n"
-        f"{claim}\n\n"
-        "DETERMINISTIC CHECK RESULTS (JSON):\n"
-        f"{deterministic_results}\n\n"
-        "POLICY EXCERPTS:\n"
-        + "\n".join(excerpts_txt)
+        f"[EXCERPT {ex.get('chunk_id')}]\n"
+        f"Section: {ex.get('section_title')}\n"
+        f"Rule IDs: {', '.join(ex.get('rule_ids') or [])}\n"
+        f"Text:\n{ex.get('text')}\n"
     )
+
+
+def pack_excerpts(
+    policy_excerpts: List[Dict[str, Any]],
+    budget: int = None,
+    max_count: int = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Takes excerpts best-first (retrieval order) while they fit the token budget and
+    returns them in chunk_id order, so the same policy context always renders the same
+    prompt prefix. Returns (packed excerpts, number dropped).
+    """
+    budget = settings.PROMPT_EXCERPT_TOKEN_BUDGET if budget is None else budget
+    max_count = settings.RAG_MAX_EXCERPTS if max_count is None else max_count
+    packed, used = [], 0
+    for ex in policy_excerpts:
+        if max_count and len(packed) >= max_count:
+            break
+        cost = count_tokens(format_excerpt(ex))
+        if budget and used + cost > budget:
+            # A smaller excerpt further down may still fit.
+            continue
+        packed.append(ex)
+        used += cost
+    packed.sort(key=lambda ex: ex["chunk_id"])
+    return packed, len(policy_excerpts) - len(packed)
+
+
+def build_messages(
+    claim: Dict[str, Any],
+    deterministic_results: Dict[str, Any],
+    policy_excerpts: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Chat messages for one claim, ordered static-first: system prompt, the policy
+    excerpts in their own message, then the claim and deterministic results as compact
+    canonical JSON. Claims that retrieve the same excerpts share a byte-identical
+    prefix, which the provider can serve from its prompt cache once it reaches
+    PROMPT_CACHE_MIN_TOKENS. Also returns local token counts.
+    """
+    excerpts_txt = EXCERPTS_HEADER + "\n".join(format_excerpt(ex) for ex in policy_excerpts)
+    claim_txt = (
+        CLAIM_INSTRUCTION
+        + "CLAIM (JSON):\n" + canonical_json(_drop_none(claim)) + "\n"
+        + "DETERMINISTIC CHECK RESULTS (JSON):\n" + canonical_json(deterministic_results) + "\n"
+    )
+    messages = [
+        {"role": "system", "content": SYSTEM_POLICY_ANALYST},
+        {"role": "user", "content": excerpts_txt},
+        {"role": "user", "content": claim_txt},
+    ]
+
+    system_tokens = count_tokens(SYSTEM_POLICY_ANALYST)
+    excerpt_tokens = count_tokens(excerpts_txt)
+    claim_tokens = count_tokens(claim_txt)
+    stats = {
+        "tokenizer": tokenizer_name(),
+        "system": system_tokens,
+        "excerpts": excerpt_tokens,
+        "claim": claim_tokens,
+        "total": system_tokens + excerpt_tokens + claim_tokens,
+        "static_prefix": system_tokens + excerpt_tokens,
+        "prefix_cacheable": system_tokens + excerpt_tokens >= PROMPT_CACHE_MIN_TOKENS,
+    }
+    return messages, stats
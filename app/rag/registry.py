@@ -0,0 +1,246 @@
+# Named policy indexes with background hot reload and atomic swap.
+import asyncio
+import contextlib
+import hashlib
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.core.singleflight import SingleFlight
+from app.rag.embed_cache import EmbeddingCache
+from app.rag.embedders import build_embedder
+from app.rag.retriever import PolicyRetriever
+
+
+def index_paths(directory: str) -> Dict[str, str]:
+    """
+    File layout of a named index directory (same file names as the default index).
+    """
+    return {
+        "index": os.path.join(directory, os.path.basename(settings.VECTOR_INDEX_PATH)),
+        "meta": os.path.join(directory, os.path.basename(settings.VECTOR_META_PATH)),
+        "manifest": os.path.join(directory, os.path.basename(settings.VECTOR_MANIFEST_PATH)),
+        "store": os.path.join(directory, os.path.basename(settings.VECTOR_STORE_PATH)),
+    }
+
+
+def configured_indexes() -> Dict[str, Dict[str, str]]:
+    """
+    "default" (the VECTOR_* paths) plus every "name=directory" entry of POLICY_INDEXES.
+    """
+    out = {
+        "default": {
+            "index": settings.VECTOR_INDEX_PATH,
+            "meta": settings.VECTOR_META_PATH,
+            "manifest": settings.VECTOR_MANIFEST_PATH,
+            "store": settings.VECTOR_STORE_PATH,
+        }
+    }
+    for entry in settings.POLICY_INDEXES.split(","):
+        name, _, directory = entry.partition("=")
+        if name.strip() and directory.strip():
+            out[name.strip()] = index_paths(directory.strip())
+    return out
+
+
+class IndexRegistry:
+    """
+    Holds one PolicyRetriever per named index. New index versions are loaded in a
+    worker thread and swapped in by replacing a dict reference. Requests that already
+    hold() the old retriever finish on it; it is closed once the last of them is done.
+    """
+
+    # A replaced retriever stays open at least this long, for requests that picked it
+    # but have not entered hold() yet (e.g. a stream whose body has not started).
+    RETIRE_GRACE_SECONDS = 5.0
+
+    def __init__(self, sources: Dict[str, Dict[str, str]] = None):
+        self.sources = sources or configured_indexes()
+        # One embedder and query-embedding cache for all indexes.
+        self.embedder = build_embedder()
+        self.embed_cache = EmbeddingCache(self.embedder.model_id)
+        self.embed_flight = SingleFlight("embedding")
+        self._current: Dict[str, PolicyRetriever] = {}
+        self._settling: Dict[str, str] = {}
+        # Disk version whose load failed; the watcher skips it until the files change.
+        self._failed: Dict[str, str] = {}
+        self._reload_lock = asyncio.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+        self.errors: Dict[str, str] = {}
+        self._holds: Dict[PolicyRetriever, int] = {}
+        self._retired: Dict[PolicyRetriever, float] = {}
+        self.on_swap: List[Callable[["IndexRegistry"], None]] = []
+
+    def _load(self, name: str) -> PolicyRetriever:
+        paths = self.sources[name]
+        r = PolicyRetriever(
+            name=name,
+            index_path=paths["index"],
+            meta_path=paths["meta"],
+            embedder=self.embedder,
+            embed_cache=self.embed_cache,
+            embed_flight=self.embed_flight,
+        )
+        if r.index.ntotal != len(r.meta):
+            r.meta.close()
+            raise RuntimeError(
+                f"index has {r.index.ntotal} vectors but metadata has {len(r.meta)} chunks (ingestion in progress?)"
+            )
+        r.build_missing_profiles()
+        return r
+
+    def _swap(self, name: str, retriever: PolicyRetriever) -> None:
+        old = self._current.get(name)
+        self._current = {**self._current, name: retriever}
+        if old is not None and old is not retriever:
+            self._retired[old] = time.monotonic()
+            self._close_retired()
+        self.errors.pop(name, None)
+        self._settling.pop(name, None)
+        self._failed.pop(name, None)
+
+    def _notify_swap(self) -> None:
+        # Callbacks may do file I/O (decision cache); reload() runs them in a worker thread.
+        for cb in self.on_swap:
+            cb(self)
+
+    def load_all(self) -> None:
+        """
+        Loads every configured index once (startup). Indexes that fail to load are
+        reported and left unavailable until a later reload succeeds.
+        """
+        for name in self.sources:
+            try:
+                self._swap(name, self._load(name))
+                self._notify_swap()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"[WARN] Policy index '{name}' not ready (did you run ingestion?): {e}")
+
+    @contextlib.contextmanager
+    def hold(self, retriever: PolicyRetriever) -> Iterator[PolicyRetriever]:
+        """
+        Marks `retriever` in use for the block, so a hot reload does not close it underneath.
+        """
+        self._holds[retriever] = self._holds.get(retriever, 0) + 1
+        try:
+            yield retriever
+        finally:
+            n = self._holds.pop(retriever) - 1
+            if n:
+                self._holds[retriever] = n
+            else:
+                self._close_retired()
+
+    def _close_retired(self) -> None:
+        now = time.monotonic()
+        for r, retired_at in list(self._retired.items()):
+            if r not in self._holds and now - retired_at >= self.RETIRE_GRACE_SECONDS:
+                del self._retired[r]
+                r.close()
+
+    def get(self, name: Optional[str] = None) -> Optional[PolicyRetriever]:
+        """
+        Current retriever for `name` (default: DEFAULT_POLICY_INDEX), or None if it
+        is configured but not loaded. Raises KeyError for unknown names.
+        """
+        name = name or settings.DEFAULT_POLICY_INDEX
+        if name not in self.sources:
+            raise KeyError(name)
+        return self._current.get(name)
+
+    def disk_version(self, name: str) -> Optional[str]:
+        paths = self.sources[name]
+        try:
+            return PolicyRetriever.file_version(paths["index"], paths["meta"])
+        except OSError:
+            return None
+
+    async def reload(self, name: Optional[str] = None, force: bool = True) -> Dict[str, Any]:
+        """
+        Reloads one index (or all). Without `force`, an index is only reloaded when its
+        files changed. Returns {name: {"version", "reloaded", "error"}}.
+        """
+        names = [name] if name else list(self.sources)
+        out: Dict[str, Any] = {}
+        async with self._reload_lock:
+            for n in names:
+                current = self._current.get(n)
+                disk = self.disk_version(n)
+                if not force and current is not None and disk == current.index_version:
+                    out[n] = {"version": current.index_version, "reloaded": False, "error": None}
+                    continue
+                try:
+                    fresh = await asyncio.to_thread(self._load, n)
+                except Exception as e:
+                    self.errors[n] = str(e)
+                    if disk is not None:
+                        self._failed[n] = disk
+                    print(f"[WARN] Reload of policy index '{n}' failed; keeping the current version: {e}")
+                    out[n] = {"version": current.index_version if current else None, "reloaded": False, "error": str(e)}
+                    continue
+                self._swap(n, fresh)
+                await asyncio.to_thread(self._notify_swap)
+                print(f"[OK] Policy index '{n}' now at version {fresh.index_version}")
+                out[n] = {"version": fresh.index_version, "reloaded": True, "error": None}
+        return out
+
+    async def _watch(self) -> None:
+        # A change is loaded once the files have stayed the same for one full
+        # interval, so a reload never races an ingestion that is still writing.
+        while True:
+            await asyncio.sleep(settings.INDEX_RELOAD_SECONDS)
+            try:
+                await self._poll()
+            except Exception as e:
+                print(f"[WARN] Policy index watcher: {type(e).__name__}: {e}")
+
+    async def _poll(self) -> None:
+        self._close_retired()
+        for n in list(self.sources):
+            disk = self.disk_version(n)
+            current = self._current.get(n)
+            if disk is None or (current is not None and disk == current.index_version):
+                self._settling.pop(n, None)
+                continue
+            if self._failed.get(n) == disk:
+                continue
+            if self._settling.get(n) == disk:
+                await self.reload(n, force=True)
+            else:
+                self._settling[n] = disk
+
+    def start_watching(self) -> None:
+        if settings.INDEX_RELOAD_SECONDS > 0 and self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    def versions(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            n: {
+                "version": self._current[n].index_version if n in self._current else None,
+                "chunks": len(self._current[n].meta) if n in self._current else 0,
+                "error": self.errors.get(n),
+            }
+            for n in self.sources
+        }
+
+    def fingerprint(self) -> str:
+        """
+        Combined version of all loaded indexes.
+        """
+        parts = sorted(f"{n}:{r.index_version}" for n, r in self._current.items())
+        return hashlib.sha256(";".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    async def aclose(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        for r in [*self._current.values(), *self._retired]:
+            r.close()
+        self._retired.clear()
+        await self.embedder.aclose()
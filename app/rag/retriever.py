@@ -1,42 +1,416 @@
-import json
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+import os
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 import faiss
-from openai import OpenAI
 
+from app.core import metrics
+from app.core.cache import LRUCache
 from app.core.config import settings
+from app.core.singleflight import SingleFlight
+from app.rag.embed_cache import EmbeddingCache, normalize_text
+from app.rag.embedders import build_embedder
+from app.rag.index_types import apply_search_params
+from app.rag.lexical import parse_query, tokenize
+from app.rag.meta_store import ChunkStore
+from app.rag.profiles import build_profiles
+
 
 class PolicyRetriever:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.index = faiss.read_index(settings.VECTOR_INDEX_PATH)
-        with open(settings.VECTOR_META_PATH, "r", encoding="utf-8") as f:
-            self.meta = json.load(f)
+    def __init__(
+        self,
+        name: str = "default",
+        index_path: str = None,
+        meta_path: str = None,
+        embedder=None,
+        embed_cache: Optional[EmbeddingCache] = None,
+        embed_flight: Optional[SingleFlight] = None,
+    ):
+        self.name = name
+        self.index_path = index_path or settings.VECTOR_INDEX_PATH
+        self.meta_path = meta_path or settings.VECTOR_META_PATH
+        # Fingerprint first: if ingestion rewrites the files while they are being
+        # read, the next version check sees a change and loads them again.
+        self.index_version = self.file_version(self.index_path, self.meta_path)
+        # A registry shares one embedder (and its HTTP clients) across indexes.
+        self._owns_embedder = embedder is None
+        self.embedder = embedder or build_embedder()
+        self.index = self._read_index(self.index_path)
+        apply_search_params(self.index)
+        # Chunk metadata is read lazily by ID from SQLite (legacy meta.json is loaded in memory).
+        self.meta = ChunkStore(self.meta_path, cache_size=settings.META_CACHE_SIZE)
+        self._check_backend()
+        self.embed_cache = embed_cache or EmbeddingCache(self.embedder.model_id)
+        # Concurrent cache misses for the same query text share one embedding request.
+        self.embed_flight = embed_flight or SingleFlight("embedding")
+        # Stored chunk vectors used by rerank(), per loaded index version.
+        self._chunk_vectors_cache = LRUCache(max_size=settings.META_CACHE_SIZE)
+        # Precomputed category / meal-type retrieval (small; held in memory).
+        self.profiles = self._load_profiles()
 
-    def _embed(self, text: str) -> np.ndarray:
-        resp = self.client.embeddings.create(
-            model=settings.OPENAI_EMBED_MODEL,
-            input=[text]
+    def _check_backend(self) -> None:
+        # Query vectors are only comparable with vectors from the backend that built the index.
+        built_with = self.meta.info().get("embed_model")
+        if built_with and built_with != self.embedder.model_id:
+            raise RuntimeError(
+                f"Index was built with embeddings '{built_with}' but EMBED_BACKEND gives "
+                f"'{self.embedder.model_id}'; re-run ingestion with --full"
+            )
+        if self.embedder.dim and self.embedder.dim != self.index.d:
+            raise RuntimeError(f"Index dimension {self.index.d} != embedder dimension {self.embedder.dim}")
+
+    def _load_profiles(self) -> Dict[str, List[Tuple[int, float]]]:
+        if not settings.RAG_PROFILES_ENABLED:
+            return {}
+        profiles = self.meta.profiles()
+        built_for = self.meta.info().get("profiles_mode")
+        if profiles and built_for != settings.RAG_RETRIEVAL_MODE:
+            print(
+                f"[WARN] Index '{self.name}': retrieval profiles were built for mode '{built_for}' but "
+                f"RAG_RETRIEVAL_MODE is '{settings.RAG_RETRIEVAL_MODE}'; all queries are searched live"
+            )
+            return {}
+        return profiles
+
+    def build_missing_profiles(self) -> None:
+        """
+        For an index ingested before profiles existed: ranks them once (one embeddings
+        request) and keeps them in memory; scripts.build_retrieval_profiles stores them.
+        If that fails, every query is searched live.
+        """
+        if not settings.RAG_PROFILES_ENABLED or self.profiles or self.meta.profiles():
+            return
+        try:
+            self.profiles = build_profiles(self, self.embedder.embed, settings.RAG_PROFILE_DEPTH)
+        except Exception as e:
+            print(
+                f"[WARN] Index '{self.name}' has no stored retrieval profiles and building them failed "
+                f"({type(e).__name__}: {e}); all queries are searched live"
+            )
+            return
+        print(
+            f"[OK] Index '{self.name}': built {len(self.profiles)} retrieval profiles at load "
+            f"(store them with: python -m scripts.build_retrieval_profiles --index {self.name})"
         )
-        v = np.array(resp.data[0].embedding, dtype="float32")[None, :]
-        faiss.normalize_L2(v)
-        return v
 
-    def search(self, query: str, top_k: int = None) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _read_index(path: str) -> faiss.Index:
+        if settings.VECTOR_INDEX_MMAP:
+            # Vectors stay in the page cache and are shared by all worker processes.
+            try:
+                return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass  # index type without mmap support
+        return faiss.read_index(path)
+
+    @staticmethod
+    def file_version(*paths: str) -> str:
+        # Cheap fingerprint that changes whenever ingestion rewrites the files.
+        h = hashlib.sha256()
+        for p in paths:
+            st = os.stat(p)
+            h.update(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def lookup_rules(self, rule_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        rule_id -> {snippet, section_title, source_path} from the index metadata.
+        """
+        return self.meta.lookup_rules(rule_ids)
+
+    def _embed(self, text: str) -> np.ndarray:
+        return self._embed_many([text])
+
+    def _count_embedding_call(self, n_texts: int) -> None:
+        metrics.EMBEDDING_CALLS.inc(1, self.embedder.name)
+        metrics.EMBEDDING_INPUTS.inc(n_texts, self.embedder.name)
+
+    def _embed_many(self, texts: List[str]) -> np.ndarray:
+        with metrics.span("embedding"):
+            texts = [normalize_text(t) for t in texts]
+            if self.embedder.is_local:
+                # Local backends are faster than a cache lookup.
+                self._count_embedding_call(len(texts))
+                return self.embedder.embed(texts)
+            # Serve repeated queries from the cache; embed the rest in one request.
+            cached = self.embed_cache.get_many(texts)
+            missing = [t for t in dict.fromkeys(texts) if t not in cached]
+            if missing:
+                self._count_embedding_call(len(missing))
+                for t, row in zip(missing, self.embedder.embed(missing)):
+                    self.embed_cache.set(t, row)
+                    cached[t] = row
+            return np.stack([cached[t] for t in texts]).astype("float32", copy=False)
+
+    async def _aembed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Async counterpart of _embed_many. Cache misses already being embedded for
+        another request are awaited (single-flight); the rest are split into batches
+        of RAG_EMBED_BATCH_SIZE and the batches are embedded concurrently.
+        """
+        with metrics.span("embedding"):
+            texts = [normalize_text(t) for t in texts]
+            if self.embedder.is_local:
+                self._count_embedding_call(len(texts))
+                return self.embedder.embed(texts)
+            cached = await self.embed_cache.aget_many(list(dict.fromkeys(texts)))
+            missing = [t for t in dict.fromkeys(texts) if t not in cached]
+            if missing:
+                rows = await self.embed_flight.do_many(missing, self._aembed_missing)
+                cached.update(zip(missing, rows))
+            return np.stack([cached[t] for t in texts]).astype("float32", copy=False)
+
+    async def _aembed_missing(self, missing: List[str]) -> List[np.ndarray]:
+        size = max(1, settings.RAG_EMBED_BATCH_SIZE)
+        batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+        for b in batches:
+            self._count_embedding_call(len(b))
+        results = await asyncio.gather(*[self.embedder.aembed(b) for b in batches])
+        rows: List[np.ndarray] = [row for vecs in results for row in vecs]
+        await self.embed_cache.aset_many(dict(zip(missing, rows)))
+        return rows
+
+    def _hit(self, m: Dict[str, Any], score: float) -> Dict[str, Any]:
+        return {
+            "chunk_id": int(m["chunk_id"]),
+            "score": float(score),
+            "source_path": m["source_path"],
+            "section_title": m["section_title"],
+            "rule_ids": m["rule_ids"],
+            "text": m["text"]
+        }
+
+    def _search_vectors(self, qv: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with metrics.span("vector_search"):
+            return self.index.search(qv, k)
+
+    def _lexical_scores(self, query: str, k: int) -> Dict[int, float]:
+        """
+        Lexical relevance in [0, 1] from the inverted index: exact rule-ID references,
+        the query's claim category, and BM25 over the remaining terms. Each signal is
+        normalized by its best hit and the present signals are averaged.
+        """
+        category, rule_ids, terms = parse_query(query)
+        signals = []
+        if rule_ids:
+            signals.append(self.meta.chunks_for_rules(rule_ids))
+        if category:
+            signals.append(self.meta.chunks_for_category(category, limit=4 * k))
+        if terms:
+            signals.append(self.meta.bm25(terms, limit=4 * k))
+        signals = [sig for sig in signals if sig]
+        if not signals:
+            return {}
+
+        combined: Dict[int, float] = {}
+        for sig in signals:
+            top = max(sig.values()) or 1.0
+            for cid, v in sig.items():
+                combined[cid] = combined.get(cid, 0.0) + v / top / len(signals)
+        return combined
+
+    def _score_rows(self, queries: List[str], qv: Optional[np.ndarray], k: int) -> List[Dict[int, float]]:
+        """
+        Per-query chunk scores for the configured RAG_RETRIEVAL_MODE:
+        "vector" (dense only), "lexical" (inverted index only, no embeddings) or
+        "hybrid" (alpha * cosine + (1 - alpha) * lexical over the union of both).
+        """
+        mode = settings.RAG_RETRIEVAL_MODE
+        vec_rows: List[Dict[int, float]] = [{} for _ in queries]
+        if qv is not None:
+            scores, idxs = self._search_vectors(qv, k)
+            vec_rows = [
+                {i: s for s, i in zip(row_scores, row_idxs) if i >= 0}
+                for row_scores, row_idxs in zip(scores.tolist(), idxs.tolist())
+            ]
+        if mode == "vector":
+            rows = vec_rows
+        else:
+            with metrics.span("lexical_search"):
+                lex_rows = [self._lexical_scores(q, k) for q in queries]
+            if mode == "lexical":
+                rows = lex_rows
+            else:
+                alpha = settings.RAG_HYBRID_ALPHA
+                rows = []
+                for vec, lex in zip(vec_rows, lex_rows):
+                    rows.append({
+                        cid: alpha * vec.get(cid, 0.0) + (1.0 - alpha) * lex.get(cid, 0.0)
+                        for cid in set(vec) | set(lex)
+                    })
+        return [dict(sorted(r.items(), key=lambda kv: (-kv[1], kv[0]))[:k]) for r in rows]
+
+    def _materialize(self, rows: List[Dict[int, float]]) -> List[List[Dict[str, Any]]]:
+        meta = self.meta.get_many(cid for r in rows for cid in r)
+        return [[self._hit(meta[cid], score) for cid, score in r.items() if cid in meta] for r in rows]
+
+    def _search_each(self, queries: List[str], qv: Optional[np.ndarray], k: int) -> List[List[Dict[str, Any]]]:
+        return self._materialize(self._score_rows(queries, qv, k))
+
+    def rank_chunks(self, queries: List[str], qv: Optional[np.ndarray], k: int) -> List[Dict[int, float]]:
+        """
+        chunk_id -> score (top k, best-first) per query for already computed query
+        vectors (None when the mode does not use them). Used to build profiles.
+        """
+        return self._score_rows(queries, qv, k)
+
+    def profile_hits(self, keys: List[str], top_k: int = None) -> List[List[Dict[str, Any]]]:
+        """
+        Hit lists for precomputed profiles (see app/rag/profiles.py); local reads only.
+        """
         k = top_k or settings.RAG_TOP_K
-        qv = self._embed(query)
-        scores, idxs = self.index.search(qv, k)
+        return self._materialize([dict(self.profiles[key][:k]) for key in keys])
 
-        out = []
-        for score, i in zip(scores[0].tolist(), idxs[0].tolist()):
-            if i < 0:
+    @property
+    def uses_embeddings(self) -> bool:
+        return settings.RAG_RETRIEVAL_MODE != "lexical"
+
+    @staticmethod
+    def merge_hits(hit_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Merges per-query hit lists into one entry per chunk with its best score,
+        best-first.
+        """
+        best: Dict[int, Dict[str, Any]] = {}
+        for hits in hit_lists:
+            for h in hits:
+                cur = best.get(h["chunk_id"])
+                if cur is None or h["score"] > cur["score"]:
+                    best[h["chunk_id"]] = h
+        return sorted(best.values(), key=lambda h: (-h["score"], h["chunk_id"]))
+
+    def _chunk_vectors(self, chunk_ids: List[int]) -> Optional[np.ndarray]:
+        """
+        Stored vectors of the given chunks, or None when the index cannot reconstruct
+        by ID (IVF/HNSW serving indexes are not ID-mapped for reconstruction).
+        """
+        rows = []
+        for cid in chunk_ids:
+            vec = self._chunk_vectors_cache.get(cid)
+            if vec is None:
+                try:
+                    vec = self.index.reconstruct(int(cid))
+                except RuntimeError:
+                    return None
+                self._chunk_vectors_cache.set(cid, vec)
+            rows.append(vec)
+        return np.stack(rows)
+
+    def _similarities(self, hits: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Pairwise chunk similarity: cosine of the stored vectors, or token-set Jaccard
+        when vectors are not available.
+        """
+        vectors = self._chunk_vectors([h["chunk_id"] for h in hits])
+        if vectors is not None:
+            return vectors @ vectors.T
+        tokens = [set(tokenize(h["text"])) for h in hits]
+        sims = np.zeros((len(hits), len(hits)), dtype="float32")
+        for i, a in enumerate(tokens):
+            for j in range(i, len(hits)):
+                b = tokens[j]
+                sims[i, j] = sims[j, i] = len(a & b) / len(a | b) if a | b else 1.0
+        return sims
+
+    def rerank(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Maximal marginal relevance over merged hits, so the prompt gets fewer and
+        more diverse excerpts. Relevance is the hit score (boosted by RAG_RULE_ID_BOOST
+        for chunks that cite rule IDs) relative to the best hit. Hits below
+        RAG_SCORE_FLOOR of the best are dropped, and hits at least
+        RAG_DUPLICATE_SIMILARITY similar to an already selected one are skipped.
+        Returns the survivors in MMR order.
+        """
+        if len(hits) < 2 or not settings.RAG_RERANK:
+            return hits
+
+        boost = 1.0 + settings.RAG_RULE_ID_BOOST
+        rel = np.array([h["score"] * (boost if h["rule_ids"] else 1.0) for h in hits], dtype="float32")
+        top = float(rel.max())
+        if top <= 0:
+            return hits
+        rel /= top
+        keep = np.flatnonzero(rel >= settings.RAG_SCORE_FLOOR)
+        hits = [hits[i] for i in keep]
+        rel = rel[keep]
+
+        sims = self._similarities(hits)
+        lam = settings.RAG_MMR_LAMBDA
+        # Highest similarity of each candidate to anything selected so far.
+        redundancy = np.zeros(len(hits), dtype="float32")
+        remaining = np.ones(len(hits), dtype=bool)
+        order: List[int] = []
+        while remaining.any():
+            value = np.where(remaining, lam * rel - (1.0 - lam) * redundancy, -np.inf)
+            best = int(value.argmax())
+            remaining[best] = False
+            if order and redundancy[best] >= settings.RAG_DUPLICATE_SIMILARITY:
                 continue
-            m = self.meta[i]
-            out.append({
-                "score": float(score),
-                "source_path": m["source_path"],
-                "section_title": m["section_title"],
-                "rule_ids": m["rule_ids"],
-                "text": m["text"]
-            })
-        return out
+            order.append(best)
+            redundancy = np.maximum(redundancy, sims[best])
+        return [hits[i] for i in order]
+
+    def search(self, query: str, top_k: int = None) -> List[Dict[str, Any]]:
+        k = top_k or settings.RAG_TOP_K
+        qv = self._embed(query) if self.uses_embeddings else None
+        return self._search_each([query], qv, k)[0]
+
+    def search_lexical(self, query: str, top_k: int = None) -> List[Dict[str, Any]]:
+        """
+        Inverted-index-only search (rule IDs, category, BM25); never calls the
+        embeddings API. Accepts e.g. "R-MEA-002" or "category=LODGING".
+        """
+        k = top_k or settings.RAG_TOP_K
+        rows = [dict(sorted(self._lexical_scores(query, k).items(), key=lambda kv: (-kv[1], kv[0]))[:k])]
+        return self._materialize(rows)[0]
+
+    def search_many(self, queries: List[str], top_k: int = None) -> List[Dict[str, Any]]:
+        """
+        Retrieves policy chunks for several queries at once.
+        All queries are embedded in a single request and searched with one
+        matrix index.search call. Hits are de-duplicated by chunk, keeping the
+        best score seen across queries, and returned best-first.
+        """
+        queries = [q for q in dict.fromkeys(queries) if q]
+        if not queries:
+            return []
+
+        k = top_k or settings.RAG_TOP_K
+        qv = self._embed_many(queries) if self.uses_embeddings else None
+        return self.merge_hits(self._search_each(queries, qv, k))
+
+    async def asearch_many(self, queries: List[str], top_k: int = None) -> List[Dict[str, Any]]:
+        """
+        Async search_many: embeddings go through AsyncOpenAI and the index
+        searches run in a worker thread so the event loop is never blocked.
+        """
+        queries = [q for q in dict.fromkeys(queries) if q]
+        if not queries:
+            return []
+
+        return self.merge_hits(await self.asearch_each(queries, top_k))
+
+    async def asearch_each(self, queries: List[str], top_k: int = None) -> List[List[Dict[str, Any]]]:
+        """
+        Like asearch_many, but returns one hit list per query (same order, not merged)
+        so callers can memoize results per query string.
+        """
+        if not queries:
+            return []
+
+        k = top_k or settings.RAG_TOP_K
+        qv = await self._aembed_many(queries) if self.uses_embeddings else None
+        return await asyncio.to_thread(self._search_each, queries, qv, k)
+
+    def close(self) -> None:
+        """
+        Releases the chunk store and the FAISS index; the retriever is unusable afterwards.
+        """
+        self.meta.close()
+        self.index = None
+
+    async def aclose(self) -> None:
+        if self._owns_embedder:
+            await self.embedder.aclose()
+        self.close()
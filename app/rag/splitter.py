@@ -2,6 +2,13 @@ import re
 from typing import List, Dict
 
 RULE_ID_RE = re.compile(r"\bR-[A-Z]{2,5}-\d{3}\b")
+RULE_STATEMENT_RE = re.compile(r"^\s*[-*]?\s*(R-[A-Z]{2,5}-\d{3})\s*:\s*(.+?)\s*$", re.MULTILINE)
+
+def extract_rule_statements(text: str) -> Dict[str, str]:
+    """
+    Returns {rule_id: statement} for lines of the form "R-XXX-NNN: statement".
+    """
+    return {rid: stmt for rid, stmt in RULE_STATEMENT_RE.findall(text)}
 
 def split_markdown_by_headings(md: str, max_chars: int = 2400) -> List[Dict]:
     """
@@ -0,0 +1,56 @@
+# Local token counting for prompt budgets (tiktoken when available, else a length estimate).
+import threading
+from functools import lru_cache
+
+from app.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+_lock = threading.Lock()
+_encoding = None
+_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _loaded
+    if _loaded:
+        return _encoding
+    with _lock:
+        if not _loaded:
+            if tiktoken is not None:
+                try:
+                    try:
+                        _encoding = tiktoken.encoding_for_model(settings.OPENAI_CHAT_MODEL)
+                    except KeyError:
+                        _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    # BPE files are fetched on first use; offline hosts fall back to estimates.
+                    print(f"[WARN] tiktoken unavailable ({e}); prompt token counts are estimates")
+            _loaded = True
+    return _encoding
+
+
+def load_tokenizer() -> str:
+    """
+    Loads the encoding now (tiktoken may download its BPE file) and returns its name,
+    or "estimate" if that fails. The server calls it at startup so no request pays for it.
+    """
+    _get_encoding()
+    return tokenizer_name()
+
+
+def tokenizer_name() -> str:
+    enc = _get_encoding()
+    return enc.name if enc is not None else "estimate"
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # ~4 characters per token for English text
+    return len(text) // 4 + 1
@@ -0,0 +1,349 @@
+# Persistent duplicate-submission index for R-GEN-004. Every evaluated claim line is
+# recorded under a few 64-bit blocking keys; a new line is checked by probing its
+# keys (a handful of primary-key lookups, independent of history size) and
+# verifying the few candidates they return.
+#
+# Key kinds:
+#   exact   - employee, expense date, amount, currency, vendor, receipt ID
+#   receipt - employee and receipt ID (the same receipt filed twice)
+#   near    - employee, currency, category, date and an amount bucket; candidates
+#             must be within the amount tolerance and have similar vendor/description
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.rules.ruleset import parse_date
+
+SCHEMA_VERSION = "1"
+
+# Amount buckets are uniform in log(amount + OFFSET): a relative tolerance above
+# OFFSET * pct and an absolute one below it both span only a few buckets.
+AMOUNT_BUCKET_OFFSET = 50.0
+AMOUNT_BUCKET_WIDTH = math.log(1.02)
+MAX_AMOUNT_BUCKETS = 8
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+_LEGAL_SUFFIXES = {"gmbh", "ag", "kg", "ltd", "llc", "inc", "sa", "srl", "spa", "bv", "co", "the"}
+
+
+def normalize_name(text: str) -> str:
+    """
+    Vendor/description canonical form: ASCII-folded, lowercase, punctuation and
+    legal-form suffixes dropped ("Café Central GmbH" -> "cafe central").
+    """
+    folded = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join(t for t in _NON_ALNUM_RE.split(folded) if t and t not in _LEGAL_SUFFIXES)
+
+
+def normalize_receipt(receipt_id: Optional[str]) -> str:
+    return _NON_ALNUM_RE.sub("", (receipt_id or "").lower())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Character-trigram Jaccard similarity of two normalized strings.
+    """
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+
+def _key(*parts: Any) -> int:
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def amount_bucket(amount: float) -> int:
+    return int(math.floor(math.log(max(amount, 0.0) + AMOUNT_BUCKET_OFFSET) / AMOUNT_BUCKET_WIDTH))
+
+
+class LineRecord:
+    """
+    Normalized view of one claim line, as stored and as probed.
+    """
+
+    __slots__ = ("claim_id", "line_id", "employee_id", "date", "category", "amount_cents",
+                 "currency", "vendor", "text", "receipt")
+
+    def __init__(self, claim: Dict[str, Any], line: Dict[str, Any]):
+        self.claim_id = str(claim["claim_id"])
+        self.line_id = str(line["line_id"])
+        self.employee_id = str(claim["employee"]["employee_id"])
+        self.date = str(line["date"])
+        self.category = str(line["category"])
+        self.amount_cents = int(round(float(line["amount"]) * 100))
+        self.currency = str(line.get("currency") or claim.get("currency") or "").upper()
+        self.vendor = normalize_name(line.get("vendor") or "")
+        self.text = normalize_name(f"{line.get('vendor') or ''} {line.get('description') or ''}")
+        self.receipt = normalize_receipt((line.get("receipt") or {}).get("receipt_id"))
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> "LineRecord":
+        # (claim_id, line_id, employee_id, date, category, amount_cents, currency, vendor, text, receipt)
+        r = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, row):
+            setattr(r, name, value)
+        return r
+
+    @property
+    def amount(self) -> float:
+        return self.amount_cents / 100.0
+
+    def exact_key(self) -> int:
+        return _key("x", self.employee_id, self.date, self.amount_cents, self.currency, self.vendor, self.receipt)
+
+    def receipt_key(self) -> Optional[int]:
+        return _key("r", self.employee_id, self.receipt) if self.receipt else None
+
+    def near_key(self, day: str, bucket: int) -> int:
+        return _key("n", self.employee_id, self.currency, self.category, day, bucket)
+
+    def stored_keys(self) -> List[int]:
+        keys = [self.exact_key(), self.near_key(self.date, amount_bucket(self.amount))]
+        if self.receipt:
+            keys.append(self.receipt_key())
+        return keys
+
+    def probe_keys(self, tolerance: float, window_days: int) -> List[int]:
+        lo, hi = amount_bucket(self.amount - tolerance), amount_bucket(self.amount + tolerance)
+        buckets = range(lo, min(hi, lo + MAX_AMOUNT_BUCKETS - 1) + 1)
+        d = parse_date(self.date)
+        days = [(d + timedelta(days=o)).isoformat() for o in range(-window_days, window_days + 1)]
+        return [self.near_key(day, b) for day in days for b in buckets]
+
+
+class DuplicateIndex:
+    """
+    SQLite-backed line history. `find` returns the strongest match per line of a
+    claim (lines of the same claim_id in history are ignored, so re-evaluating a
+    claim never matches itself); `record` stores or replaces a claim's lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lines ("
+            " id INTEGER PRIMARY KEY, claim_id TEXT NOT NULL, line_id TEXT NOT NULL,"
+            " employee_id TEXT NOT NULL, date TEXT NOT NULL, category TEXT NOT NULL,"
+            " amount_cents INTEGER NOT NULL, currency TEXT NOT NULL, vendor TEXT NOT NULL,"
+            " text TEXT NOT NULL, receipt TEXT NOT NULL, recorded_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lines_claim ON lines(claim_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS keys (key INTEGER NOT NULL, line INTEGER NOT NULL,"
+            " PRIMARY KEY (key, line)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self._conn.execute("INSERT INTO meta(key, value) VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+        elif row[0] != SCHEMA_VERSION:
+            raise RuntimeError(f"{path}: duplicate index schema {row[0]}, expected {SCHEMA_VERSION}; rebuild it")
+        self._conn.commit()
+        self.lookups = 0
+        self.matches = 0
+
+    def find(
+        self,
+        claim: Dict[str, Any],
+        amount_tolerance_pct: float = 0.02,
+        amount_tolerance_abs: float = 1.0,
+        date_window_days: int = 1,
+        min_similarity: float = 0.5,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        line_id -> {"kind": "exact" | "receipt" | "near", "match_claim_id", "match_line_id",
+        "match_date", "match_amount", "currency", "receipt_id", "similarity"}, for lines
+        that duplicate an earlier line of this claim or a recorded line of another claim.
+        """
+        records = [LineRecord(claim, ln) for ln in claim["lines"]]
+        found: Dict[str, Dict[str, Any]] = {}
+
+        # Lines repeated inside the claim itself.
+        first_by_exact: Dict[int, LineRecord] = {}
+        for r in records:
+            earlier = first_by_exact.setdefault(r.exact_key(), r)
+            if earlier is not r:
+                found[r.line_id] = self._match("exact", r, earlier, 1.0)
+
+        probes: List[Tuple[LineRecord, int, float, List[int]]] = []
+        all_keys = set()
+        for r in records:
+            if r.line_id in found:
+                continue
+            tolerance = max(amount_tolerance_abs, amount_tolerance_pct * r.amount)
+            keys = [r.exact_key()] + ([r.receipt_key()] if r.receipt else []) + r.probe_keys(tolerance, date_window_days)
+            probes.append((r, r.exact_key(), tolerance, keys))
+            all_keys.update(keys)
+        if not all_keys:
+            return found
+
+        with self._lock:
+            self.lookups += len(probes)
+            hits = self._conn.execute(
+                f"SELECT key, line FROM keys WHERE key IN ({','.join('?' * len(all_keys))})", list(all_keys)
+            ).fetchall()
+            lines_by_key: Dict[int, List[int]] = {}
+            for key, line in hits:
+                lines_by_key.setdefault(key, []).append(line)
+            ids = {line for _, line in hits}
+            rows = {}
+            if ids:
+                rows = {
+                    row[0]: row for row in self._conn.execute(
+                        "SELECT id, claim_id, line_id, employee_id, date, category, amount_cents, currency,"
+                        f" vendor, text, receipt FROM lines WHERE id IN ({','.join('?' * len(ids))})",
+                        list(ids),
+                    )
+                }
+
+        window = timedelta(days=date_window_days)
+        for r, exact_key, tolerance, keys in probes:
+            receipt_key = r.receipt_key()
+            best = None
+            for key in keys:
+                for line in lines_by_key.get(key, ()):
+                    row = rows.get(line)
+                    if row is None or row[1] == r.claim_id:
+                        continue
+                    kind = "exact" if key == exact_key else "receipt" if key == receipt_key else "near"
+                    score = 1.0
+                    if kind == "near":
+                        if abs(row[6] - r.amount_cents) / 100.0 > tolerance:
+                            continue
+                        if abs(parse_date(row[4]) - parse_date(r.date)) > window:
+                            continue
+                        score = similarity(r.text, row[9])
+                        if score < min_similarity:
+                            continue
+                    order = ("exact", "receipt", "near").index(kind)
+                    if best is None or (order, -score) < (best[0], -best[1]):
+                        best = (order, score, kind, row)
+            if best is not None:
+                _, score, kind, row = best
+                found[r.line_id] = {
+                    "kind": kind,
+                    "match_claim_id": row[1],
+                    "match_line_id": row[2],
+                    "match_date": row[4],
+                    "match_amount": row[6] / 100.0,
+                    "currency": row[7],
+                    "receipt_id": row[10],
+                    "similarity": round(score, 3),
+                }
+        self.matches += len(found)
+        return found
+
+    @staticmethod
+    def _match(kind: str, r: LineRecord, other: LineRecord, score: float) -> Dict[str, Any]:
+        return {
+            "kind": kind,
+            "match_claim_id": other.claim_id,
+            "match_line_id": other.line_id,
+            "match_date": other.date,
+            "match_amount": other.amount,
+            "currency": other.currency,
+            "receipt_id": other.receipt,
+            "similarity": score,
+        }
+
+    def _insert(self, records: Iterable[LineRecord], now: float) -> int:
+        n = 0
+        for r in records:
+            cur = self._conn.execute(
+                "INSERT INTO lines(claim_id, line_id, employee_id, date, category, amount_cents, currency,"
+                " vendor, text, receipt, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (r.claim_id, r.line_id, r.employee_id, r.date, r.category, r.amount_cents, r.currency,
+                 r.vendor, r.text, r.receipt, now),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO keys(key, line) VALUES (?, ?)",
+                [(k, cur.lastrowid) for k in r.stored_keys()],
+            )
+            n += 1
+        return n
+
+    def _delete_claim(self, claim_id: str) -> None:
+        ids = [row[0] for row in self._conn.execute("SELECT id FROM lines WHERE claim_id = ?", (claim_id,))]
+        if not ids:
+            return
+        marks = ",".join("?" * len(ids))
+        rows = self._conn.execute(
+            "SELECT id, claim_id, line_id, employee_id, date, category, amount_cents, currency, vendor, text,"
+            f" receipt FROM lines WHERE id IN ({marks})", ids,
+        ).fetchall()
+        stale = [(k, row[0]) for row in rows for k in LineRecord.from_row(row[1:]).stored_keys()]
+        self._conn.executemany("DELETE FROM keys WHERE key = ? AND line = ?", stale)
+        self._conn.execute(f"DELETE FROM lines WHERE id IN ({marks})", ids)
+
+    def record(self, claim: Dict[str, Any]) -> None:
+        """
+        Stores the claim's lines, replacing any earlier version of the same claim_id.
+        """
+        records = [LineRecord(claim, ln) for ln in claim["lines"]]
+        with self._lock:
+            self._delete_claim(str(claim["claim_id"]))
+            self._insert(records, time.time())
+            self._conn.commit()
+
+    def record_many(self, claims: Iterable[Dict[str, Any]], replace: bool = True) -> int:
+        """
+        Bulk load (one transaction). With replace=False, claims are assumed to be new,
+        which skips the per-claim delete. Returns the number of lines stored.
+        """
+        now = time.time()
+        n = 0
+        with self._lock:
+            for claim in claims:
+                if replace:
+                    self._delete_claim(str(claim["claim_id"]))
+                n += self._insert((LineRecord(claim, ln) for ln in claim["lines"]), now)
+            self._conn.commit()
+        return n
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM lines").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {"lookups": self.lookups, "matches": self.matches}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_index_lock = threading.Lock()
+_index: Optional[DuplicateIndex] = None
+
+
+def get_duplicate_index() -> Optional[DuplicateIndex]:
+    """
+    Process-wide index at DUPLICATE_INDEX_PATH, or None when DUPLICATE_CHECK_ENABLED is off.
+    """
+    global _index
+    if not settings.DUPLICATE_CHECK_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex(settings.DUPLICATE_INDEX_PATH)
+        return _index
@@ -0,0 +1,126 @@
+# Deterministic fast path: clean, low-risk claims are answered without the LLM.
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.rules.ruleset import get_ruleset
+
+
+def fast_path_check(claim: Dict[str, Any], deterministic: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    Applies the configured fast-path policy.
+    Returns (eligible, reason); reason explains why a claim was or was not eligible.
+    """
+    if not settings.FAST_PATH_ENABLED:
+        return False, "disabled"
+    if deterministic["decision"] != "APPROVE_RECOMMENDED":
+        return False, "deterministic_issues"
+    if any(lr["status"] != "COMPLIANT" for lr in deterministic["line_results"]):
+        return False, "non_compliant_line"
+    if not claim["lines"]:
+        return False, "no_lines"
+    if deterministic["claim_total"] > settings.FAST_PATH_MAX_TOTAL:
+        return False, "total_above_threshold"
+    if len(claim["lines"]) > settings.FAST_PATH_MAX_LINES:
+        return False, "too_many_lines"
+    excluded = {c.strip() for c in settings.FAST_PATH_EXCLUDED_CATEGORIES.split(",") if c.strip()}
+    if any(ln["category"] in excluded for ln in claim["lines"]):
+        return False, "excluded_category"
+    return True, "clean_low_risk"
+
+
+def fast_path_rule_ids(claim: Dict[str, Any], deterministic: Dict[str, Any]) -> List[str]:
+    """
+    Rule IDs that support approving this claim, in citation order: the general and
+    per-category cite_rule_ids of rules.json, then the approval route's rules.
+    """
+    ruleset = get_ruleset()
+    rule_ids = list(ruleset.general_cite_rule_ids)
+    threshold = float(ruleset.params["receipt_threshold_eur"])
+    if any(float(ln["amount"]) >= threshold for ln in claim["lines"]):
+        rule_ids.append("R-DOC-001")
+    for ln in claim["lines"]:
+        rule_ids.extend(ruleset.category_cite_rule_ids.get(ln["category"], []))
+    rule_ids.extend(ruleset.approval_rule_ids(deterministic["approval_route"]))
+    return list(dict.fromkeys(rule_ids))
+
+
+def build_fast_path_result(
+    claim: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    rule_lookup: Dict[str, Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Builds an LLM-shaped decision (decision, summary, lines, missing_info, citations)
+    from the deterministic result, with citations taken from the policy index metadata.
+    """
+    n = len(claim["lines"])
+    categories = ", ".join(sorted({ln["category"] for ln in claim["lines"]}))
+    route = " + ".join(r.title() for r in deterministic["approval_route"])
+    summary = (
+        f"All {n} line{'s' if n != 1 else ''} ({categories}) totalling "
+        f"{deterministic['claim_total']:.2f} {claim['currency']} pass the policy checks for "
+        f"submission deadline, receipts and category caps. Approval required from: {route}."
+    )
+
+    citations = []
+    for rid in fast_path_rule_ids(claim, deterministic):
+        meta: Optional[Dict[str, Any]] = rule_lookup.get(rid)
+        if meta:
+            citations.append({"rule_id": rid, **meta})
+
+    return {
+        "decision": "APPROVE_RECOMMENDED",
+        "summary": summary,
+        "lines": [
+            {"line_id": lr["line_id"], "status": "COMPLIANT", "issues": [], "suggested_fix": None}
+            for lr in deterministic["line_results"]
+        ],
+        "missing_info": [],
+        "citations": citations,
+    }
+
+
+def fallback_rule_ids(claim: Dict[str, Any], deterministic: Dict[str, Any]) -> List[str]:
+    """
+    Rule IDs behind the deterministic findings, followed by the rules that support
+    the compliant lines.
+    """
+    rule_ids = [rid for lr in deterministic["line_results"] for i in lr["issues"] for rid in i.get("rule_ids") or []]
+    rule_ids.extend(fast_path_rule_ids(claim, deterministic))
+    return list(dict.fromkeys(rule_ids))
+
+
+def build_fallback_result(
+    claim: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    rule_lookup: Dict[str, Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    LLM-shaped decision from the deterministic result alone, used when the LLM or
+    embedding provider is unavailable (timeouts, errors, open circuit breaker).
+    """
+    n_issues = sum(len(lr["issues"]) for lr in deterministic["line_results"])
+    route = " + ".join(r.title() for r in deterministic["approval_route"])
+    summary = (
+        "Automated policy review is temporarily unavailable; this result reflects the "
+        f"deterministic policy checks only ({n_issues} issue{'s' if n_issues != 1 else ''} found "
+        f"on {len(claim['lines'])} line{'s' if len(claim['lines']) != 1 else ''}). "
+        f"Approval required from: {route}."
+    )
+
+    citations = []
+    for rid in fallback_rule_ids(claim, deterministic):
+        meta: Optional[Dict[str, Any]] = rule_lookup.get(rid)
+        if meta:
+            citations.append({"rule_id": rid, **meta})
+
+    return {
+        "decision": deterministic["decision"],
+        "summary": summary,
+        "lines": [
+            {"line_id": lr["line_id"], "status": lr["status"], "issues": lr["issues"], "suggested_fix": None}
+            for lr in deterministic["line_results"]
+        ],
+        "missing_info": list(deterministic["missing_info"]),
+        "citations": citations,
+    }
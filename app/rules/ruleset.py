@@ -0,0 +1,308 @@
+# Declarative policy rules (data/policies/rules.json) compiled into per-category checkers.
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, get_args
+
+from app.core.config import settings
+from app.rag.splitter import RULE_ID_RE
+from app.schemas.claim import Category
+
+CATEGORIES: List[str] = list(get_args(Category))
+
+# check(line, amount, receipt_provided, submission_date) -> message variables, or None if the line passes
+Check = Callable[[Dict[str, Any], float, bool, date], Optional[Dict[str, Any]]]
+
+
+@lru_cache(maxsize=8192)
+def parse_date(s: str) -> date:
+    # Claim dates repeat heavily (one submission date, few expense dates), so parses are memoized.
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+
+def _late_submission(args: Dict[str, Any]) -> Check:
+    max_days = int(args["max_days"])
+
+    def check(ln, amount, receipt, submitted):
+        days_late = (submitted - parse_date(ln["date"])).days
+        if days_late > max_days:
+            return {"days_late": days_late, "max_days": max_days}
+        return None
+    return check
+
+
+def _receipt_required(args: Dict[str, Any]) -> Check:
+    min_amount = float(args.get("min_amount", 0))
+
+    def check(ln, amount, receipt, submitted):
+        if amount >= min_amount and not receipt:
+            return {"min_amount": min_amount, "amount": amount}
+        return None
+    return check
+
+
+def _meal_cap(args: Dict[str, Any]) -> Check:
+    caps = {k: float(v) for k, v in args["caps"].items()}
+    default = caps["OTHER"]
+
+    def check(ln, amount, receipt, submitted):
+        meal_type = ln.get("meal_type") or "OTHER"
+        cap = caps.get(meal_type, default)
+        if amount > cap:
+            return {"amount": amount, "cap": cap, "meal_type": meal_type}
+        return None
+    return check
+
+
+def _cap_without_preapproval(args: Dict[str, Any]) -> Check:
+    cap = float(args["cap"])
+
+    def check(ln, amount, receipt, submitted):
+        if amount > cap and not (ln.get("preapproval") or {}).get("provided", False):
+            return {"amount": amount, "cap": cap}
+        return None
+    return check
+
+
+def _attendees_required(args: Dict[str, Any]) -> Check:
+    def check(ln, amount, receipt, submitted):
+        return {} if not ln.get("attendees") else None
+    return check
+
+
+def _mileage_km_required(args: Dict[str, Any]) -> Check:
+    def check(ln, amount, receipt, submitted):
+        return {} if (ln.get("mileage") or {}).get("km", None) is None else None
+    return check
+
+
+def _mileage_rate(args: Dict[str, Any]) -> Check:
+    rate = float(args["rate"])
+    tolerance = float(args["tolerance"])
+
+    def check(ln, amount, receipt, submitted):
+        km = (ln.get("mileage") or {}).get("km", None)
+        if km is None:
+            return None
+        expected = float(km) * rate
+        if abs(amount - expected) > tolerance:
+            return {"amount": amount, "expected": expected}
+        return None
+    return check
+
+
+# Check kinds usable in rules.json; each builds a checker closure from its args.
+CHECKS: Dict[str, Callable[[Dict[str, Any]], Check]] = {
+    "late_submission": _late_submission,
+    "receipt_required": _receipt_required,
+    "meal_cap": _meal_cap,
+    "cap_without_preapproval": _cap_without_preapproval,
+    "attendees_required": _attendees_required,
+    "mileage_km_required": _mileage_km_required,
+    "mileage_rate": _mileage_rate,
+}
+
+
+class LineRule:
+    """
+    One compiled line-level rule: the checker closure plus the issue it reports.
+    """
+
+    def __init__(self, spec: Dict[str, Any], args: Dict[str, Any]):
+        self.code: str = spec["code"]
+        self.rule_ids: List[str] = list(spec.get("rule_ids") or [])
+        self.kind: str = spec["check"]
+        self.args = args
+        cats = spec.get("categories", "*")
+        self.categories: Optional[List[str]] = None if cats == "*" else list(cats)
+        self.message: str = spec["message"]
+        self.missing_info: Optional[str] = spec.get("missing_info")
+        self.check: Check = CHECKS[self.kind](args)
+
+    def issue(self, found: Dict[str, Any], line_id: str) -> Dict[str, Any]:
+        return {
+            "code": self.code,
+            "message": self.message.format(line_id=line_id, **found),
+            "rule_ids": list(self.rule_ids),
+        }
+
+
+class DuplicateRule:
+    """
+    Issue reported when the duplicate index (app/rules/duplicates.py) matches a line.
+    `match` is the match kind it covers: "exact", "receipt" or "near".
+    """
+
+    KINDS = ("exact", "receipt", "near")
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.code: str = spec["code"]
+        self.rule_ids: List[str] = list(spec.get("rule_ids") or [])
+        self.match: str = spec["match"]
+        self.message: str = spec["message"]
+        self.missing_info: Optional[str] = spec.get("missing_info")
+
+    def issue(self, found: Dict[str, Any], line_id: str) -> Dict[str, Any]:
+        return {
+            "code": self.code,
+            "message": self.message.format(line_id=line_id, **found),
+            "rule_ids": list(self.rule_ids),
+        }
+
+
+class RuleSet:
+    """
+    Compiled rules.json. Line rules are pre-dispatched by category, so a line only
+    runs the checks that apply to its category, in declaration order.
+    """
+
+    def __init__(self, spec: Dict[str, Any], source: str = ""):
+        self.source = source
+        self.version = hashlib.sha256(
+            json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()[:12]
+        self.params: Dict[str, Any] = dict(spec.get("params") or {})
+
+        self.line_rules: List[LineRule] = []
+        for r in spec.get("line_rules") or []:
+            if r.get("check") not in CHECKS:
+                raise ValueError(f"Rule {r.get('code')}: unknown check '{r.get('check')}'")
+            for cat in ([] if r.get("categories", "*") == "*" else r["categories"]):
+                if cat not in CATEGORIES:
+                    raise ValueError(f"Rule {r['code']}: unknown category '{cat}'")
+            self.line_rules.append(LineRule(r, self._resolve(r.get("args") or {})))
+
+        self._general = [r for r in self.line_rules if r.categories is None]
+        self.by_category: Dict[str, List[LineRule]] = {
+            cat: [r for r in self.line_rules if r.categories is None or cat in r.categories]
+            for cat in CATEGORIES
+        }
+
+        self.duplicate_rules: Dict[str, DuplicateRule] = {}
+        for d in spec.get("duplicate_rules") or []:
+            if d.get("match") not in DuplicateRule.KINDS:
+                raise ValueError(f"Rule {d.get('code')}: unknown duplicate match '{d.get('match')}'")
+            self.duplicate_rules[d["match"]] = DuplicateRule(d)
+
+        self.approval_rules: List[Dict[str, Any]] = []
+        for a in spec.get("approval_rules") or []:
+            over = a.get("claim_total_over")
+            self.approval_rules.append({
+                "role": a["role"],
+                "rule_ids": list(a.get("rule_ids") or []),
+                "claim_total_over": None if over is None else float(self._resolve_value(over)),
+            })
+
+        # Rules cited when approving compliant lines: "*" for every claim, then per category.
+        cite = dict(spec.get("cite_rule_ids") or {})
+        for cat in cite:
+            if cat != "*" and cat not in CATEGORIES:
+                raise ValueError(f"cite_rule_ids: unknown category '{cat}'")
+        self.general_cite_rule_ids: List[str] = list(cite.get("*") or [])
+        self.category_cite_rule_ids: Dict[str, List[str]] = {
+            cat: list(cite.get(cat) or []) for cat in CATEGORIES
+        }
+
+    def _resolve_value(self, v: Any) -> Any:
+        # "$name" refers to a shared entry in "params".
+        if isinstance(v, str) and v.startswith("$"):
+            if v[1:] not in self.params:
+                raise ValueError(f"Unknown rule parameter '{v}'")
+            return self.params[v[1:]]
+        return v
+
+    def _resolve(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: self._resolve_value(v) for k, v in args.items()}
+
+    def rules_for(self, category: str) -> List[LineRule]:
+        return self.by_category.get(category, self._general)
+
+    def approval_route(self, claim_total: float) -> List[str]:
+        return [
+            a["role"] for a in self.approval_rules
+            if a["claim_total_over"] is None or claim_total > a["claim_total_over"]
+        ]
+
+    def approval_rule_ids(self, route: List[str]) -> List[str]:
+        return [rid for a in self.approval_rules if a["role"] in route for rid in a["rule_ids"]]
+
+    def rule_ids(self) -> List[str]:
+        ids = [rid for r in self.line_rules for rid in r.rule_ids]
+        ids += [rid for d in self.duplicate_rules.values() for rid in d.rule_ids]
+        ids += [rid for a in self.approval_rules for rid in a["rule_ids"]]
+        ids += self.general_cite_rule_ids
+        ids += [rid for rids in self.category_cite_rule_ids.values() for rid in rids]
+        return list(dict.fromkeys(ids))
+
+
+def _rulebook_rule_ids(rules_path: str) -> set:
+    ids = set()
+    for path in glob.glob(os.path.join(os.path.dirname(rules_path) or ".", "*.md")):
+        with open(path, "r", encoding="utf-8") as f:
+            ids.update(RULE_ID_RE.findall(f.read()))
+    return ids
+
+
+def load_ruleset(path: str = None) -> RuleSet:
+    path = path or settings.RULES_PATH
+    with open(path, "r", encoding="utf-8") as f:
+        ruleset = RuleSet(json.load(f), source=path)
+    known = _rulebook_rule_ids(path)
+    unknown = [rid for rid in ruleset.rule_ids() if known and rid not in known]
+    if unknown:
+        print(f"[WARN] {path} references rule IDs not in the rulebook: {', '.join(unknown)}")
+    return ruleset
+
+
+_lock = threading.Lock()
+_current: Optional[RuleSet] = None
+_mtime: Optional[int] = None
+_checked_at = 0.0
+
+
+def get_ruleset() -> RuleSet:
+    """
+    Current compiled rules. The file is re-checked at most every
+    RULES_RELOAD_SECONDS and recompiled when it changes. A broken edit is
+    reported and the previous rules stay in force.
+    """
+    global _current, _mtime, _checked_at
+    now = time.monotonic()
+    if _current is not None and now - _checked_at < settings.RULES_RELOAD_SECONDS:
+        return _current
+    with _lock:
+        if _current is not None and now - _checked_at < settings.RULES_RELOAD_SECONDS:
+            return _current
+        _checked_at = now
+        try:
+            mtime = os.stat(settings.RULES_PATH).st_mtime_ns
+        except OSError:
+            if _current is None:
+                raise
+            return _current
+        if _current is None or mtime != _mtime:
+            try:
+                _current = load_ruleset(settings.RULES_PATH)
+                if _mtime is not None:
+                    print(f"[OK] Reloaded rules from {settings.RULES_PATH} (version {_current.version})")
+            except Exception as e:
+                if _current is None:
+                    raise
+                print(f"[WARN] Keeping previous rules; {settings.RULES_PATH} failed to compile: {e}")
+            _mtime = mtime
+        return _current
+
+
+def reload_rules() -> RuleSet:
+    """
+    Forces a re-check of the rules file on the next access and returns the result.
+    """
+    global _checked_at
+    with _lock:
+        _checked_at = float("-inf")
+    return get_ruleset()
@@ -68,3 +68,6 @@ class Claim(BaseModel):
     employee: Employee
     trip: Optional[Trip] = None
     lines: List[Line]
+    # Named policy index to evaluate against (e.g. a legal entity or policy version);
+    # defaults to DEFAULT_POLICY_INDEX.
+    policy_index: Optional[str] = None
@@ -0,0 +1,127 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.schemas.claim import Claim
+from app.rag.registry import IndexRegistry
+from app.rag.retriever import PolicyRetriever
+from app.services.decision_cache import DecisionCache
+from app.services.evaluation import RetrievalMemo, evaluate_coalesced, resolve_retriever
+
+# Items fed to evaluate_batch: (position in the batch, raw claim object or a parse error message)
+BatchItem = Tuple[int, Union[Dict[str, Any], str]]
+
+
+def _error(index: int, claim_id: Any, status_code: int, detail: Any) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "claim_id": claim_id,
+        "status": "error",
+        "error": {"status_code": status_code, "detail": detail},
+    }
+
+
+async def _evaluate_item(
+    index: int,
+    raw: Union[Dict[str, Any], str],
+    registry: IndexRegistry,
+    client: AsyncOpenAI,
+    memos: Dict[PolicyRetriever, RetrievalMemo],
+    decision_cache: Optional[DecisionCache] = None,
+) -> Dict[str, Any]:
+    """
+    Evaluates one batch item. Failures are returned as error records so one bad
+    claim never aborts the rest of the batch.
+    """
+    if isinstance(raw, str):
+        return _error(index, None, 400, raw)
+
+    claim_id = raw.get("claim_id") if isinstance(raw, dict) else None
+    try:
+        claim = Claim.model_validate(raw)
+    except ValidationError as e:
+        return _error(index, claim_id, 422, e.errors(include_url=False, include_context=False))
+
+    try:
+        retriever = resolve_retriever(registry, claim.policy_index)
+        memo = memos.get(retriever)
+        if memo is None:
+            memo = memos[retriever] = RetrievalMemo(retriever)
+        with registry.hold(retriever):
+            result = await evaluate_coalesced(
+                claim.model_dump(), retriever, client, memo=memo, decision_cache=decision_cache
+            )
+    except HTTPException as e:
+        return _error(index, claim_id, e.status_code, e.detail)
+    except Exception as e:
+        return _error(index, claim_id, 500, f"{type(e).__name__}: {e}")
+
+    return {
+        "index": index,
+        "claim_id": claim.claim_id,
+        "status": "ok",
+        "result": result.model_dump(),
+    }
+
+
+async def evaluate_batch(
+    items: AsyncIterator[BatchItem],
+    registry: IndexRegistry,
+    client: AsyncOpenAI,
+    concurrency: int = None,
+    decision_cache: Optional[DecisionCache] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Evaluates claims from `items` with at most `concurrency` evaluations in flight
+    and yields one record per claim as soon as it completes (completion order, not
+    input order; each record carries its `index`). `items` is consumed lazily while
+    earlier claims are still being evaluated. Claims evaluated against the same
+    index version share one RetrievalMemo.
+    """
+    limit = max(1, min(concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY))
+    sem = asyncio.Semaphore(limit)
+    memos: Dict[PolicyRetriever, RetrievalMemo] = {}
+    results: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def run(index: int, raw: Union[Dict[str, Any], str]) -> None:
+        try:
+            await results.put(await _evaluate_item(index, raw, registry, client, memos, decision_cache))
+        finally:
+            sem.release()
+
+    async def feed() -> None:
+        tasks = set()
+        try:
+            async for index, raw in items:
+                await sem.acquire()
+                task = asyncio.create_task(run(index, raw))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except Exception as e:
+            await results.put(_error(-1, None, 400, f"Failed to read batch input: {e}"))
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            # Only non-empty when the consumer went away (e.g. client disconnect).
+            for task in list(tasks):
+                task.cancel()
+            await results.put(done)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            record = await results.get()
+            if record is done:
+                break
+            yield record
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import LRUCache, SQLiteKVStore
+from app.core.config import settings
+from app.core.serialization import canonical_json
+
+
+def decision_cache_key(
+    claim: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    excerpt_ids: List[int],
+    model: str,
+    index_version: str,
+    prompt_version: str,
+) -> str:
+    """
+    Content address of one LLM decision: everything that determines the prompt
+    (including the prompt template version) and the model that answers it.
+    """
+    payload = {
+        "claim": claim,
+        "deterministic": deterministic,
+        "excerpt_ids": list(excerpt_ids),
+        "model": model,
+        "index_version": index_version,
+        "prompt_version": prompt_version,
+    }
+    return hashlib.sha256(canonical_json(payload).encode("utf-8")).hexdigest()
+
+
+class MemoryDecisionBackend:
+    """
+    In-process LRU backend (per worker, lost on restart). Values are stored
+    serialized so callers can mutate what they get back.
+    """
+
+    blocking = False
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._lru = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._index_version: Optional[str] = None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self._lru.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._lru.set(key, canonical_json(value))
+
+    def get_index_version(self) -> Optional[str]:
+        return self._index_version
+
+    def set_index_version(self, version: str) -> None:
+        self._index_version = version
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+
+class SQLiteDecisionBackend:
+    """
+    SQLite file backend on local disk, shared by workers on the same host and
+    kept across restarts.
+    """
+
+    # File I/O: async callers go through a worker thread.
+    blocking = True
+
+    def __init__(self, path: str, max_rows: int, ttl_seconds: float):
+        self._store = SQLiteKVStore(path, max_rows=max_rows, ttl_seconds=ttl_seconds)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self._store.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._store.set(key, canonical_json(value).encode("utf-8"))
+
+    def get_index_version(self) -> Optional[str]:
+        return self._store.get_meta("index_version")
+
+    def set_index_version(self, version: str) -> None:
+        self._store.set_meta("index_version", version)
+
+    def clear(self) -> None:
+        self._store.clear()
+
+
+class DecisionCache:
+    """
+    Content-addressed cache of parsed LLM decisions. The whole cache is dropped
+    whenever it is bound to a different policy index version (re-ingestion).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def bind_index(self, index_version: str) -> None:
+        if self.backend.get_index_version() != index_version:
+            self.backend.clear()
+            self.backend.set_index_version(index_version)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.backend.set(key, value)
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def build_decision_cache() -> Optional[DecisionCache]:
+    """
+    Creates the cache configured by DECISION_CACHE_BACKEND ("memory", "sqlite" or "none").
+    """
+    kind = settings.DECISION_CACHE_BACKEND.lower()
+    if kind in ("", "none", "off"):
+        return None
+    if kind == "memory":
+        backend = MemoryDecisionBackend(settings.DECISION_CACHE_SIZE, settings.DECISION_CACHE_TTL_SECONDS)
+    elif kind == "sqlite":
+        backend = SQLiteDecisionBackend(
+            settings.DECISION_CACHE_PATH, settings.DECISION_CACHE_SIZE, settings.DECISION_CACHE_TTL_SECONDS
+        )
+    else:
+        raise RuntimeError(f"Unknown DECISION_CACHE_BACKEND '{settings.DECISION_CACHE_BACKEND}'")
+    return DecisionCache(backend)
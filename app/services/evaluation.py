@@ -0,0 +1,567 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+from app.core import metrics, transport
+from app.core.config import settings
+from app.core.serialization import canonical_json
+from app.core.singleflight import SingleFlight
+from app.schemas.response import EvaluateResponse
+from app.rules.duplicates import get_duplicate_index
+from app.rules.rule_engine import evaluate_claim
+from app.rules.fast_path import (
+    build_fallback_result,
+    build_fast_path_result,
+    fallback_rule_ids,
+    fast_path_check,
+    fast_path_rule_ids,
+)
+from app.rag.profiles import GENERAL_PROFILE, GENERAL_QUERY, line_profile
+from app.rag.registry import IndexRegistry
+from app.rag.retriever import PolicyRetriever
+from app.rag.prompts import PROMPT_VERSION, build_messages, pack_excerpts
+from app.services.decision_cache import DecisionCache, decision_cache_key
+
+
+def line_query(ln: Dict[str, Any]) -> str:
+    return (
+        f"Rules for category={ln['category']}, amount={ln['amount']} {ln['currency']}, "
+        f"vendor={ln['vendor']}, desc={ln['description']}"
+    )
+
+
+def build_queries(claim_dict: Dict[str, Any]) -> List[str]:
+    """
+    One general policy query plus one query per claim line, capped at RAG_MAX_QUERIES.
+    """
+    queries: List[str] = [GENERAL_QUERY] + [line_query(ln) for ln in claim_dict["lines"]]
+    return queries[:settings.RAG_MAX_QUERIES]
+
+
+def plan_retrieval(claim_dict: Dict[str, Any], retriever: PolicyRetriever) -> Tuple[List[str], List[str]]:
+    """
+    (profile keys, live queries) for a claim. The general query and each line's
+    category / meal-type are served from profiles precomputed at ingest when the
+    index has them; only lines without one are searched live (embedding call),
+    unless RAG_FREE_TEXT_ENRICHMENT adds every line's free-text query.
+    """
+    if not retriever.profiles:
+        return [], build_queries(claim_dict)
+    profiles: List[str] = []
+    queries: List[str] = []
+    if GENERAL_PROFILE in retriever.profiles:
+        profiles.append(GENERAL_PROFILE)
+    else:
+        queries.append(GENERAL_QUERY)
+    for ln in claim_dict["lines"]:
+        key = line_profile(ln)
+        if key in retriever.profiles:
+            profiles.append(key)
+            if not settings.RAG_FREE_TEXT_ENRICHMENT:
+                continue
+        queries.append(line_query(ln))
+    return list(dict.fromkeys(profiles)), queries[:settings.RAG_MAX_QUERIES]
+
+
+def select_excerpts(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    De-duplicates near-identical excerpts, keeping retrieval (best-first) order.
+    Context size is bounded later by the prompt token budget (pack_excerpts).
+    """
+    merged = []
+    seen = set()
+    for hit in hits:
+        key = (hit["source_path"], hit["section_title"], hit["text"][:120])
+        if key not in seen:
+            seen.add(key)
+            merged.append(hit)
+    return merged
+
+
+class RetrievalMemo:
+    """
+    Shares retrieval results per query string across the claims of one batch.
+    Concurrent claims asking for the same query await the same future, so each
+    distinct query is embedded and searched once per batch.
+    """
+
+    def __init__(self, retriever: PolicyRetriever, top_k: int = None):
+        self.retriever = retriever
+        self.top_k = top_k or settings.RAG_TOP_K
+        self._results: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def search_many(self, queries: List[str]) -> List[Dict[str, Any]]:
+        queries = [q for q in dict.fromkeys(queries) if q]
+        loop = asyncio.get_running_loop()
+
+        new = [q for q in queries if q not in self._results]
+        self.hits += len(queries) - len(new)
+        self.misses += len(new)
+        for q in new:
+            self._results[q] = loop.create_future()
+
+        if new:
+            try:
+                rows = await self.retriever.asearch_each(new, top_k=self.top_k)
+            except BaseException as e:
+                # Forget failed queries so later claims retry them.
+                for q in new:
+                    fut = self._results.pop(q)
+                    if isinstance(e, asyncio.CancelledError):
+                        fut.cancel()
+                    else:
+                        fut.set_exception(e)
+                        fut.exception()  # mark retrieved; the error is raised below
+                raise
+            for q, hits in zip(new, rows):
+                self._results[q].set_result(hits)
+
+        hit_lists = await asyncio.gather(*[self._results[q] for q in queries])
+        return PolicyRetriever.merge_hits(list(hit_lists))
+
+
+async def retrieve_excerpts(
+    retriever: PolicyRetriever,
+    queries: List[str],
+    memo: Optional[RetrievalMemo] = None,
+    profiles: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Hits for precomputed `profiles` (local reads) merged with live search for
+    `queries`, then de-duplicated and re-ranked.
+    """
+    with metrics.span("retrieval"):
+        hit_lists = retriever.profile_hits(profiles, top_k=settings.RAG_TOP_K) if profiles else []
+        if queries:
+            if memo is not None:
+                hit_lists.append(await memo.search_many(queries))
+            else:
+                hit_lists.append(await retriever.asearch_many(queries, top_k=settings.RAG_TOP_K))
+        metrics.RETRIEVAL_QUERIES.inc(len(profiles or []), "profile")
+        metrics.RETRIEVAL_QUERIES.inc(len(queries), "live")
+        hits = PolicyRetriever.merge_hits(hit_lists)
+        with metrics.span("rerank"):
+            excerpts = retriever.rerank(select_excerpts(hits))
+    if excerpts:
+        metrics.RETRIEVAL_SCORES.observe(excerpts[0]["score"], "top")
+    for ex in excerpts:
+        metrics.RETRIEVAL_SCORES.observe(ex["score"], "selected")
+    return excerpts
+
+
+def usage_stats(completion: Any) -> Dict[str, Any]:
+    """
+    Provider-reported token usage, including prompt tokens served from its cache.
+    """
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "cached_tokens": getattr(details, "cached_tokens", None) if details is not None else None,
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+
+def _used_tokens(usage: Dict[str, Any]) -> int:
+    return (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+
+
+async def call_llm(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, str]],
+    est_tokens: int = 0,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Chat Completions call (compatible with SDK builds without `client.responses`)
+    through the LLM transport stage (deadline, retries, hedging, breaker, TPM limit)
+    and JSON parsing of the model output. Returns (parsed output, usage).
+    `est_tokens` (local prompt count) is reserved against LLM_TPM_LIMIT up front.
+    """
+    with metrics.span("llm"):
+        try:
+            completion = await transport.LLM.call(
+                lambda timeout: client.chat.completions.create(
+                    model=settings.OPENAI_CHAT_MODEL,
+                    messages=messages,
+                    temperature=0,
+                    timeout=timeout,
+                ),
+                tokens=est_tokens,
+            )
+        except Exception:
+            metrics.LLM_CALLS.inc(1, "error")
+            raise
+    metrics.LLM_CALLS.inc(1, "ok")
+    usage = usage_stats(completion)
+    transport.LLM.settle(est_tokens, _used_tokens(usage))
+    metrics.record_llm_usage(usage)
+    return parse_llm_output(completion.choices[0].message.content), usage
+
+
+async def call_llm_stream(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, str]],
+    usage: Dict[str, Any],
+    est_tokens: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of call_llm: yields content deltas as the model generates them.
+    Provider usage (sent with the last chunk) is written into `usage`. Retries and the
+    stage deadline cover opening the stream; it is never hedged, and it holds an
+    LLM_MAX_CONCURRENCY slot until fully consumed.
+    """
+    # The span covers generation time, including time the consumer spends between deltas.
+    with metrics.span("llm"):
+        try:
+            async with transport.LLM.open_stream(
+                lambda timeout: client.chat.completions.create(
+                    model=settings.OPENAI_CHAT_MODEL,
+                    messages=messages,
+                    temperature=0,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=timeout,
+                ),
+                tokens=est_tokens,
+            ) as stream:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage.update(usage_stats(chunk))
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except Exception:
+            metrics.LLM_CALLS.inc(1, "error")
+            raise
+    metrics.LLM_CALLS.inc(1, "ok")
+    transport.LLM.settle(est_tokens, _used_tokens(usage))
+    metrics.record_llm_usage(usage)
+
+
+def parse_llm_output(out_text: Optional[str]) -> Dict[str, Any]:
+    if not out_text:
+        raise HTTPException(status_code=500, detail="OpenAI returned empty content")
+    try:
+        with metrics.span("parse"):
+            return json.loads(out_text)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"LLM did not return valid JSON. Error: {e}. Raw output: {out_text[:1000]}",
+        )
+
+
+def enrich_citations(parsed: Dict[str, Any], policy_excerpts: List[Dict[str, Any]]) -> None:
+    """
+    Fills section_title/source_path on citations from the retrieved excerpts (best-effort).
+    """
+    rule_to_meta = {}
+    for ex in policy_excerpts:
+        for rid in ex.get("rule_ids") or []:
+            rule_to_meta.setdefault(
+                rid,
+                {
+                    "section_title": ex.get("section_title"),
+                    "source_path": ex.get("source_path"),
+                },
+            )
+
+    for c in parsed.get("citations", []) or []:
+        rid = c.get("rule_id")
+        meta = rule_to_meta.get(rid)
+        if meta:
+            c.setdefault("section_title", meta.get("section_title"))
+            c.setdefault("source_path", meta.get("source_path"))
+
+
+def compose_response(
+    parsed: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    policy_excerpts: List[Dict[str, Any]],
+    debug_extra: Optional[Dict[str, Any]] = None,
+) -> EvaluateResponse:
+    """
+    Builds the ERP-safe response via the Pydantic model.
+    """
+    debug = {
+        "deterministic": deterministic,
+        "rag_excerpts_used": len(policy_excerpts),
+    }
+    debug.update(debug_extra or {})
+    try:
+        with metrics.span("validation"):
+            return EvaluateResponse(
+                decision=parsed["decision"],
+                summary=parsed["summary"],
+                approval_route=deterministic["approval_route"],
+                claim_total=deterministic["claim_total"],
+                lines=parsed["lines"],
+                missing_info=parsed.get("missing_info", []),
+                citations=parsed.get("citations", []),
+                debug=debug,
+            )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to validate response against EvaluateResponse schema: {e}",
+        )
+
+
+def resolve_retriever(registry: IndexRegistry, name: Optional[str]) -> PolicyRetriever:
+    """
+    Current retriever for a claim's `policy_index` (None = default), as an HTTP error
+    if the name is unknown or that index is not loaded.
+    """
+    try:
+        retriever = registry.get(name)
+    except KeyError:
+        raise HTTPException(status_code=422, detail=f"Unknown policy_index '{name}'")
+    if retriever is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Policy index not found or retriever not initialized. Run: python -m scripts.ingest_policies",
+        )
+    return retriever
+
+
+def fast_path_response(
+    claim_dict: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    retriever: PolicyRetriever,
+    reason: str,
+) -> EvaluateResponse:
+    rule_lookup = retriever.lookup_rules(fast_path_rule_ids(claim_dict, deterministic))
+    parsed = build_fast_path_result(claim_dict, deterministic, rule_lookup)
+    return compose_response(parsed, deterministic, [], {
+        "path": "fast_path",
+        "fast_path_reason": reason,
+        "policy_index": retriever.name,
+        "index_version": retriever.index_version,
+    })
+
+
+def fallback_response(
+    claim_dict: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    retriever: PolicyRetriever,
+    error: Exception,
+) -> EvaluateResponse:
+    """
+    Deterministic answer when the provider is unavailable (debug.path = "fallback"),
+    or a 503 when LLM_FALLBACK_ENABLED is off.
+    """
+    reason = f"{type(error).__name__}: {error}"
+    if not settings.LLM_FALLBACK_ENABLED:
+        raise HTTPException(status_code=503, detail=f"LLM provider unavailable ({reason})")
+    print(f"[WARN] Deterministic fallback for claim {claim_dict.get('claim_id')}: {reason}")
+    rule_lookup = retriever.lookup_rules(fallback_rule_ids(claim_dict, deterministic))
+    parsed = build_fallback_result(claim_dict, deterministic, rule_lookup)
+    return compose_response(parsed, deterministic, [], {
+        "path": "fallback",
+        "fallback_reason": reason,
+        "policy_index": retriever.name,
+        "index_version": retriever.index_version,
+    })
+
+
+def llm_debug(
+    retriever: PolicyRetriever,
+    fast_path_reason: str,
+    excerpts_dropped: int,
+    profiles: List[str],
+    queries: List[str],
+) -> Dict[str, Any]:
+    return {
+        "path": "llm",
+        "fast_path_reason": fast_path_reason,
+        "policy_index": retriever.name,
+        "index_version": retriever.index_version,
+        "rag_excerpts_dropped": excerpts_dropped,
+        "retrieval_profiles": profiles,
+        "retrieval_live_queries": len(queries),
+    }
+
+
+async def lookup_decision(
+    decision_cache: Optional[DecisionCache],
+    claim_dict: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    policy_excerpts: List[Dict[str, Any]],
+    retriever: PolicyRetriever,
+    debug_extra: Dict[str, Any],
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Cached LLM decision for these inputs, if any. Returns (parsed or None, cache key);
+    the key is None when caching is off. Records hit/miss in debug_extra.
+    """
+    if decision_cache is None:
+        return None, None
+    cache_key = decision_cache_key(
+        claim_dict,
+        deterministic,
+        [ex["chunk_id"] for ex in policy_excerpts],
+        settings.OPENAI_CHAT_MODEL,
+        retriever.index_version,
+        PROMPT_VERSION,
+    )
+    parsed = await decision_cache.aget(cache_key)
+    debug_extra["decision_cache"] = "hit" if parsed is not None else "miss"
+    return parsed, cache_key
+
+
+def finish_evaluation(response: EvaluateResponse, timings: Dict[str, float], started: float) -> EvaluateResponse:
+    """
+    Counts the evaluation and, with DEBUG_TIMINGS, adds the per-stage breakdown
+    (milliseconds) as debug.timings_ms.
+    """
+    debug = response.debug or {}
+    metrics.EVALUATIONS.inc(1, str(debug.get("path", "llm")))
+    if settings.DEBUG_TIMINGS:
+        breakdown = {stage: round(ms, 3) for stage, ms in timings.items()}
+        breakdown["total"] = round((time.perf_counter() - started) * 1000, 3)
+        debug["timings_ms"] = breakdown
+        response.debug = debug
+    return response
+
+
+async def run_rules(claim_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Deterministic rules, including the R-GEN-004 duplicate lookup (SQLite, so it runs
+    in a worker thread when the index is enabled).
+    """
+    duplicates = get_duplicate_index()
+    with metrics.span("rules"):
+        if duplicates is None:
+            return evaluate_claim(claim_dict)
+        return await asyncio.to_thread(evaluate_claim, claim_dict, None, duplicates)
+
+
+async def record_claim(claim_dict: Dict[str, Any]) -> None:
+    """
+    Adds an evaluated claim to the duplicate index (DUPLICATE_RECORD_ENABLED). Called
+    once a response has been produced; a failure here never fails the evaluation.
+    """
+    duplicates = get_duplicate_index()
+    if duplicates is None or not settings.DUPLICATE_RECORD_ENABLED:
+        return
+    try:
+        with metrics.span("duplicates_record"):
+            await asyncio.to_thread(duplicates.record, claim_dict)
+    except Exception as e:
+        print(f"[WARN] Recording claim {claim_dict.get('claim_id')} in the duplicate index failed: {e}")
+
+
+async def llm_response(
+    claim_dict: Dict[str, Any],
+    deterministic: Dict[str, Any],
+    retriever: PolicyRetriever,
+    client: AsyncOpenAI,
+    fast_path_reason: str,
+    memo: Optional[RetrievalMemo] = None,
+    decision_cache: Optional[DecisionCache] = None,
+) -> EvaluateResponse:
+    """
+    Retrieval, LLM decision (or decision-cache hit) and validation; the deterministic
+    fallback when the provider is unavailable.
+    """
+    try:
+        profiles, queries = plan_retrieval(claim_dict, retriever)
+        hits = await retrieve_excerpts(retriever, queries, memo, profiles)
+        with metrics.span("prompt"):
+            policy_excerpts, dropped = pack_excerpts(hits)
+
+        debug_extra = llm_debug(retriever, fast_path_reason, dropped, profiles, queries)
+        parsed, cache_key = await lookup_decision(
+            decision_cache, claim_dict, deterministic, policy_excerpts, retriever, debug_extra
+        )
+
+        if parsed is None:
+            with metrics.span("prompt"):
+                messages, prompt_tokens = build_messages(claim_dict, deterministic, policy_excerpts)
+            debug_extra["prompt_tokens"] = prompt_tokens
+            parsed, debug_extra["llm_usage"] = await call_llm(client, messages, prompt_tokens["total"])
+            if cache_key is not None:
+                # Cache the raw model decision; enrichment below is recomputed each time.
+                await decision_cache.aset(cache_key, parsed)
+    except transport.UNAVAILABLE_ERRORS as e:
+        return fallback_response(claim_dict, deterministic, retriever, e)
+
+    enrich_citations(parsed, policy_excerpts)
+    return compose_response(parsed, deterministic, policy_excerpts, debug_extra)
+
+
+async def evaluate(
+    claim_dict: Dict[str, Any],
+    retriever: PolicyRetriever,
+    client: AsyncOpenAI,
+    memo: Optional[RetrievalMemo] = None,
+    decision_cache: Optional[DecisionCache] = None,
+) -> EvaluateResponse:
+    """
+    Async evaluation pipeline:
+    1) Deterministic rules engine
+    2) Batched RAG retrieval (embeddings via AsyncOpenAI, FAISS off the event loop)
+    3) LLM reasoning over the prompt
+    4) Citation enrichment and schema validation
+    Pass a RetrievalMemo to share retrieval results between claims of one batch, and
+    a DecisionCache to reuse LLM decisions for identical claim/policy inputs.
+    Claims matching the fast-path policy skip steps 2-3 entirely (debug.path = "fast_path").
+    If the provider is unavailable during steps 2-3 the deterministic result is
+    returned instead (debug.path = "fallback").
+    The claim is recorded for duplicate checks only after a response is produced.
+    Each stage is timed into the /metrics histograms (and debug.timings_ms with DEBUG_TIMINGS).
+    """
+    started = time.perf_counter()
+    timings = metrics.start_timings()
+    deterministic = await run_rules(claim_dict)
+
+    eligible, reason = fast_path_check(claim_dict, deterministic)
+    if eligible:
+        response = fast_path_response(claim_dict, deterministic, retriever, reason)
+    else:
+        response = await llm_response(claim_dict, deterministic, retriever, client, reason, memo, decision_cache)
+    response = finish_evaluation(response, timings, started)
+    await record_claim(claim_dict)
+    return response
+
+
+_evaluations = SingleFlight("evaluation")
+
+
+def evaluation_key(claim_dict: Dict[str, Any], retriever: PolicyRetriever) -> str:
+    """
+    Identity of an evaluation: the canonical claim payload and the index version it runs on.
+    """
+    payload = canonical_json({"claim": claim_dict, "index": retriever.name, "version": retriever.index_version})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def evaluate_coalesced(
+    claim_dict: Dict[str, Any],
+    retriever: PolicyRetriever,
+    client: AsyncOpenAI,
+    memo: Optional[RetrievalMemo] = None,
+    decision_cache: Optional[DecisionCache] = None,
+) -> EvaluateResponse:
+    """
+    evaluate() with single-flight: identical claims arriving while one is being
+    evaluated (ERP retries, double submits) wait for that evaluation instead of
+    running their own. Joiners get a copy marked debug.coalesced = true.
+    """
+    response, shared = await _evaluations.do(
+        evaluation_key(claim_dict, retriever),
+        lambda: evaluate(claim_dict, retriever, client, memo=memo, decision_cache=decision_cache),
+    )
+    if not shared:
+        return response
+    response = response.model_copy(deep=True)
+    response.debug = {**(response.debug or {}), "coalesced": True}
+    return response
@@ -0,0 +1,188 @@
+# Server-Sent Events variant of the evaluation pipeline.
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+from app.core import metrics, transport
+from app.rag.prompts import build_messages, pack_excerpts
+from app.rag.retriever import PolicyRetriever
+from app.rules.fast_path import fast_path_check
+from app.services.decision_cache import DecisionCache
+from app.services.evaluation import (
+    call_llm_stream,
+    compose_response,
+    enrich_citations,
+    fallback_response,
+    fast_path_response,
+    finish_evaluation,
+    llm_debug,
+    lookup_decision,
+    parse_llm_output,
+    plan_retrieval,
+    record_claim,
+    retrieve_excerpts,
+    run_rules,
+)
+
+Event = Tuple[str, Any]
+
+
+class LinesParser:
+    """
+    Incremental scanner over streamed model output that returns each element of the
+    top-level "lines" array as soon as its closing brace arrives. It only tracks
+    nesting and string state; the complete output is still parsed and validated at
+    the end.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        # A top-level string becomes the current key only once a ':' follows it.
+        self._maybe_key: Optional[str] = None
+        self._last_key: Optional[str] = None
+        self._in_lines = False
+        self._item: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        done: List[Dict[str, Any]] = []
+        for ch in text:
+            if self._depth >= 3:
+                self._item.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._maybe_key = "".join(self._string)
+                else:
+                    self._string.append(ch)
+                continue
+
+            if ch in " \t\r\n":
+                continue
+            if self._maybe_key is not None:
+                if ch == ":":
+                    self._last_key = self._maybe_key
+                self._maybe_key = None
+            if ch == '"':
+                self._in_string = True
+                self._string = []
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 2 and ch == "[" and self._last_key == "lines":
+                    self._in_lines = True
+                elif self._depth == 3 and self._in_lines:
+                    self._item = [ch]
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._in_lines:
+                    try:
+                        done.append(json.loads("".join(self._item)))
+                    except ValueError:
+                        pass  # reported by the final parse
+                    self._item = []
+                elif self._depth == 1:
+                    self._in_lines = False
+        return done
+
+
+async def evaluate_events(
+    claim_dict: Dict[str, Any],
+    retriever: PolicyRetriever,
+    client: AsyncOpenAI,
+    decision_cache: Optional[DecisionCache] = None,
+) -> AsyncIterator[Event]:
+    """
+    Same pipeline as evaluation.evaluate, emitted as it progresses:
+      deterministic -> retrieval -> delta* / line* -> result
+    `delta` carries raw model text, `line` each per-line result once it is complete,
+    and `result` the validated EvaluateResponse. Fast-path claims and decision-cache
+    hits skip straight to `result` (cache hits still send their `line` events).
+    If the provider is unavailable the deterministic fallback is sent as `result`
+    (it supersedes any `line` events already sent). Failures are emitted as a final
+    `error` event. The claim is recorded for duplicate checks only after `result` is sent.
+    """
+    started = time.perf_counter()
+    timings = metrics.start_timings()
+    try:
+        deterministic = await run_rules(claim_dict)
+        yield "deterministic", deterministic
+
+        eligible, reason = fast_path_check(claim_dict, deterministic)
+        if eligible:
+            response = fast_path_response(claim_dict, deterministic, retriever, reason)
+            yield "result", finish_evaluation(response, timings, started).model_dump()
+            await record_claim(claim_dict)
+            return
+
+        profiles, queries = plan_retrieval(claim_dict, retriever)
+        hits = await retrieve_excerpts(retriever, queries, profiles=profiles)
+        with metrics.span("prompt"):
+            policy_excerpts, dropped = pack_excerpts(hits)
+        yield "retrieval", {
+            "policy_index": retriever.name,
+            "index_version": retriever.index_version,
+            "excerpts": [
+                {k: ex[k] for k in ("chunk_id", "score", "section_title", "rule_ids", "source_path")}
+                for ex in policy_excerpts
+            ],
+        }
+
+        debug_extra = llm_debug(retriever, reason, dropped, profiles, queries)
+        parsed, cache_key = await lookup_decision(
+            decision_cache, claim_dict, deterministic, policy_excerpts, retriever, debug_extra
+        )
+
+        if parsed is None:
+            with metrics.span("prompt"):
+                messages, prompt_tokens = build_messages(claim_dict, deterministic, policy_excerpts)
+            debug_extra["prompt_tokens"] = prompt_tokens
+            usage: Dict[str, Any] = {}
+            parser = LinesParser()
+            out: List[str] = []
+            async for delta in call_llm_stream(client, messages, usage, prompt_tokens["total"]):
+                out.append(delta)
+                yield "delta", {"text": delta}
+                for line in parser.feed(delta):
+                    yield "line", line
+            debug_extra["llm_usage"] = usage
+            parsed = parse_llm_output("".join(out))
+            if cache_key is not None:
+                await decision_cache.aset(cache_key, parsed)
+        else:
+            for line in parsed.get("lines") or []:
+                yield "line", line
+
+        enrich_citations(parsed, policy_excerpts)
+        response = compose_response(parsed, deterministic, policy_excerpts, debug_extra)
+        yield "result", finish_evaluation(response, timings, started).model_dump()
+        await record_claim(claim_dict)
+    except transport.UNAVAILABLE_ERRORS as e:
+        try:
+            response = fallback_response(claim_dict, deterministic, retriever, e)
+            yield "result", finish_evaluation(response, timings, started).model_dump()
+            await record_claim(claim_dict)
+        except HTTPException as he:
+            yield "error", {"status_code": he.status_code, "detail": he.detail}
+    except HTTPException as e:
+        yield "error", {"status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        yield "error", {"status_code": 500, "detail": f"{type(e).__name__}: {e}"}
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """
+    One SSE frame; `data` is JSON on a single line.
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
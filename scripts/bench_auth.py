@@ -0,0 +1,83 @@
+import os
+import statistics
+import sys
+import time
+
+# Auth overhead per request: API-key check against the hashed store, bearer-token
+# verification with and without the verified-token cache, and the jwt_auth
+# dependency end to end through FastAPI. Runs offline.
+#   python -m scripts.bench_auth [iterations]
+os.environ.setdefault("JWT_SECRET", "bench-secret-0123456789abcdef0123456789")
+os.environ["VALID_API_KEYS"] = "bench-key"
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.core import security  # noqa: E402
+
+
+def _time(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def _report(label, stats):
+    mean, p50, p99 = stats
+    print(f"{label:<44} mean {mean:8.1f} us   p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print("API key check (token endpoint)")
+    plain = {"bench-key"}
+    _report("  plaintext set lookup (previous)", _time(lambda: "bench-key" in plain, n))
+    for n_keys in (1, 10, 100):
+        security.API_KEY_DIGESTS = [security.hash_api_key(f"other-{i}") for i in range(n_keys - 1)]
+        security.API_KEY_DIGESTS.append(security.hash_api_key("bench-key"))
+        _report(f"  hashed, constant-time, {n_keys} keys", _time(lambda: security.validate_api_key("bench-key"), n))
+
+    print("Bearer token verification (every protected request)")
+    token = security.create_access_token(subject="key_bench")
+
+    def uncached():
+        security.clear_token_cache()
+        security.decode_and_verify_token(token)
+
+    _report("  full verification (no cache)", _time(uncached, n))
+    security.decode_and_verify_token(token)
+    _report("  verified-token cache hit", _time(lambda: security.decode_and_verify_token(token), n))
+
+    print("End to end through FastAPI (TestClient, includes routing overhead)")
+    app = FastAPI()
+
+    @app.get("/open")
+    def open_route():
+        return {}
+
+    @app.get("/protected")
+    def protected_route(_auth=Depends(security.jwt_auth)):
+        return {}
+
+    headers = {"Authorization": f"Bearer {token}"}
+    m = max(1, n // 10)
+    with TestClient(app) as tc:
+        _report("  unauthenticated route", _time(lambda: tc.get("/open"), m))
+        _report("  jwt_auth route, cache hit", _time(lambda: tc.get("/protected", headers=headers), m))
+
+        def protected_uncached():
+            security.clear_token_cache()
+            tc.get("/protected", headers=headers)
+
+        _report("  jwt_auth route, no cache", _time(protected_uncached, m))
+
+    print(f"token cache: {security.token_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import copy
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from app.rules.duplicates import DuplicateIndex
+from scripts.synth_claims import generate_claims
+
+# R-GEN-004 duplicate index: lookup latency against a large synthetic history and
+# match rates for fresh claims (false positives), verbatim resubmissions under a new
+# claim_id (exact) and edited resubmissions (vendor typo, amount +1%, new receipt ID;
+# near). Runs offline on a throwaway index unless --path is given.
+#   python -m scripts.bench_duplicates --history 200000 --queries 2000
+
+
+def resubmit(claim: Dict[str, Any], claim_id: str) -> Dict[str, Any]:
+    again = copy.deepcopy(claim)
+    again["claim_id"] = claim_id
+    return again
+
+
+def edit(claim: Dict[str, Any], claim_id: str, rng: random.Random) -> Dict[str, Any]:
+    again = resubmit(claim, claim_id)
+    for ln in again["lines"]:
+        vendor = ln.get("vendor") or ""
+        if len(vendor) > 4:
+            i = rng.randrange(1, len(vendor) - 1)
+            ln["vendor"] = vendor[:i] + vendor[i + 1:]
+        ln["amount"] = round(float(ln["amount"]) * 1.01, 2)
+        ln["receipt"] = {**(ln.get("receipt") or {}), "receipt_id": f"R-EDIT-{rng.randrange(10**9)}"}
+    return again
+
+
+def run(index: DuplicateIndex, claims: List[Dict[str, Any]], expected: Callable[[str], bool]) -> Dict[str, float]:
+    per_line: List[float] = []
+    lines = hits = 0
+    for claim in claims:
+        t0 = time.perf_counter()
+        found = index.find(claim)
+        elapsed = (time.perf_counter() - t0) * 1e6
+        n = len(claim["lines"])
+        per_line.extend([elapsed / n] * n)
+        lines += n
+        hits += sum(1 for m in found.values() if expected(m["kind"]))
+    per_line.sort()
+    return {
+        "lines": lines,
+        "match_rate": hits / lines if lines else 0.0,
+        "mean_us": statistics.mean(per_line),
+        "p50_us": per_line[len(per_line) // 2],
+        "p99_us": per_line[max(0, int(len(per_line) * 0.99) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", type=int, default=200000, help="historical claims to load")
+    parser.add_argument("--queries", type=int, default=2000, help="claims per query scenario")
+    parser.add_argument("--path", default=None, help="existing/target index file (default: temp file)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "duplicates.sqlite")
+    index = DuplicateIndex(path)
+    history = generate_claims(args.history, seed=args.seed)
+    t0 = time.perf_counter()
+    loaded = 0
+    for i in range(0, len(history), 20000):
+        loaded += index.record_many(history[i:i + 20000], replace=False)
+    load_s = time.perf_counter() - t0
+    print(f"Loaded {loaded} lines in {load_s:.1f}s ({loaded / load_s:,.0f} lines/s); index holds {len(index)} lines, "
+          f"{os.path.getsize(path) / 2**20:.0f} MiB")
+
+    rng = random.Random(args.seed + 1)
+    sample = rng.sample(history, min(args.queries, len(history)))
+    fresh = generate_claims(args.queries, seed=args.seed + 10**6)
+    for i, claim in enumerate(fresh):
+        claim["claim_id"] = f"C-FRESH-{i:07d}"
+    scenarios = {
+        "fresh (any match = false positive)": (fresh, lambda kind: True),
+        "resubmitted verbatim (exact)": (
+            [resubmit(c, f"C-AGAIN-{i:07d}") for i, c in enumerate(sample)], lambda kind: kind == "exact"),
+        "resubmitted edited (near)": (
+            [edit(c, f"C-EDIT-{i:07d}", rng) for i, c in enumerate(sample)], lambda kind: kind == "near"),
+    }
+    print(f"{'scenario':<38} {'lines':>7} {'matched':>8} {'mean us':>9} {'p50 us':>8} {'p99 us':>8}")
+    for label, (claims, expected) in scenarios.items():
+        r = run(index, claims, expected)
+        print(f"{label:<38} {r['lines']:>7} {r['match_rate']:>8.1%} {r['mean_us']:>9.1f} "
+              f"{r['p50_us']:>8.1f} {r['p99_us']:>8.1f}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
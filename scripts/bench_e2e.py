@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import contextvars
+import datetime as dt
+import functools
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+# End-to-end load benchmark of app.main:app against a local OpenAI stand-in
+# (scripts/mock_openai.py, started automatically unless --mock-url is given).
+# Reports throughput and p50/p95/p99 latency per request and per pipeline stage
+# (rules, retrieval, prompt, llm, validation) and stores the results as JSON, so
+# runs on two commits can be compared:
+#   python -m scripts.bench_e2e --claims 200 --concurrency 16 --chat-latency-ms 800
+#   python -m scripts.bench_e2e --compare bench_results/e2e-<old>.json
+# The app runs in-process (httpx ASGI transport) with the committed policy index.
+
+STAGES = {
+    "rules": ["evaluate_claim"],
+    "retrieval": ["retrieve_excerpts"],
+    "prompt": ["pack_excerpts", "build_messages"],
+    "llm": ["call_llm"],
+    "validation": ["enrich_citations", "compose_response"],
+}
+SCENARIOS = ("sequential", "concurrent", "batch")
+API_KEY = "bench-key"
+
+_stage_times: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_times", default=None)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    s = sorted(samples)
+
+    def pct(p):
+        return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+    return {
+        "n": len(s),
+        "mean": round(statistics.mean(s), 3),
+        "p50": round(pct(50), 3),
+        "p95": round(pct(95), 3),
+        "p99": round(pct(99), 3),
+        "max": round(s[-1], 3),
+    }
+
+
+class StageTimer:
+    """
+    Wraps the pipeline functions that evaluation.evaluate calls and records, per
+    evaluated claim, the time spent in each stage (milliseconds).
+    """
+
+    def __init__(self):
+        self.records: List[Dict[str, float]] = []
+        self._patched: List[tuple] = []
+
+    def _patch(self, module, name: str, wrapper: Callable) -> None:
+        self._patched.append((module, name, getattr(module, name)))
+        setattr(module, name, wrapper)
+
+    def _stage_wrapper(self, stage: str, fn: Callable) -> Callable:
+        def add(elapsed):
+            times = _stage_times.get()
+            if times is not None:
+                times[stage] = times.get(stage, 0.0) + elapsed * 1000
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    add(time.perf_counter() - t0)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add(time.perf_counter() - t0)
+        return wrapper
+
+    def _evaluate_wrapper(self, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            # Each claim (also inside a batch task) gets its own stage totals.
+            times: Dict[str, float] = {}
+            token = _stage_times.set(times)
+            t0 = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+                times["path"] = (result.debug or {}).get("path")
+                return result
+            finally:
+                times["evaluate"] = (time.perf_counter() - t0) * 1000
+                _stage_times.reset(token)
+                self.records.append(times)
+        return wrapper
+
+    def install(self) -> None:
+        from app.services import evaluation
+
+        for stage, names in STAGES.items():
+            for name in names:
+                self._patch(evaluation, name, self._stage_wrapper(stage, getattr(evaluation, name)))
+        # The endpoints reach evaluate through evaluation.evaluate_coalesced. Claims that
+        # joined an in-flight evaluation are not recorded separately.
+        self._patch(evaluation, "evaluate", self._evaluate_wrapper(evaluation.evaluate))
+
+    def uninstall(self) -> None:
+        for module, name, original in reversed(self._patched):
+            setattr(module, name, original)
+        self._patched = []
+
+    def summary(self) -> Dict[str, Any]:
+        out = {stage: percentiles([r[stage] for r in self.records if stage in r]) for stage in STAGES}
+        out["evaluate"] = percentiles([r["evaluate"] for r in self.records])
+        return out
+
+
+async def _run_requests(fn: Callable, n: int, concurrency: int) -> List[Dict[str, Any]]:
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(n):
+        queue.put_nowait(i)
+    results: List[Dict[str, Any]] = []
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            try:
+                status, n_claims, errors = await fn(i)
+            except Exception as e:
+                status, n_claims, errors = f"{type(e).__name__}", 0, 1
+            results.append({
+                "latency_ms": (time.perf_counter() - t0) * 1000,
+                "status": status,
+                "claims": n_claims,
+                "errors": errors,
+            })
+
+    await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    return results
+
+
+def mock_stats(args) -> Dict[str, int]:
+    base = (args.mock_url or f"http://127.0.0.1:{args.mock_port}/v1").rsplit("/v1", 1)[0]
+    try:
+        return httpx.get(f"{base}/health", timeout=5).json()
+    except (httpx.HTTPError, ValueError):
+        return {}
+
+
+async def run_scenario(name: str, http: httpx.AsyncClient, headers, claims, args) -> Dict[str, Any]:
+    if name == "batch":
+        batches = [claims[i:i + args.batch_size] for i in range(0, len(claims), args.batch_size)]
+
+        async def call(i):
+            body = "\n".join(json.dumps(c) for c in batches[i])
+            r = await http.post(
+                "/v1/claims/evaluate:batch",
+                content=body,
+                headers={**headers, "Content-Type": "application/x-ndjson"},
+            )
+            records = [json.loads(ln) for ln in r.text.splitlines() if ln.strip()]
+            return r.status_code, len(records), sum(1 for rec in records if rec.get("status") != "ok")
+
+        n, concurrency = len(batches), args.batch_concurrency
+    else:
+        async def call(i):
+            r = await http.post("/v1/claims/evaluate", json=claims[i], headers=headers)
+            return r.status_code, 1, int(r.status_code != 200)
+
+        n, concurrency = len(claims), (1 if name == "sequential" else args.concurrency)
+
+    timer = StageTimer()
+    timer.install()
+    before = await asyncio.to_thread(mock_stats, args)
+    t0 = time.perf_counter()
+    try:
+        results = await _run_requests(call, n, concurrency)
+    finally:
+        timer.uninstall()
+    wall = time.perf_counter() - t0
+    after = await asyncio.to_thread(mock_stats, args)
+
+    n_claims = sum(r["claims"] for r in results)
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    paths: Dict[str, int] = {}
+    for rec in timer.records:
+        paths[str(rec.get("path"))] = paths.get(str(rec.get("path")), 0) + 1
+    return {
+        "requests": len(results),
+        "claims": n_claims,
+        "concurrency": concurrency,
+        "errors": sum(r["errors"] for r in results),
+        "status_codes": statuses,
+        "paths": paths,
+        "provider_calls": {k: after[k] - before.get(k, 0) for k in ("chat", "embeddings") if k in after},
+        "wall_s": round(wall, 3),
+        "throughput_claims_per_s": round(n_claims / wall, 3) if wall else None,
+        "latency_ms": percentiles([r["latency_ms"] for r in results]),
+        "stages_ms": timer.summary(),
+    }
+
+
+def start_mock(args) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "scripts.mock_openai",
+        "--port", str(args.mock_port),
+        "--chat-latency-ms", str(args.chat_latency_ms),
+        "--embed-latency-ms", str(args.embed_latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--slow-rate", str(args.slow_rate),
+        "--slow-ms", str(args.slow_ms),
+        "--fail-rate", str(args.fail_rate),
+        "--fail-status", str(args.fail_status),
+    ]
+    proc = subprocess.Popen(cmd)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.mock_port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("mock OpenAI server did not start")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    # Imported after the environment is prepared: settings are read at import time.
+    import app.main as main_module
+    from app.core.config import settings
+    from scripts.synth_claims import generate_claims
+
+    app = main_module.app
+    results: Dict[str, Any] = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+            token = (await http.post("/v1/auth/token", headers={"X-API-Key": API_KEY})).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            # Warm-up: index pages, rules, connection pools.
+            warmup = generate_claims(1, seed=args.seed - 1, max_lines=args.max_lines)[0]
+            await http.post("/v1/claims/evaluate", json=warmup, headers=headers)
+            for n, name in enumerate(args.scenarios.split(",")):
+                # Fresh claims per scenario, so no scenario runs on caches warmed by another.
+                claims = generate_claims(args.claims, seed=args.seed + 1000 * n, max_lines=args.max_lines)
+                # ERP retries / double submits: each claim sent several times back to back.
+                claims = [c for c in claims for _ in range(max(1, args.duplicates))]
+                print(f"[..] scenario {name}")
+                results[name] = await run_scenario(name, http, headers, claims, args)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "settings": {
+                k: getattr(settings, k)
+                for k in (
+                    "RAG_RETRIEVAL_MODE", "RAG_TOP_K", "RAG_MAX_EXCERPTS", "PROMPT_EXCERPT_TOKEN_BUDGET",
+                    "VECTOR_INDEX_TYPE", "EMBED_BACKEND", "FAST_PATH_ENABLED", "DECISION_CACHE_BACKEND",
+                    "BATCH_MAX_CONCURRENCY", "LLM_TIMEOUT_SECONDS", "LLM_MAX_RETRIES", "LLM_HEDGE_AFTER_MS",
+                    "EMBED_HEDGE_AFTER_MS", "BREAKER_FAILURE_THRESHOLD", "LLM_FALLBACK_ENABLED",
+                )
+                if hasattr(settings, k)
+            },
+        },
+        "scenarios": results,
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    def delta(cur, old):
+        if old in (None, 0) or cur is None:
+            return ""
+        return f" ({100.0 * (cur - old) / old:+.1f}%)"
+
+    for name, sc in report["scenarios"].items():
+        old = (baseline or {}).get("scenarios", {}).get(name, {})
+        print(f"\n== {name}: {sc['claims']} claims, {sc['requests']} requests, concurrency {sc['concurrency']}, "
+              f"errors {sc['errors']}, paths {sc['paths']}, provider calls {sc.get('provider_calls')}")
+        print(f"   throughput {sc['throughput_claims_per_s']} claims/s"
+              f"{delta(sc['throughput_claims_per_s'], old.get('throughput_claims_per_s'))}")
+        rows = [("request", sc["latency_ms"], old.get("latency_ms", {}))]
+        rows += [(s, v, old.get("stages_ms", {}).get(s, {})) for s, v in sc["stages_ms"].items()]
+        print(f"   {'stage':<11} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+        for label, cur, prev in rows:
+            if not cur:
+                continue
+            cells = [f"{cur[p]:.2f}{delta(cur[p], prev.get(p))}" for p in ("p50", "p95", "p99")]
+            print(f"   {label:<11} {cells[0]:>18} {cells[1]:>18} {cells[2]:>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", type=int, default=200)
+    parser.add_argument("--max-lines", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicates", type=int, default=1, help="send each claim N times back to back")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--batch-concurrency", type=int, default=1)
+    parser.add_argument("--mock-url", default=None, help="use a running mock (e.g. http://127.0.0.1:8100/v1)")
+    parser.add_argument("--mock-port", type=int, default=8100)
+    parser.add_argument("--chat-latency-ms", type=float, default=800)
+    parser.add_argument("--embed-latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of mock calls with --slow-ms extra latency")
+    parser.add_argument("--slow-ms", type=float, default=3000)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--fail-status", type=int, default=500)
+    parser.add_argument("--out", default=None, help="results file (default: bench_results/e2e-<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = args.mock_url or f"http://127.0.0.1:{args.mock_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["VALID_API_KEYS"] = API_KEY
+    os.environ.setdefault("JWT_SECRET", "bench-secret-0123456789abcdef0123456789")
+    # Unique synthetic claims; a decision cache would only measure itself.
+    os.environ.setdefault("DECISION_CACHE_BACKEND", "none")
+    os.environ.setdefault("EMBED_CACHE_PATH", "")
+    os.environ.setdefault("INDEX_RELOAD_SECONDS", "0")
+    # Throwaway duplicate index, in case DUPLICATE_RECORD_ENABLED is set for the run.
+    os.environ.setdefault("DUPLICATE_INDEX_PATH", os.path.join(tempfile.mkdtemp(), "duplicates.sqlite"))
+
+    mock = None if args.mock_url else start_mock(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait(timeout=10)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    out = args.out
+    if out is None:
+        stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join("bench_results", f"e2e-{report['meta']['commit'] or 'nogit'}-{stamp}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[OK] Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Offline retrieval benchmark: builds a throwaway index with the local hashing
+# backend and times query embedding and search. No network access needed.
+#   python -m scripts.bench_embeddings [n_queries]
+TMP = tempfile.mkdtemp(prefix="bench-embed-")
+os.environ["EMBED_BACKEND"] = "hashing"
+os.environ["VECTOR_INDEX_PATH"] = os.path.join(TMP, "faiss.index")
+os.environ["VECTOR_META_PATH"] = os.path.join(TMP, "meta.sqlite")
+os.environ["VECTOR_MANIFEST_PATH"] = os.path.join(TMP, "manifest.json")
+os.environ["EMBED_CACHE_PATH"] = ""
+
+from app.rag.ingest import ingest_policies  # noqa: E402
+from app.rag.retriever import PolicyRetriever  # noqa: E402
+
+QUERIES = [
+    "meal over daily cap category=MEALS meal_type=DINNER",
+    "hotel nightly cap exceeded minibar category=LODGING",
+    "taxi without receipt category=TAXI",
+    "mileage distance does not match route category=MILEAGE",
+    "client entertainment attendees missing alcohol",
+    "R-GEN-002 submission deadline",
+]
+
+
+def _pct(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(p * len(samples)))]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    ingest_policies("data/policies", full_rebuild=True)
+    r = PolicyRetriever()
+
+    embed_us, search_us = [], []
+    for i in range(n):
+        q = f"{QUERIES[i % len(QUERIES)]} #{i}"
+        t0 = time.perf_counter()
+        qv = r._embed_many([q])
+        t1 = time.perf_counter()
+        r._search_each([q], qv, 6)
+        t2 = time.perf_counter()
+        embed_us.append((t1 - t0) * 1e6)
+        search_us.append((t2 - t1) * 1e6)
+
+    for name, xs in (("embed", embed_us), ("search", search_us)):
+        print(
+            f"[OK] {name:6s} p50={statistics.median(xs):8.1f}us "
+            f"p95={_pct(xs, 0.95):8.1f}us p99={_pct(xs, 0.99):8.1f}us (n={n}, {r.embedder.model_id})"
+        )
@@ -0,0 +1,97 @@
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from app.rag.index_types import INDEX_TYPES, apply_search_params, build_search_index
+
+# Recall-vs-latency benchmark of the configurable index types on synthetic corpora.
+# Reports recall@k against the exact flat index, p50/p99 single-query latency,
+# build time and on-disk size. Runs offline (no embeddings API).
+#   python -m scripts.bench_index_types --sizes 10000,100000,1000000 --dim 256
+
+
+def synthetic_corpus(n: int, dim: int, n_queries: int, seed: int = 0):
+    # Clustered unit vectors, so approximate indexes face a realistic structure.
+    rng = np.random.default_rng(seed)
+    n_clusters = max(8, int(np.sqrt(n)))
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    xb = centers[rng.integers(0, n_clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    xq = xb[rng.integers(0, n, n_queries)] + 0.3 * rng.standard_normal((n_queries, dim)).astype("float32")
+    faiss.normalize_L2(xb)
+    faiss.normalize_L2(xq)
+    return xb, xq
+
+
+def size_on_disk(index: faiss.Index) -> int:
+    with tempfile.NamedTemporaryFile(suffix=".index", delete=False) as f:
+        path = f.name
+    try:
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def measure(index: faiss.Index, xq: np.ndarray, truth: np.ndarray, k: int):
+    lat = []
+    found = np.empty_like(truth)
+    for i in range(xq.shape[0]):
+        t0 = time.perf_counter()
+        _, ids = index.search(xq[i:i + 1], k)
+        lat.append((time.perf_counter() - t0) * 1e3)
+        found[i] = ids[0]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found.tolist(), truth.tolist())])
+    lat = np.array(lat)
+    return recall, np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000")
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--types", default=",".join(INDEX_TYPES))
+    ap.add_argument("--nprobe", default="1,8,32")
+    ap.add_argument("--ef-search", default="16,64,256")
+    ap.add_argument("--threads", type=int, default=1)
+    args = ap.parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    print(f"{'n':>9} {'type':6} {'search param':>14} {'recall@' + str(args.k):>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'size MB':>9} {'build s':>8}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        xb, xq = synthetic_corpus(n, args.dim, args.queries)
+        ids = np.arange(n, dtype="int64")
+        exact = faiss.IndexFlatIP(args.dim)
+        exact.add(xb)
+        _, truth = exact.search(xq, args.k)
+
+        for index_type in args.types.split(","):
+            t0 = time.perf_counter()
+            index, built, params = build_search_index(xb, ids, index_type)
+            build_s = time.perf_counter() - t0
+            size_mb = size_on_disk(index) / 1e6
+            if built in ("ivf", "ivfpq"):
+                sweep = [("nprobe", int(v)) for v in args.nprobe.split(",")]
+            elif built == "hnsw":
+                sweep = [("efSearch", int(v)) for v in args.ef_search.split(",")]
+            else:
+                sweep = [("", 0)]
+            for name, value in sweep:
+                if name == "nprobe":
+                    apply_search_params(index, nprobe=value)
+                elif name == "efSearch":
+                    apply_search_params(index, ef_search=value)
+                recall, p50, p99 = measure(index, xq, truth, args.k)
+                label = f"{name}={value}" if name else "exact"
+                print(f"{n:>9} {built:6} {label:>14} {recall:>9.3f} {p50:>8.3f} {p99:>8.3f} "
+                      f"{size_mb:>9.1f} {build_s:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+from app.core.config import settings
+from app.rag.prompts import build_messages, pack_excerpts
+from app.rag.retriever import PolicyRetriever
+from app.rules.rule_engine import evaluate_claim
+from app.schemas.claim import Claim
+from app.services.evaluation import build_queries, select_excerpts
+
+# Prompt size with and without re-ranking (score floor, rule-ID boost, MMR) on the
+# sample claims. "baseline" is the previous behavior: de-duplicated hits, best-first,
+# first 10 that fit the token budget.
+#   python -m scripts.bench_rerank --mode lexical     (no embeddings API needed)
+#   python -m scripts.bench_rerank --mode hybrid
+
+BASELINE_MAX_EXCERPTS = 10
+
+
+def load_claims(directory: str):
+    for path in sorted(glob.glob(os.path.join(directory, "claim_*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        # Some samples start with a one-line title before the JSON body.
+        yield os.path.basename(path), Claim(**json.loads(text[text.index("{"):])).model_dump()
+
+
+def prompt_stats(claim, deterministic, excerpts):
+    _, stats = build_messages(claim, deterministic, excerpts)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", default="claim_samples")
+    parser.add_argument("--mode", choices=["vector", "lexical", "hybrid"], default=None,
+                        help="override RAG_RETRIEVAL_MODE")
+    args = parser.parse_args()
+    if args.mode:
+        settings.RAG_RETRIEVAL_MODE = args.mode
+
+    retriever = PolicyRetriever()
+    print(f"mode={settings.RAG_RETRIEVAL_MODE} floor={settings.RAG_SCORE_FLOOR} "
+          f"boost={settings.RAG_RULE_ID_BOOST} lambda={settings.RAG_MMR_LAMBDA} "
+          f"max_excerpts={settings.RAG_MAX_EXCERPTS} budget={settings.PROMPT_EXCERPT_TOKEN_BUDGET}")
+    print(f"{'claim':<14} {'excerpts':>13} {'excerpt tok':>15} {'prompt tok':>15} {'rerank ms':>10}")
+
+    totals = {"base_n": 0, "new_n": 0, "base_ex": 0, "new_ex": 0, "base_tok": 0, "new_tok": 0}
+    for name, claim in load_claims(args.claims):
+        deterministic = evaluate_claim(claim)
+        hits = select_excerpts(retriever.search_many(build_queries(claim)))
+
+        base, _ = pack_excerpts(hits, max_count=BASELINE_MAX_EXCERPTS)
+        t0 = time.perf_counter()
+        reranked = retriever.rerank(hits)
+        rerank_ms = (time.perf_counter() - t0) * 1000
+        new, _ = pack_excerpts(reranked)
+
+        b, n = prompt_stats(claim, deterministic, base), prompt_stats(claim, deterministic, new)
+        totals["base_n"] += len(base)
+        totals["new_n"] += len(new)
+        totals["base_ex"] += b["excerpts"]
+        totals["new_ex"] += n["excerpts"]
+        totals["base_tok"] += b["total"]
+        totals["new_tok"] += n["total"]
+        print(f"{name:<14} {len(base):>6} -> {len(new):<4} {b['excerpts']:>6} -> {n['excerpts']:<6} "
+              f"{b['total']:>6} -> {n['total']:<6} {rerank_ms:>10.2f}")
+
+    saved = totals["base_tok"] - totals["new_tok"]
+    print(f"{'total':<14} {totals['base_n']:>6} -> {totals['new_n']:<4} "
+          f"{totals['base_ex']:>6} -> {totals['new_ex']:<6} {totals['base_tok']:>6} -> {totals['new_tok']:<6}")
+    if totals["base_tok"]:
+        print(f"prompt tokens saved: {saved} ({100.0 * saved / totals['base_tok']:.1f}%), "
+              f"tokenizer={b['tokenizer']}")
+    retriever.meta.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from app.rules.batch_engine import (
+    claims_to_columns,
+    evaluate_claims_batch,
+    evaluate_claims_columnar,
+    evaluate_columns,
+    flagged_issues,
+)
+from app.rules.rule_engine import evaluate_claim
+
+# Parity check and throughput benchmark: scalar evaluate_claim vs the vectorized
+# batch engine on the sample claims plus synthetic ones. All batch timings are end
+# to end from claim dicts; only the last line isolates the column checks.
+#   python -m scripts.bench_rule_engine [n_claims]
+CATEGORIES = [
+    "MEALS", "LODGING", "AIRFARE", "RAIL", "TAXI", "PUBLIC_TRANSIT",
+    "MILEAGE", "CLIENT_ENTERTAINMENT", "OFFICE", "TRAINING", "OTHER",
+]
+MEAL_TYPES = [None, "BREAKFAST", "LUNCH", "DINNER", "OTHER"]
+
+
+def load_samples(folder: str = "claim_samples"):
+    claims = []
+    for fn in sorted(os.listdir(folder)):
+        if fn.startswith("claim"):
+            with open(os.path.join(folder, fn), "r", encoding="utf-8") as f:
+                text = f.read()
+            claims.append(json.loads(text[text.index("{"):]))
+    return claims
+
+
+def synthetic_claims(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    base = date(2024, 1, 1)
+    claims = []
+    for c in range(n):
+        submitted = base + timedelta(days=rng.randint(0, 700))
+        lines = []
+        for i in range(rng.randint(1, 8)):
+            cat = rng.choice(CATEGORIES)
+            amount = round(rng.uniform(0, 400), 2)
+            ln = {
+                "line_id": f"L{i + 1}",
+                "date": (submitted - timedelta(days=rng.randint(0, 60))).isoformat(),
+                "category": cat,
+                "amount": amount,
+                "receipt": {"provided": rng.random() < 0.7},
+            }
+            if cat == "MEALS":
+                ln["meal_type"] = rng.choice(MEAL_TYPES)
+            if cat == "LODGING" and rng.random() < 0.5:
+                ln["preapproval"] = {"provided": rng.random() < 0.5}
+            if cat == "CLIENT_ENTERTAINMENT":
+                ln["attendees"] = [{"name": "A", "type": "EXTERNAL"}] * rng.randint(0, 3)
+            if cat == "MILEAGE" and rng.random() < 0.8:
+                km = round(rng.uniform(1, 500), 1)
+                exact = round(km * 0.42, 2)
+                ln["amount"] = exact if rng.random() < 0.6 else amount
+                ln["mileage"] = {"km": km}
+            lines.append(ln)
+        claims.append({"claim_id": f"C{c}", "submission_date": submitted.isoformat(), "lines": lines})
+    return claims
+
+
+def _rate(label: str, seconds: float, n_lines: int, scalar: float) -> None:
+    print(f"[OK] {label:<40} {seconds:7.3f}s ({n_lines / seconds:>12,.0f} lines/s, {scalar / seconds:5.1f}x scalar)")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    claims = load_samples() + synthetic_claims(n)
+
+    t0 = time.perf_counter()
+    scalar = [evaluate_claim(c) for c in claims]
+    t1 = time.perf_counter()
+    batch = evaluate_claims_batch(claims)
+    t2 = time.perf_counter()
+    res = evaluate_claims_columnar(claims)
+    t3 = time.perf_counter()
+    flagged_issues(res)
+    t4 = time.perf_counter()
+    cols = claims_to_columns(claims)
+    t5 = time.perf_counter()
+    evaluate_columns(cols)
+    t6 = time.perf_counter()
+
+    mismatches = [c["claim_id"] for c, a, b in zip(claims, scalar, batch) if a != b]
+    if mismatches:
+        print(f"[WARN] {len(mismatches)} parity mismatches, e.g. {mismatches[:5]}")
+        sys.exit(1)
+
+    n_lines = sum(len(c["lines"]) for c in claims)
+    base = t1 - t0
+    print(f"[OK] Parity: {len(claims)} claims / {n_lines} lines identical ({res['flagged'].mean():.0%} of lines flagged)")
+    _rate("scalar evaluate_claim", base, n_lines, base)
+    _rate("batch, per-claim result dicts", t2 - t1, n_lines, base)
+    _rate("columnar (decisions, codes, totals)", t3 - t2, n_lines, base)
+    _rate("columnar + issue dicts for flagged lines", (t3 - t2) + (t4 - t3), n_lines, base)
+    print(f"[OK]   of which columnize {t5 - t4:.3f}s, column checks {t6 - t5:.4f}s")
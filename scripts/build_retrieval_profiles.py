@@ -0,0 +1,35 @@
+import argparse
+import os
+import shutil
+
+from app.core.config import settings
+from app.rag.embedders import build_embedder
+from app.rag.ingest import add_profiles
+from app.rag.registry import configured_indexes
+
+# Adds (or refreshes) the per-category retrieval profiles of an existing index without
+# re-ingesting, e.g. for indexes built before profiles existed or after changing
+# RAG_RETRIEVAL_MODE / RAG_PROFILE_DEPTH. One embeddings request; the metadata store
+# is rewritten via a temp copy and swapped in (running servers hot-reload it).
+#   python -m scripts.build_retrieval_profiles [--index NAME]
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", default="default")
+    args = ap.parse_args()
+
+    indexes = configured_indexes()
+    if args.index not in indexes:
+        raise SystemExit(f"Unknown index '{args.index}'; configured: {', '.join(indexes)}")
+    paths = indexes[args.index]
+
+    embedder = build_embedder(max_retries=0, timeout=settings.EMBED_INGEST_TIMEOUT_SECONDS)
+    tmp = f"{paths['meta']}.tmp"
+    shutil.copyfile(paths["meta"], tmp)
+    try:
+        n = add_profiles(embedder, tmp, index_path=paths["index"])
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, paths["meta"])
+    print(f"[OK] Wrote {n} retrieval profiles ({settings.RAG_RETRIEVAL_MODE}) to {paths['meta']}")
@@ -0,0 +1,23 @@
+import argparse
+import getpass
+
+from app.core.security import hash_api_key, key_id
+
+# Prints the API_KEY_HASHES entry (and token subject) for an API key, so only the
+# hash needs to be stored in the environment / secret manager.
+#   python -m scripts.hash_api_key            (prompts for the key)
+#   python -m scripts.hash_api_key --key dev-key-1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--key", default=None, help="API key (prompted for if omitted)")
+    args = parser.parse_args()
+    api_key = args.key or getpass.getpass("API key: ")
+    digest = hash_api_key(api_key)
+    print(f"API_KEY_HASHES entry: {digest}")
+    print(f"key id (token subject): {key_id(digest)}")
+
+
+if __name__ == "__main__":
+    main()
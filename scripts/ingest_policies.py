@@ -1,4 +1,25 @@
+import argparse
+
+from app.core.config import settings
 from app.rag.ingest import ingest_policies
+from app.rag.registry import configured_indexes
 
 if __name__ == "__main__":
-    ingest_policies("data/policies")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("policy_dir", nargs="?", default="data/policies")
+    # --full ignores the manifest and re-embeds every chunk
+    ap.add_argument("--full", action="store_true")
+    # --index NAME writes into a named index from POLICY_INDEXES (running servers hot-reload it)
+    ap.add_argument("--index", default="default")
+    args = ap.parse_args()
+
+    indexes = configured_indexes()
+    if args.index not in indexes:
+        raise SystemExit(f"Unknown index '{args.index}'; configured: {', '.join(indexes)}")
+    paths = indexes[args.index]
+    settings.VECTOR_INDEX_PATH = paths["index"]
+    settings.VECTOR_META_PATH = paths["meta"]
+    settings.VECTOR_MANIFEST_PATH = paths["manifest"]
+    settings.VECTOR_STORE_PATH = paths["store"]
+
+    ingest_policies(args.policy_dir, full_rebuild=args.full)
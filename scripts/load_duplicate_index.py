@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+from app.core.config import settings
+from app.rules.duplicates import DuplicateIndex
+
+# Backfills the R-GEN-004 duplicate index from historical claims (NDJSON, one claim
+# per line, as exported or produced by scripts.synth_claims). Safe to re-run: a
+# claim_id already in the index is replaced unless --append is given.
+#   python -m scripts.load_duplicate_index history.ndjson [--path data/cache/duplicates.sqlite]
+
+
+def read_claims(path: str) -> Iterator[Dict[str, Any]]:
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="NDJSON file of claims, or - for stdin")
+    parser.add_argument("--path", default=settings.DUPLICATE_INDEX_PATH)
+    parser.add_argument("--chunk", type=int, default=10000, help="claims per transaction")
+    parser.add_argument("--append", action="store_true", help="claims are new; skip replacing existing claim_ids")
+    args = parser.parse_args()
+
+    index = DuplicateIndex(args.path)
+    t0 = time.perf_counter()
+    claims = lines = 0
+    chunk: List[Dict[str, Any]] = []
+    for claim in read_claims(args.source):
+        chunk.append(claim)
+        if len(chunk) >= args.chunk:
+            lines += index.record_many(chunk, replace=not args.append)
+            claims += len(chunk)
+            chunk = []
+            print(f"[OK] {claims} claims, {lines} lines ({time.perf_counter() - t0:.1f}s)")
+    if chunk:
+        lines += index.record_many(chunk, replace=not args.append)
+        claims += len(chunk)
+    print(f"[OK] Loaded {claims} claims / {lines} lines into {args.path} "
+          f"in {time.perf_counter() - t0:.1f}s; index now holds {len(index)} lines")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import json
+import sys
+
+from app.rag.meta_store import ChunkStore, write_chunk_store
+
+if __name__ == "__main__":
+    # Converts a legacy meta.json (or rebuilds an existing store, e.g. to add the
+    # lexical index tables) into the SQLite chunk store read by the retriever:
+    #   python -m scripts.migrate_meta data/index/meta.json data/index/meta.sqlite
+    #   python -m scripts.migrate_meta data/index/meta.sqlite data/index/meta.sqlite
+    src, dst = sys.argv[1], sys.argv[2]
+    if src.lower().endswith(".json"):
+        with open(src, "r", encoding="utf-8") as f:
+            chunks, info = json.load(f), {}
+    else:
+        store = ChunkStore(src)
+        chunks = list(store.iter_chunks())
+        info = {k: v for k, v in store.info().items() if k not in ("doc_count", "avg_doc_length")}
+        store.close()
+    n = write_chunk_store(dst, chunks, info)
+    print(f"[OK] Wrote {n} chunks to {dst}")
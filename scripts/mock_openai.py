@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-in for the OpenAI chat-completions and embeddings endpoints, for
+# benchmarks and load tests. Point the service at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+# Latency is drawn per request as latency +/- uniform jitter, plus --slow-ms for a
+# --slow-rate fraction of requests (tail latency); a fraction of requests fails with
+# --fail-status. Chat answers are valid EvaluateResponse JSON built from
+# the claim in the prompt; usage reports cached_tokens for repeated prompt prefixes.
+#   python -m scripts.mock_openai --port 8100 --chat-latency-ms 800 --jitter-ms 200 --fail-rate 0.01
+
+EMBED_DIMS = {"text-embedding-3-large": 3072, "text-embedding-3-small": 1536, "text-embedding-ada-002": 1536}
+CLAIM_RE = re.compile(r"CLAIM \(JSON\):\n(.*)\n")
+DETERMINISTIC_RE = re.compile(r"DETERMINISTIC CHECK RESULTS \(JSON\):\n(.*)\n")
+PREFIX_BLOCK_CHARS = 512
+MIN_CACHED_CHARS = 4096  # providers cache prefixes of >= ~1024 tokens
+
+
+def create_app(cfg: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="mock-openai")
+    rng = random.Random(cfg.seed)
+    seen_prefixes = set()
+    stats = {"chat": 0, "embeddings": 0, "failures": 0}
+
+    async def delay(latency_ms: float) -> None:
+        ms = latency_ms + rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)
+        if cfg.slow_rate and rng.random() < cfg.slow_rate:
+            ms += cfg.slow_ms
+        if ms > 0:
+            await asyncio.sleep(ms / 1000.0)
+
+    def failure():
+        if cfg.fail_rate and rng.random() < cfg.fail_rate:
+            stats["failures"] += 1
+            return JSONResponse(
+                status_code=cfg.fail_status,
+                content={"error": {"message": "injected failure", "type": "mock_error", "code": None}},
+            )
+        return None
+
+    def cached_chars(text: str) -> int:
+        # Longest previously seen prefix, in whole blocks.
+        cached = 0
+        for end in range(PREFIX_BLOCK_CHARS, len(text) + 1, PREFIX_BLOCK_CHARS):
+            h = hashlib.sha1(text[:end].encode("utf-8")).digest()
+            if h in seen_prefixes:
+                cached = end
+            else:
+                seen_prefixes.add(h)
+        return cached if cached >= MIN_CACHED_CHARS else 0
+
+    def answer(prompt: str) -> str:
+        lines: List[Dict[str, Any]] = []
+        decision = "NEEDS_MORE_INFO"
+        m, d = CLAIM_RE.search(prompt), DETERMINISTIC_RE.search(prompt)
+        if m and d:
+            try:
+                det = json.loads(d.group(1))
+                decision = det.get("decision", decision)
+                for lr in det.get("line_results", []):
+                    lines.append({
+                        "line_id": lr["line_id"],
+                        "status": lr["status"],
+                        "issues": [
+                            {"code": i["code"], "message": i["message"], "rule_ids": i.get("rule_ids", [])}
+                            for i in lr.get("issues", [])
+                        ],
+                        "suggested_fix": "Provide the missing documentation." if lr.get("issues") else None,
+                    })
+            except (ValueError, KeyError):
+                pass
+        return json.dumps({
+            "decision": decision,
+            "summary": "Mock evaluation based on the deterministic checks.",
+            "lines": lines,
+            "missing_info": [],
+            "citations": [{"rule_id": "R-GEN-001", "snippet": "Expenses must be business-related."}],
+        })
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", **stats}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        stats["chat"] += 1
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+        await delay(cfg.chat_latency_ms)
+        failed = failure()
+        if failed is not None:
+            return failed
+
+        content = answer(prompt)
+        usage = {
+            "prompt_tokens": len(prompt) // 4 + 1,
+            "completion_tokens": len(content) // 4 + 1,
+            "total_tokens": (len(prompt) + len(content)) // 4 + 2,
+            "prompt_tokens_details": {"cached_tokens": cached_chars(prompt) // 4},
+        }
+        cid, created, model = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), body.get("model", "mock")
+
+        if not body.get("stream"):
+            return {
+                "id": cid,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        async def events():
+            def chunk(delta, finish=None, with_usage=False):
+                out = {
+                    "id": cid,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }
+                if with_usage:
+                    out["usage"] = usage
+                return f"data: {json.dumps(out)}\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            for i in range(0, len(content), cfg.stream_chunk_chars):
+                if cfg.stream_chunk_ms:
+                    await asyncio.sleep(cfg.stream_chunk_ms / 1000.0)
+                yield chunk({"content": content[i:i + cfg.stream_chunk_chars]})
+            yield chunk({}, finish="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(None, with_usage=True)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        model = body.get("model", "text-embedding-3-large")
+        dim = int(body.get("dimensions") or EMBED_DIMS.get(model, cfg.embed_dim))
+        await delay(cfg.embed_latency_ms)
+        failed = failure()
+        if failed is not None:
+            return failed
+
+        data = []
+        for i, text in enumerate(inputs):
+            seed = int.from_bytes(hashlib.sha1(str(text).encode("utf-8")).digest()[:8], "little")
+            vec = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+            vec /= np.linalg.norm(vec)
+            if body.get("encoding_format") == "base64":
+                emb: Any = base64.b64encode(vec.tobytes()).decode("ascii")
+            else:
+                emb = vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        n_tokens = sum(len(str(t)) // 4 + 1 for t in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": model,
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        }
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--chat-latency-ms", type=float, default=800)
+    parser.add_argument("--embed-latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=3000)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=500, help="status of injected failures (e.g. 429, 500)")
+    parser.add_argument("--stream-chunk-chars", type=int, default=16)
+    parser.add_argument("--stream-chunk-ms", type=float, default=5)
+    parser.add_argument("--embed-dim", type=int, default=3072, help="dimension for unknown embedding models")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    cfg = parse_args(argv)
+    uvicorn.run(create_app(cfg), host=cfg.host, port=cfg.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import datetime as dt
+import json
+import random
+import sys
+from typing import Any, Dict, List, get_args
+
+from app.schemas.claim import Category, Claim, MealType
+
+# Synthetic claims for load tests and benchmarks, generated from the Claim schema
+# (categories and meal types come from its Literal types) and validated with it.
+# Roughly a quarter of lines break a rule (late, missing receipt, over cap, ...).
+#   python -m scripts.synth_claims --n 1000 --seed 1 > claims.ndjson
+
+CATEGORIES: List[str] = list(get_args(Category))
+MEAL_TYPES: List[str] = [m for m in get_args(get_args(MealType)[0])]
+
+AMOUNTS = {
+    "MEALS": (8, 90),
+    "LODGING": (70, 260),
+    "AIRFARE": (90, 900),
+    "RAIL": (15, 180),
+    "TAXI": (8, 70),
+    "PUBLIC_TRANSIT": (2, 15),
+    "MILEAGE": (10, 150),
+    "CLIENT_ENTERTAINMENT": (40, 400),
+    "OFFICE": (5, 300),
+    "TRAINING": (100, 1500),
+    "OTHER": (5, 120),
+}
+VENDORS = {
+    "MEALS": ["Cafe Central", "Trattoria Roma", "Sushi Bar", "Airport Deli"],
+    "LODGING": ["Hotel Sacher", "City Inn", "Harbour Hotel"],
+    "AIRFARE": ["Austrian Airlines", "Lufthansa", "Ryanair"],
+    "RAIL": ["OBB", "Deutsche Bahn", "SBB"],
+    "TAXI": ["Uber", "Taxi 31300", "Bolt"],
+    "PUBLIC_TRANSIT": ["Wiener Linien", "MVG"],
+    "MILEAGE": ["Private car"],
+    "CLIENT_ENTERTAINMENT": ["Steirereck", "Plachutta"],
+    "OFFICE": ["Amazon", "Staples"],
+    "TRAINING": ["PyCon", "Coursera"],
+    "OTHER": ["Misc vendor"],
+}
+CITIES = ["Vienna", "Munich", "Zurich", "Berlin", "Milan", "Prague"]
+
+
+def _line(rng: random.Random, n: int, category: str, day: dt.date, bad: bool) -> Dict[str, Any]:
+    lo, hi = AMOUNTS[category]
+    amount = round(rng.uniform(lo, hi), 2)
+    line: Dict[str, Any] = {
+        "line_id": f"L{n}",
+        "date": day.isoformat(),
+        "category": category,
+        "amount": amount,
+        "currency": "EUR",
+        "vendor": rng.choice(VENDORS[category]),
+        "description": f"{category.replace('_', ' ').lower()} in {rng.choice(CITIES)}",
+        "receipt": {"provided": not (bad and rng.random() < 0.5), "receipt_id": f"R-{rng.randrange(10**6)}"},
+    }
+    if category == "MEALS":
+        line["meal_type"] = rng.choice(MEAL_TYPES)
+        if bad and rng.random() < 0.5:
+            line["amount"] = round(hi * 1.5, 2)
+    if category == "CLIENT_ENTERTAINMENT" and not (bad and rng.random() < 0.5):
+        line["attendees"] = [
+            {"name": "Client Contact", "type": "EXTERNAL", "company": "Client GmbH"},
+            {"name": "Employee", "type": "EMPLOYEE"},
+        ]
+    if category == "MILEAGE":
+        km = round(rng.uniform(20, 350), 1)
+        line["mileage"] = None if bad and rng.random() < 0.3 else {
+            "km": km, "start_location": rng.choice(CITIES), "end_location": rng.choice(CITIES),
+        }
+        line["amount"] = round(km * 0.42, 2)
+    if category in ("LODGING", "TRAINING"):
+        line["preapproval"] = {"provided": not bad, "reference": "PA-1" if not bad else None}
+    return line
+
+
+def generate_claim(rng: random.Random, index: int, max_lines: int = 6) -> Dict[str, Any]:
+    submission = dt.date(2026, 1, 1) + dt.timedelta(days=rng.randrange(120))
+    n_lines = rng.randint(1, max_lines)
+    lines = []
+    for n in range(1, n_lines + 1):
+        bad = rng.random() < 0.25
+        days_before = rng.randint(35, 80) if bad and rng.random() < 0.3 else rng.randint(1, 25)
+        lines.append(_line(rng, n, rng.choice(CATEGORIES), submission - dt.timedelta(days=days_before), bad))
+    claim = {
+        "claim_id": f"C-SYN-{index:07d}",
+        "submission_date": submission.isoformat(),
+        "currency": "EUR",
+        "employee": {
+            "employee_id": f"E-{rng.randrange(5000)}",
+            "name": "Synthetic Employee",
+            "email": "employee@company.com",
+            "department": rng.choice(["Engineering", "Sales", "Finance", "Operations"]),
+            "manager_id": f"M-{rng.randrange(200)}",
+            "country": rng.choice(["AT", "DE", "CH"]),
+        },
+        "trip": {
+            "trip_id": f"T-{rng.randrange(10**5)}",
+            "business_purpose": rng.choice(["Client workshop", "Conference", "Team offsite", "Sales visit"]),
+            "destination_city": rng.choice(CITIES),
+        },
+        "lines": lines,
+    }
+    return Claim.model_validate(claim).model_dump(exclude_none=True)
+
+
+def generate_claims(n: int, seed: int = 0, max_lines: int = 6) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [generate_claim(rng, i, max_lines) for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-lines", type=int, default=6)
+    args = parser.parse_args()
+    for claim in generate_claims(args.n, args.seed, args.max_lines):
+        sys.stdout.write(json.dumps(claim) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import copy
+
+import pytest
+
+from app.rules.batch_engine import evaluate_claims_batch
+from app.rules.rule_engine import evaluate_claim
+from scripts.bench_rule_engine import load_samples, synthetic_claims
+
+
+def _assert_parity(claims):
+    batch = evaluate_claims_batch(claims)
+    assert len(batch) == len(claims)
+    for claim, got in zip(claims, batch):
+        assert got == evaluate_claim(claim), claim["claim_id"]
+
+
+def _line(**fields):
+    ln = {"line_id": "L1", "date": "2024-02-20", "category": "MEALS", "amount": 20.0, "receipt": {"provided": True}}
+    ln.update(fields)
+    return ln
+
+
+def test_parity_on_claim_samples():
+    _assert_parity(load_samples())
+
+
+@pytest.mark.parametrize("seed", [1, 7, 42])
+def test_parity_on_synthetic_claims(seed):
+    _assert_parity(synthetic_claims(500, seed=seed))
+
+
+@pytest.mark.parametrize("line", [
+    _line(category="MILEAGE", amount=10.0, mileage={"km": float("nan")}),
+    _line(category="MILEAGE", amount=10.0, mileage={"km": None}),
+    _line(category="MILEAGE", amount=10.0, mileage={}),
+    _line(category="MILEAGE", amount=4.2, mileage={"km": 10.0}),
+    _line(category="MEALS", amount=45.0),
+    _line(category="MEALS", amount=45.0, meal_type=None),
+    _line(category="MEALS", amount=20.0, meal_type="BREAKFAST"),
+    _line(category="LODGING", amount=200.0, receipt=None),
+    _line(category="CLIENT_ENTERTAINMENT", amount=0.0, attendees=[]),
+])
+def test_parity_on_edge_cases(line):
+    claim = {"claim_id": "EDGE", "submission_date": "2024-03-01", "lines": [line]}
+    _assert_parity([claim])
+
+
+def test_parity_is_independent_of_batch_composition():
+    claims = synthetic_claims(50, seed=3)
+    mixed = claims + [copy.deepcopy(c) for c in load_samples()] + [{"claim_id": "EMPTY", "submission_date": "2024-03-01", "lines": []}]
+    _assert_parity(mixed)